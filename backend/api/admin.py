@@ -3,7 +3,10 @@
 """
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Project, Subscription, CustomBlock, VPSServer
+from .models import (
+    Project, ProjectContent, ProjectRevision, Subscription, CustomBlock, VPSServer, DeployJob, DeployManifest,
+    DeployRelease, ViewLogImport
+)
 
 
 @admin.register(Subscription)
@@ -14,6 +17,20 @@ class SubscriptionAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at']
 
 
+class ProjectContentInline(admin.StackedInline):
+    """Содержимое сайта загружается только на странице проекта, не в списке"""
+    model = ProjectContent
+    can_delete = False
+    fieldsets = (
+        ('Содержимое', {
+            'fields': ('html_content', 'css_content', 'json_content')
+        }),
+        ('Настройки', {
+            'fields': ('header_settings', 'footer_settings')
+        }),
+    )
+
+
 @admin.register(Project)
 class ProjectAdmin(admin.ModelAdmin):
     list_display = [
@@ -34,16 +51,12 @@ class ProjectAdmin(admin.ModelAdmin):
     ]
     search_fields = ['title', 'slug', 'description', 'user__username', 'subdomain', 'deployed_url']
     readonly_fields = ['created_at', 'updated_at', 'views_count']
+    list_select_related = ['user']
+    inlines = [ProjectContentInline]
     fieldsets = (
         ('Основная информация', {
             'fields': ('user', 'title', 'slug', 'description')
         }),
-        ('Содержимое', {
-            'fields': ('html_content', 'css_content', 'json_content')
-        }),
-        ('Настройки', {
-            'fields': ('header_settings', 'footer_settings')
-        }),
         ('Деплой', {
             'fields': (
                 'deploy_type',
@@ -127,7 +140,7 @@ class VPSServerAdmin(admin.ModelAdmin):
             'fields': ('name', 'host', 'port', 'username', 'password', 'password_display')
         }),
         ('Настройки деплоя', {
-            'fields': ('deploy_path', 'domain', 'email')
+            'fields': ('deploy_path', 'domain', 'email', 'upload_transport', 'sftp_channels')
         }),
         ('Конфигурация', {
             'fields': (
@@ -227,3 +240,99 @@ class VPSServerAdmin(admin.ModelAdmin):
         self.message_user(request, f'Флаг "по умолчанию" снят с {updated} сервер(ов).')
     unset_as_default.short_description = 'Снять флаг сервера по умолчанию'
 
+
+
+@admin.register(DeployJob)
+class DeployJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'project', 'deploy_type', 'status_display', 'stage', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status', 'deploy_type', 'created_at']
+    search_fields = ['user__username', 'project__title', 'message']
+    list_select_related = ['user', 'project']
+    exclude = ['params']
+    readonly_fields = [
+        'user', 'project', 'vps_server', 'deploy_type', 'status', 'stage', 'stages',
+        'archive_path', 'message', 'result', 'attempts', 'worker',
+        'created_at', 'started_at', 'heartbeat_at', 'finished_at',
+    ]
+    
+    def status_display(self, obj):
+        """Отображение статуса задачи"""
+        colors = {
+            DeployJob.STATUS_QUEUED: '#999',
+            DeployJob.STATUS_RUNNING: '#2196F3',
+            DeployJob.STATUS_SUCCESS: 'green',
+            DeployJob.STATUS_FAILED: 'red',
+        }
+        return format_html(
+            '<span style="color: {};">{}</span>',
+            colors.get(obj.status, '#999'),
+            obj.get_status_display()
+        )
+    status_display.short_description = 'Статус'
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(DeployManifest)
+class DeployManifestAdmin(admin.ModelAdmin):
+    """Удаление манифеста приводит к полной загрузке сайта при следующем деплое"""
+    list_display = ['target', 'project', 'current_release', 'files_count', 'total_size', 'updated_at']
+    search_fields = ['target', 'project__title']
+    list_select_related = ['project']
+    readonly_fields = [
+        'project', 'vps_server', 'target_key', 'target', 'host', 'port', 'username', 'deploy_path',
+        'current_release', 'files', 'total_size', 'updated_at'
+    ]
+    
+    def files_count(self, obj):
+        """Количество файлов в манифесте"""
+        return len(obj.files)
+    files_count.short_description = 'Файлов'
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(DeployRelease)
+class DeployReleaseAdmin(admin.ModelAdmin):
+    """Релизы на серверах; откат выполняется через API проекта"""
+    list_display = ['release_id', 'manifest', 'is_current_display', 'total_size', 'job', 'created_at']
+    search_fields = ['release_id', 'manifest__target']
+    list_select_related = ['manifest']
+    readonly_fields = ['manifest', 'job', 'release_id', 'files', 'total_size', 'created_at']
+    
+    def is_current_display(self, obj):
+        """Активный релиз"""
+        return obj.is_current
+    is_current_display.short_description = 'Активный'
+    is_current_display.boolean = True
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ViewLogImport)
+class ViewLogImportAdmin(admin.ModelAdmin):
+    """Удаление позиции приводит к повторному учёту строк, ещё оставшихся в логе"""
+    list_display = ['source', 'project', 'views', 'last_time', 'updated_at']
+    search_fields = ['source', 'project__title']
+    list_select_related = ['project']
+    readonly_fields = ['source', 'project', 'last_time', 'last_time_lines', 'views', 'updated_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ProjectRevision)
+class ProjectRevisionAdmin(admin.ModelAdmin):
+    """История содержимого; восстановление выполняется через API проекта, очистка - командой prune_revisions"""
+    list_display = ['project', 'revision', 'reason', 'label', 'author', 'size', 'created_at']
+    list_filter = ['reason', 'created_at']
+    search_fields = ['project__title', 'label', 'author__username']
+    list_select_related = ['project', 'author']
+    readonly_fields = ['project', 'revision', 'reason', 'author', 'manifest', 'size', 'created_at']
+    fields = ['project', 'revision', 'reason', 'label', 'author', 'size', 'created_at', 'manifest']
+    
+    def has_add_permission(self, request):
+        return False
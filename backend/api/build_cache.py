@@ -0,0 +1,89 @@
+"""
+Ограничение дисковых кешей сборки (build_cache/sites, build_cache/images) по размеру.
+Запись кеша - директория <root>/<xx>/<ключ>/, mtime которой обновляется при каждом попадании:
+при превышении бюджета удаляются записи, которые дольше всего не использовались.
+"""
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import List, Tuple
+
+
+PRUNE_INTERVAL = 60  # Секунд между проверками размера кеша после записи в одном процессе
+IN_USE_GRACE = 600  # Записи, использованные за это время, не удаляются: их могут читать прямо сейчас
+
+
+def touch(path: Path) -> None:
+    """Отмечает использование записи кеша"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _entry_size(path: Path) -> int:
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def _remove(path: Path) -> bool:
+    """Переименование перед удалением: читатели не видят наполовину удалённую запись"""
+    trash = path.parent / f'.tmp-{uuid.uuid4().hex}'
+    try:
+        os.rename(path, trash)
+    except OSError:  # Запись уже удалил другой процесс
+        return False
+    shutil.rmtree(trash, ignore_errors=True)
+    return True
+
+
+def prune_cache(root: Path, max_bytes: int, dry_run: bool = False) -> Tuple[int, int]:
+    """
+    Удаляет давно не использованные записи, пока кеш больше max_bytes (0 - без ограничения),
+    и брошенные временные директории прерванных записей. Возвращает (записей удалено, байт освобождено).
+    """
+    root = Path(root)
+    if not root.is_dir():
+        return 0, 0
+
+    deadline = time.time() - IN_USE_GRACE
+    entries: List[Tuple[float, int, Path]] = []
+    stale_temp: List[Path] = []
+    for shard in root.iterdir():
+        if shard.name.startswith('.') or not shard.is_dir():
+            continue
+        for entry in shard.iterdir():
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            if entry.name.startswith('.tmp-'):
+                if mtime < deadline:
+                    stale_temp.append(entry)
+            elif entry.is_dir():
+                entries.append((mtime, _entry_size(entry), entry))
+
+    removed = freed = 0
+    for path in stale_temp:
+        if not dry_run:
+            shutil.rmtree(path, ignore_errors=True)
+
+    total = sum(size for _, size, _ in entries)
+    if not max_bytes:
+        return removed, freed
+    for mtime, size, path in sorted(entries, key=lambda entry: entry[0]):
+        if total <= max_bytes or mtime >= deadline:
+            break
+        if dry_run or _remove(path):
+            removed += 1
+            freed += size
+        total -= size
+    return removed, freed
@@ -0,0 +1,564 @@
+"""
+Очередь задач деплоя на базе БД и пул воркеров, выполняющий их вне HTTP-запроса
+"""
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .models import DeployJob, DeployManifest, DeployRelease, Project, VPSServer
+from .site_builder import get_site_builder
+from .ssh_pool import SSHTarget, get_ssh_pool
+
+
+SENSITIVE_PARAMS = ('password',)
+
+
+def save_job_archive(uploaded_file) -> str:
+    """Сохраняет загруженный ZIP архив в каталог очереди, доступный воркеру"""
+    jobs_root = Path(settings.DEPLOY_JOBS_ROOT)
+    jobs_root.mkdir(parents=True, exist_ok=True)
+
+    archive_path = jobs_root / f"{uuid.uuid4().hex}.zip"
+    with open(archive_path, 'wb') as archive:
+        for chunk in uploaded_file.chunks():
+            archive.write(chunk)
+
+    return str(archive_path)
+
+
+def copy_job_archive(source: Path) -> str:
+    """Копирует собранный на сервере архив в каталог очереди: воркер удаляет архив задачи после деплоя"""
+    jobs_root = Path(settings.DEPLOY_JOBS_ROOT)
+    jobs_root.mkdir(parents=True, exist_ok=True)
+
+    archive_path = jobs_root / f"{uuid.uuid4().hex}.zip"
+    try:
+        os.link(source, archive_path)
+    except OSError:  # Кеш сборок и очередь на разных файловых системах
+        shutil.copyfile(source, archive_path)
+    return str(archive_path)
+
+
+def enqueue_deploy(user, validated_data: Dict[str, Any]) -> DeployJob:
+    """Создаёт задачу деплоя в очереди. Бросает ValidationError, если деплой невозможен"""
+    deploy_type = validated_data.get('deploy_type', 'vps')
+
+    project = None
+    project_id = validated_data.get('project_id')
+    if project_id:
+        project = Project.objects.with_content().filter(id=project_id, user=user).first()
+
+    vps_server = None
+    if deploy_type == 'builder_vps':
+        vps_server = VPSServer.objects.filter(is_active=True).order_by('-is_default', 'id').first()
+        if not vps_server:
+            raise ValidationError('Не найден активный VPS сервер в настройках. Настройте сервер в админ-панели.')
+
+        if project:
+            deploy_path = f"{vps_server.deploy_path}/{project.slug or f'project-{project.id}'}"
+        else:
+            deploy_path = f"{vps_server.deploy_path}/project-{user.id}-{int(timezone.now().timestamp())}"
+        params = {'deploy_path': deploy_path}
+    else:
+        params = {
+            'host': validated_data['host'],
+            'port': validated_data.get('port', 22),
+            'username': validated_data['username'],
+            'password': validated_data['password'],
+            'deploy_path': validated_data['deploy_path'],
+            'domain': validated_data.get('domain') or '',
+            'email': validated_data.get('email') or '',
+            'nginx_config': validated_data.get('nginx_config', False),
+            'enable_ssl': validated_data.get('enable_ssl', False),
+        }
+
+    params['optimize'] = validated_data.get('optimize', True)
+
+    if validated_data.get('site_zip'):
+        archive_path = save_job_archive(validated_data['site_zip'])
+    elif project:
+        archive_path = copy_job_archive(get_site_builder().build(project).zip_path)
+    else:
+        raise ValidationError('Проект не найден: нужен ZIP архив сайта или ID своего проекта')
+
+    return DeployJob.objects.create(
+        user=user,
+        project=project,
+        vps_server=vps_server,
+        deploy_type=deploy_type,
+        params=params,
+        archive_path=archive_path,
+    )
+
+
+def claim_next_job(worker_id: str) -> Optional[DeployJob]:
+    """Атомарно забирает самую старую задачу из очереди"""
+    with transaction.atomic():
+        job = (
+            DeployJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=DeployJob.STATUS_QUEUED)
+            .order_by('created_at', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+
+        now = timezone.now()
+        # Условное обновление защищает от двойного захвата на БД без SELECT ... FOR UPDATE (SQLite)
+        claimed = DeployJob.objects.filter(pk=job.pk, status=DeployJob.STATUS_QUEUED).update(
+            status=DeployJob.STATUS_RUNNING,
+            worker=worker_id,
+            attempts=job.attempts + 1,
+            started_at=now,
+            heartbeat_at=now,
+        )
+        if not claimed:
+            return None
+
+    job.refresh_from_db()
+    return job
+
+
+def requeue_stale_jobs() -> int:
+    """Возвращает в очередь задачи, воркер которых перестал отвечать (или завершает их по лимиту попыток)"""
+    deadline = timezone.now() - timedelta(seconds=settings.DEPLOY_JOB_STALE_TIMEOUT)
+    stale = DeployJob.objects.filter(status=DeployJob.STATUS_RUNNING, heartbeat_at__lt=deadline)
+
+    count = 0
+    for job in stale:
+        # Пульс мог обновиться после выборки: задачу забираем, только если она всё ещё молчит.
+        # Сброс воркера отнимает задачу у зависшего запуска - его дальнейшие записи не пройдут
+        still_stale = job.claimed().filter(heartbeat_at__lt=deadline)
+        if job.attempts >= settings.DEPLOY_JOB_MAX_ATTEMPTS:
+            if not still_stale.update(worker=''):
+                continue
+            job.worker = ''
+            _finish_job(job, False, 'Воркер деплоя перестал отвечать, задача прервана')
+        elif not still_stale.update(status=DeployJob.STATUS_QUEUED, worker=''):
+            continue
+        count += 1
+    return count
+
+
+def _heartbeat(job: DeployJob, done: threading.Event) -> None:
+    """
+    Обновляет heartbeat_at выполняющейся задачи, пока этап (загрузка по SFTP, certbot) идёт дольше
+    DEPLOY_JOB_STALE_TIMEOUT: иначе восстановление вернёт живую задачу в очередь
+    """
+    interval = settings.DEPLOY_JOB_STALE_TIMEOUT / 3
+    try:
+        while not done.wait(interval):
+            if not job.claimed().update(heartbeat_at=timezone.now()):
+                break
+    finally:
+        close_old_connections()
+
+
+def _finish_job(job: DeployJob, success: bool, message: str, result: Optional[Dict[str, Any]] = None) -> None:
+    """Завершает задачу, стирает секреты и удаляет архив. Бросает DeployJob.Lost, если задачу забрал другой запуск"""
+    job.status = DeployJob.STATUS_SUCCESS if success else DeployJob.STATUS_FAILED
+    job.message = message
+    job.result = result or {}
+    job.finished_at = timezone.now()
+    job.heartbeat_at = job.finished_at
+    job.params = {k: v for k, v in job.params.items() if k not in SENSITIVE_PARAMS}
+    job.save_progress('status', 'message', 'result', 'finished_at', 'heartbeat_at', 'params')
+
+    try:
+        if job.archive_path and os.path.exists(job.archive_path):
+            os.unlink(job.archive_path)
+    except OSError:
+        pass
+
+
+def _fail_stage(job: DeployJob, message: str) -> None:
+    """Отмечает текущий этап как проваленный и завершает задачу"""
+    if job.stage:
+        job.finish_stage(job.stage, success=False, message=message)
+    _finish_job(job, False, message)
+
+
+def _check_connection(target: SSHTarget) -> None:
+    """Берёт подключение из пула (устанавливая его при необходимости), чтобы ошибки SSH относились к этапу connect"""
+    with get_ssh_pool().connection(target):
+        pass
+
+
+def _upload_stage(
+    job: DeployJob,
+    target: SSHTarget,
+    deploy_path: str,
+    username: str,
+    transport: str = 'sftp',
+    sftp_channels: Optional[int] = None,
+    vps_server: Optional[VPSServer] = None
+) -> Tuple[bool, str, Dict[str, Any]]:
+    """Этап upload: новый релиз с дельта-загрузкой относительно манифеста активного релиза в этом пути"""
+    from .deploy_utils import DEFAULT_SFTP_CHANNELS, deploy_files
+    from .site_build import deploy_stages
+
+    target_name = DeployManifest.make_target(target.host, target.port, target.username, deploy_path)
+    target_key = DeployManifest.make_key(target_name)
+    previous = DeployManifest.objects.filter(target_key=target_key).values_list('files', flat=True).first()
+
+    job.start_stage('upload')
+    success, message, report = deploy_files(
+        target=target,
+        zip_path=job.archive_path,
+        deploy_path=deploy_path,
+        username=username,
+        timeout=30,
+        previous_manifest=previous,
+        transport=transport,
+        sftp_channels=sftp_channels or DEFAULT_SFTP_CHANNELS,
+        keep_releases=settings.DEPLOY_KEEP_RELEASES,
+        build_stages=deploy_stages(job.params.get('optimize', True))
+    )
+    manifest = report.pop('manifest', None)
+    job.finish_stage('upload', success, message, details=report)
+
+    if success and manifest is not None:
+        release = report['release']
+        total_size = sum(entry['size'] for entry in manifest.values())
+        deploy_manifest, _ = DeployManifest.objects.update_or_create(
+            target_key=target_key,
+            defaults={
+                'target': target_name,
+                'project_id': job.project_id,
+                'vps_server': vps_server,
+                'host': target.host,
+                'port': target.port,
+                'username': target.username,
+                'deploy_path': deploy_path,
+                'current_release': release['id'],
+                'files': manifest,
+                'total_size': total_size,
+            }
+        )
+        DeployRelease.objects.create(
+            manifest=deploy_manifest,
+            job=job,
+            release_id=release['id'],
+            files=manifest,
+            total_size=total_size,
+        )
+        if release['pruned']:
+            deploy_manifest.releases.filter(release_id__in=release['pruned']).delete()
+
+    return success, message, report.get('transfer', {})
+
+
+def rollback_to_release(
+    deploy_manifest: DeployManifest,
+    release: DeployRelease,
+    password: Optional[str] = None
+) -> Tuple[bool, str]:
+    """
+    Откат: переключает current на релиз, уже загруженный на сервер, и делает его манифест базой
+    для следующего дельта-деплоя. Для своего VPS пароль не хранится и передаётся в запросе.
+    """
+    from .deploy_utils import rollback_release
+
+    if deploy_manifest.vps_server:
+        target = SSHTarget.from_server(deploy_manifest.vps_server)
+    elif password:
+        target = SSHTarget(
+            host=deploy_manifest.host,
+            port=deploy_manifest.port,
+            username=deploy_manifest.username,
+            password=password,
+        )
+    else:
+        raise ValidationError('Для отката на своём VPS нужен SSH пароль')
+
+    success, message = rollback_release(target, deploy_manifest.deploy_path, release.release_id)
+    if success:
+        deploy_manifest.current_release = release.release_id
+        deploy_manifest.files = release.files
+        deploy_manifest.total_size = release.total_size
+        deploy_manifest.save(update_fields=['current_release', 'files', 'total_size', 'updated_at'])
+    return success, message
+
+
+def _save_deploy_info(job: DeployJob, url: str) -> None:
+    """Сохраняет информацию о деплое в проекте"""
+    if not job.project_id:
+        print("⚠️ project_id не указан, информация о деплое не будет сохранена")
+        return
+
+    Project.objects.filter(pk=job.project_id).update(
+        deploy_type=job.deploy_type,
+        deployed_url=url,
+        deployed_at=timezone.now(),
+    )
+    print(f"✅ Информация о деплое сохранена для проекта {job.project_id}: {url}")
+
+
+def _deploy_to_builder_vps(job: DeployJob) -> Tuple[bool, str, Dict[str, Any]]:
+    """Деплой на VPS сервер конструктора: настройки берутся из админки"""
+    from .deploy_utils import (
+        deploy_nginx_config,
+        obtain_ssl_certificate
+    )
+
+    vps_server = job.vps_server
+    if not vps_server:
+        return False, 'VPS сервер конструктора был удалён из настроек', {}
+
+    deploy_path = job.params['deploy_path']
+    target = SSHTarget.from_server(vps_server)
+
+    job.start_stage('connect')
+    _check_connection(target)
+    job.finish_stage('connect')
+
+    success, message, transfer = _upload_stage(
+        job, target, deploy_path, vps_server.username,
+        transport=vps_server.upload_transport,
+        sftp_channels=vps_server.sftp_channels,
+        vps_server=vps_server
+    )
+    if not success:
+        return False, message, {}
+
+    ssl_success = True
+    enable_ssl = vps_server.ssl_enabled
+    if enable_ssl and vps_server.domain and vps_server.email:
+        job.start_stage('ssl')
+        ssl_success, ssl_message = obtain_ssl_certificate(
+            target=target,
+            domain=vps_server.domain,
+            email=vps_server.email,
+            timeout=120
+        )
+        job.finish_stage('ssl', ssl_success, ssl_message)
+
+    nginx_success = True
+    nginx_message = ""
+    if vps_server.nginx_config_enabled:
+        job.start_stage('nginx')
+        domain = vps_server.domain or vps_server.host
+        use_ssl = enable_ssl and ssl_success
+        nginx_success, nginx_message = deploy_nginx_config(
+            target=target,
+            domain=domain,
+            deploy_path=deploy_path,
+            username=vps_server.username,
+            use_ssl=use_ssl,
+            timeout=30
+        )
+        job.finish_stage('nginx', nginx_success, nginx_message)
+
+    protocol = 'https' if (enable_ssl and ssl_success) else 'http'
+    if vps_server.domain:
+        url = f"{protocol}://{vps_server.domain}"
+    else:
+        url = f"{protocol}://{vps_server.host}"
+
+    job.start_stage('finalize')
+    _save_deploy_info(job, url)
+    job.finish_stage('finalize')
+
+    final_message = f"✅ Сайт успешно задеплоен на VPS сервер конструктора ({vps_server.name})"
+    if nginx_success:
+        final_message += f"\n\n✅ Nginx настроен. Сайт доступен по адресу: {url}"
+    else:
+        final_message += f"\n\n⚠️ {nginx_message}"
+
+    return True, final_message, {
+        'url': url,
+        'deploy_type': 'builder_vps',
+        'vps_server': vps_server.name,
+        'transfer': transfer,
+    }
+
+
+def _deploy_to_own_vps(job: DeployJob) -> Tuple[bool, str, Dict[str, Any]]:
+    """Деплой на свой VPS: параметры подключения переданы пользователем"""
+    from .deploy_utils import (
+        deploy_nginx_config,
+        obtain_ssl_certificate
+    )
+
+    params = job.params
+    deploy_path = params['deploy_path']
+    target = SSHTarget(
+        host=params['host'],
+        port=params.get('port', 22),
+        username=params['username'],
+        password=params['password'],
+    )
+
+    job.start_stage('connect')
+    _check_connection(target)
+    job.finish_stage('connect')
+
+    success, message, transfer = _upload_stage(job, target, deploy_path, params['username'])
+    if not success:
+        return False, message, {}
+
+    ssl_success = True
+    ssl_message = ""
+    enable_ssl = params.get('enable_ssl', False)
+    if enable_ssl:
+        domain_for_ssl = params.get('domain')
+        email = params.get('email')
+        if domain_for_ssl and email:
+            job.start_stage('ssl')
+            ssl_success, ssl_message = obtain_ssl_certificate(
+                target=target,
+                domain=domain_for_ssl,
+                email=email,
+                timeout=120
+            )
+            job.finish_stage('ssl', ssl_success, ssl_message)
+
+    nginx_success = True
+    nginx_message = ""
+    if params.get('nginx_config', False):
+        job.start_stage('nginx')
+        domain = params.get('domain') or params['host']
+        use_ssl = enable_ssl and ssl_success
+        nginx_success, nginx_message = deploy_nginx_config(
+            target=target,
+            domain=domain,
+            deploy_path=deploy_path,
+            username=params['username'],
+            use_ssl=use_ssl,
+            timeout=30
+        )
+        job.finish_stage('nginx', nginx_success, nginx_message)
+
+    domain = params.get('domain')
+    protocol = 'https' if (enable_ssl and ssl_success) else 'http'
+    if domain:
+        url = f"{protocol}://{domain}"
+    else:
+        url = f"{protocol}://{params['host']}"
+
+    final_message = message
+
+    if enable_ssl:
+        if ssl_success:
+            final_message += f"\n\n✅ {ssl_message}"
+        else:
+            final_message += f"\n\n⚠️ SSL сертификат не получен: {ssl_message}"
+
+    if not params.get('nginx_config', False):
+        final_message += f"\n\n⚠️ Внимание: Nginx не настроен. Файлы загружены в {deploy_path}, но сайт не будет доступен без веб-сервера.\n\nДля запуска сайта:\n1. Настройте Nginx или другой веб-сервер\n2. Или используйте простой HTTP-сервер: cd {deploy_path} && python3 -m http.server 8000"
+    elif not nginx_success:
+        final_message += f"\n\n⚠️ Nginx конфиг создан, но не применён: {nginx_message}\n\nПроверьте:\n1. Запущен ли Nginx: sudo systemctl status nginx\n2. Проверьте конфиг: sudo nginx -t\n3. Перезагрузите Nginx: sudo systemctl reload nginx\n4. Проверьте логи: sudo tail -f /var/log/nginx/error.log"
+    else:
+        final_message += f"\n\n✅ Nginx настроен и перезагружен. Сайт должен быть доступен по адресу: {url}\n\nЕсли сайт не открывается, проверьте:\n1. Открыт ли порт 80 (или 443 для HTTPS) в firewall\n2. Правильно ли указан домен/IP в Nginx конфиге\n3. Логи Nginx: sudo tail -f /var/log/nginx/error.log"
+
+    job.start_stage('finalize')
+    _save_deploy_info(job, url)
+    job.finish_stage('finalize')
+
+    result = {
+        'url': url,
+        'deploy_path': deploy_path,
+        'deploy_type': 'vps',
+        'transfer': transfer,
+    }
+
+    if enable_ssl:
+        result['ssl'] = {
+            'success': ssl_success,
+            'message': ssl_message
+        }
+
+    if params.get('nginx_config', False):
+        result['nginx'] = {
+            'success': nginx_success,
+            'message': nginx_message
+        }
+
+    return True, final_message, result
+
+
+def run_deploy_job(job: DeployJob) -> None:
+    """Выполняет задачу деплоя по этапам, фиксируя прогресс в БД"""
+    done = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job, done), name=f'deploy-heartbeat-{job.pk}', daemon=True)
+    heartbeat.start()
+    try:
+        try:
+            if job.deploy_type == 'builder_vps':
+                success, message, result = _deploy_to_builder_vps(job)
+            else:
+                success, message, result = _deploy_to_own_vps(job)
+
+            if success:
+                _finish_job(job, True, message, result)
+            else:
+                _fail_stage(job, message)
+        except DeployJob.Lost:
+            raise
+        except ValidationError as e:
+            _fail_stage(job, ' '.join(e.messages))
+        except Exception as e:
+            _fail_stage(job, f'Ошибка деплоя: {str(e)}')
+    except DeployJob.Lost as e:
+        print(f"⚠️ {e}: результат этого запуска отброшен")
+    finally:
+        done.set()
+        heartbeat.join()
+
+
+class DeployWorkerPool:
+    """Пул потоков, забирающий задачи деплоя из очереди в БД"""
+
+    def __init__(self, concurrency: int = 4, poll_interval: float = 1.0, worker_name: Optional[str] = None):
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.worker_name = worker_name or f"{socket.gethostname()}:{os.getpid()}"
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self, job: DeployJob) -> None:
+        try:
+            run_deploy_job(job)
+        finally:
+            close_old_connections()
+            self._slots.release()
+
+    def serve_forever(self, once: bool = False) -> None:
+        """Основной цикл: ждёт свободный слот, забирает задачу и отдаёт её потоку пула"""
+        last_recovery = 0.0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='deploy') as executor:
+            while not self._stop.is_set():
+                if time.monotonic() - last_recovery > settings.DEPLOY_JOB_STALE_TIMEOUT / 2:
+                    requeue_stale_jobs()
+                    last_recovery = time.monotonic()
+                get_ssh_pool().evict_idle()
+
+                if not self._slots.acquire(timeout=self.poll_interval):
+                    continue
+
+                close_old_connections()
+                job = claim_next_job(self.worker_name)
+                if job is None:
+                    self._slots.release()
+                    if once:
+                        break
+                    self._stop.wait(self.poll_interval)
+                    continue
+
+                executor.submit(self._run, job)
+
+        get_ssh_pool().close_all()
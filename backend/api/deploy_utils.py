@@ -2,13 +2,40 @@
 Утилиты для безопасного деплоя на VPS через SSH
 """
 import os
+import queue
+import shlex
+import tarfile
 import tempfile
+import threading
+import time
+import uuid
 import zipfile
 import re
 from pathlib import Path
-from typing import Tuple, Optional
+from typing import Any, Dict, List, Tuple, Optional
 import paramiko
 from django.core.exceptions import ValidationError
+from .remote_exec import RemoteScript
+from .site_build import BuildStage, run_stages
+from .site_fingerprint import FINGERPRINT_EXTENSIONS, FINGERPRINT_LENGTH, original_path
+from .site_bundle import BundleFile, SiteBundle, copy_stream, diff_manifests
+from .ssh_pool import SSHTarget, get_ssh_pool
+
+
+# Способы загрузки файлов сайта на сервер (VPSServer.upload_transport)
+UPLOAD_TRANSPORT_SFTP = 'sftp'  # Файлы через параллельные SFTP каналы, проверка размеров через stat
+UPLOAD_TRANSPORT_TAR = 'tar'  # Один поток tar в `tar -x` на сервере, проверка контрольных сумм через sha256sum
+UPLOAD_TRANSPORTS = (UPLOAD_TRANSPORT_SFTP, UPLOAD_TRANSPORT_TAR)
+
+DEFAULT_SFTP_CHANNELS = 4  # Параллельных SFTP каналов в одном SSH подключении (VPSServer.sftp_channels)
+MAX_SFTP_CHANNELS = 8  # sshd по умолчанию разрешает 10 сессий на подключение (MaxSessions)
+SFTP_UPLOAD_RETRIES = 2  # Повторных попыток загрузки файла после ошибки
+
+# Релизы: файлы загружаются в deploy_path/releases/<id>, сайт обслуживается через симлинк deploy_path/current
+RELEASES_DIR = 'releases'
+CURRENT_LINK = 'current'
+DEFAULT_KEEP_RELEASES = 5
+RELEASE_ID_PATTERN = r'^[0-9A-Za-z_-]{1,64}$'
 
 
 def safe_decode(data: bytes, default: str = '') -> str:
@@ -105,229 +132,496 @@ def create_ssh_client(
 
 
 def deploy_files(
-    ssh: paramiko.SSHClient,
+    target: SSHTarget,
     zip_path: str,
     deploy_path: str,
     username: str,
-    timeout: int = 30
-) -> Tuple[bool, str]:
-    """Распаковывает ZIP архив и загружает файлы (index.html, styles.css, images) на VPS через SFTP, устанавливает права доступа"""
+    timeout: int = 30,
+    previous_manifest: Optional[Dict[str, Dict[str, Any]]] = None,
+    transport: str = UPLOAD_TRANSPORT_SFTP,
+    sftp_channels: int = DEFAULT_SFTP_CHANNELS,
+    release_id: Optional[str] = None,
+    keep_releases: int = DEFAULT_KEEP_RELEASES,
+    build_stages: Optional[List[BuildStage]] = None
+) -> Tuple[bool, str, Dict[str, Any]]:
+    """
+    Загружает файлы сайта (index.html, styles.css, images) из ZIP архива на VPS через SFTP, устанавливает права доступа.
+    Файлы читаются из архива потоком без распаковки на диск (api.site_bundle).
+    Подготовка, права и проверки выполняются двумя пакетными скриптами (api.remote_exec),
+    третий элемент результата - отчёт с результатами каждого шага.
+    
+    С previous_manifest (манифест прошлого деплоя в этот путь) загружаются только новые и изменённые
+    файлы, удалённые из сайта файлы удаляются с сервера. Отчёт содержит новый манифест ('manifest')
+    и сводку переданных и пропущенных файлов и байт ('transfer').
+    
+    transport='tar' передаёт все изменённые файлы одним tar потоком в одном SSH канале
+    и проверяет результат одним списком контрольных сумм вместо размеров.
+    transport='sftp' загружает файлы параллельно через sftp_channels SFTP каналов одного подключения.
+    
+    Файлы загружаются в новый релиз deploy_path/releases/<release_id>: при известном манифесте он
+    заполняется жёсткими ссылками на файлы текущего релиза, изменённые файлы перед загрузкой удаляются,
+    чтобы не изменить прошлый релиз. После проверки симлинк deploy_path/current атомарно переключается
+    на новый релиз, остаются keep_releases последних релизов. Отчёт содержит сведения о релизе ('release').
+    
+    Перед загрузкой файлы проходят стадии сборки build_stages (по умолчанию api.site_build.DEPLOY_STAGES,
+    [] - без обработки), их отчёты - в 'build'.
+    """
     validate_deploy_path(deploy_path)
+    if transport not in UPLOAD_TRANSPORTS:
+        raise ValidationError(f"Неизвестный способ загрузки: {transport}")
+    release_id = release_id or make_release_id()
+    validate_release_id(release_id)
     
-    sftp = None
-    try:
-        extract_dir = tempfile.mkdtemp()
-        
+    with get_ssh_pool().connection(target) as ssh:
+        return _deploy_files(
+            ssh, zip_path, deploy_path, username, timeout, previous_manifest, transport, sftp_channels,
+            release_id, keep_releases, build_stages
+        )
+
+
+def make_release_id() -> str:
+    """ID релиза: время UTC и случайный суффикс, сортировка по строке совпадает с порядком релизов"""
+    return f"{time.strftime('%Y%m%d%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:6]}"
+
+
+def validate_release_id(release_id: str) -> None:
+    if not re.match(RELEASE_ID_PATTERN, release_id or ''):
+        raise ValidationError(f"Некорректный ID релиза: {release_id}")
+
+
+def release_path(deploy_path: str, release_id: str) -> str:
+    return f"{deploy_path}/{RELEASES_DIR}/{release_id}"
+
+
+def current_release_path(deploy_path: str) -> str:
+    """Путь, который обслуживает веб-сервер: симлинк на активный релиз"""
+    return f"{deploy_path}/{CURRENT_LINK}"
+
+
+def activate_release_command(deploy_path: str, release_id: str) -> str:
+    """
+    Атомарное переключение current на релиз: новый симлинк создаётся рядом и переименовывается
+    поверх старого (rename(2)), поэтому запросы всегда видят либо старый, либо новый релиз целиком
+    """
+    link = shlex.quote(current_release_path(deploy_path))
+    temp_link = shlex.quote(f"{deploy_path}/.{CURRENT_LINK}-{release_id}")
+    relative_target = shlex.quote(f"{RELEASES_DIR}/{release_id}")
+    index = shlex.quote(f"{release_path(deploy_path, release_id)}/index.html")
+    return f"test -f {index} && ln -sfn {relative_target} {temp_link} && mv -Tf {temp_link} {link}"
+
+
+def prune_releases_command(deploy_path: str, keep: int) -> str:
+    """Удаляет релизы старше keep последних, кроме активного; выводит ID удалённых релизов"""
+    releases = shlex.quote(f"{deploy_path}/{RELEASES_DIR}")
+    link = shlex.quote(current_release_path(deploy_path))
+    return (
+        f'active=$(basename "$(readlink {link})"); cd {releases} && '
+        f'ls -1 | sort -r | tail -n +{max(keep, 1) + 1} | grep -vxF "$active" | '
+        f'while IFS= read -r release; do rm -rf -- "$release" && echo "$release"; done; true'
+    )
+
+
+def rollback_release(target: SSHTarget, deploy_path: str, release_id: str, timeout: int = 30) -> Tuple[bool, str]:
+    """Переключает current на ранее загруженный релиз одной командой, без повторной загрузки файлов"""
+    validate_deploy_path(deploy_path)
+    validate_release_id(release_id)
+    
+    script = RemoteScript()
+    script.add("переключение релиза", activate_release_command(deploy_path, release_id), sudo=True)
+    with get_ssh_pool().connection(target) as ssh:
+        result = script.run(ssh, timeout=timeout)
+    
+    if not result.ok:
+        return False, f"Не удалось переключиться на релиз {release_id} (релиз не найден на сервере?): {result.error_message()}"
+    return True, f"Сайт переключён на релиз {release_id}"
+
+
+def upload_bundle_file(sftp: paramiko.SFTPClient, bundle_file: BundleFile, remote_path: str) -> int:
+    """Потоково копирует файл из архива в удалённый файл блоками CHUNK_SIZE"""
+    with bundle_file.open() as source, sftp.open(remote_path, 'wb') as destination:
+        destination.set_pipelined(True)
+        return copy_stream(source, destination)
+
+
+def upload_bundle_parallel(
+    ssh: paramiko.SSHClient,
+    files: List[BundleFile],
+    deploy_path: str,
+    channels: int = DEFAULT_SFTP_CHANNELS,
+    retries: int = SFTP_UPLOAD_RETRIES
+) -> Dict[str, Any]:
+    """
+    Загружает файлы через несколько SFTP каналов одного SSH подключения.
+    Файлы раздаются каналам из общей очереди от больших к меньшим, поэтому крупные файлы
+    не достаются одному каналу в конце. Ошибка загрузки файла не прерывает остальные:
+    канал переоткрывается, файл возвращается в очередь (до retries повторов).
+    Возвращает статистику: каналы, байты, время, пропускная способность, повторы и ошибки по файлам.
+    """
+    channels = max(1, min(channels, MAX_SFTP_CHANNELS, len(files) or 1))
+    pending: queue.Queue = queue.Queue()
+    for bundle_file in sorted(files, key=lambda f: f.size, reverse=True):
+        pending.put((bundle_file, 0))
+    
+    lock = threading.Lock()
+    stats: Dict[str, Any] = {'channels': 0, 'files': 0, 'bytes': 0, 'retries': 0, 'failed': {}}
+    
+    def worker() -> None:
+        sftp = None
+        counted = False
         try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_dir)
+            while True:
+                try:
+                    bundle_file, attempt = pending.get_nowait()
+                except queue.Empty:
+                    return
+                
+                if sftp is None:
+                    try:
+                        sftp = ssh.open_sftp()
+                    except Exception:
+                        # Лимит сессий на сервере: файл забирают каналы, которые удалось открыть
+                        pending.put((bundle_file, attempt))
+                        return
+                    if not counted:
+                        counted = True
+                        with lock:
+                            stats['channels'] += 1
+                
+                try:
+                    size = upload_bundle_file(sftp, bundle_file, f"{deploy_path}/{bundle_file.path}")
+                except Exception as e:
+                    try:
+                        sftp.close()
+                    except Exception:
+                        pass
+                    sftp = None
+                    with lock:
+                        if attempt < retries:
+                            stats['retries'] += 1
+                            pending.put((bundle_file, attempt + 1))
+                        else:
+                            stats['failed'][bundle_file.path] = str(e) or e.__class__.__name__
+                    continue
+                
+                with lock:
+                    stats['files'] += 1
+                    stats['bytes'] += size
+        finally:
+            if sftp is not None:
+                sftp.close()
+    
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(channels - 1)]
+    for thread in threads:
+        thread.start()
+    worker()
+    for thread in threads:
+        thread.join()
+    stats['seconds'] = round(time.monotonic() - started, 3)
+    
+    # Файлы, оставшиеся в очереди, когда не удалось открыть ни одного канала
+    while not pending.empty():
+        bundle_file, _ = pending.get_nowait()
+        stats['failed'][bundle_file.path] = "не удалось открыть SFTP канал"
+    
+    stats['bytes_per_second'] = int(stats['bytes'] / stats['seconds']) if stats['seconds'] else 0
+    return stats
+
+
+def upload_bundle_tar(ssh: paramiko.SSHClient, files: List[BundleFile], deploy_path: str, timeout: int = 120) -> int:
+    """
+    Передаёт файлы одним потоком tar в `tar -x` на сервере через один SSH канал.
+    Архив собирается на лету из потоков файлов, ничего не пишется на диск. Возвращает количество байт.
+    """
+    if not files:
+        return 0
+    
+    command = f"tar -x -m -f - --no-same-owner -C {shlex.quote(deploy_path)}"
+    stdin, stdout, stderr = ssh.exec_command(command, timeout=timeout)
+    try:
+        with tarfile.open(fileobj=stdin, mode='w|') as archive:
+            for bundle_file in files:
+                info = tarfile.TarInfo(bundle_file.path)
+                info.size = bundle_file.size
+                info.mode = 0o644
+                with bundle_file.open() as source:
+                    archive.addfile(info, source)
+    except Exception as e:
+        # Если tar на сервере завершился раньше, его stderr объясняет ошибку записи в канал
+        stdin.channel.close()
+        error = safe_decode(stderr.read()).strip()
+        raise RuntimeError(f"Ошибка передачи tar потока: {error or e}")
+    stdin.close()
+    
+    error = safe_decode(stderr.read()).strip()
+    exit_status = stdout.channel.recv_exit_status()
+    if exit_status != 0:
+        raise RuntimeError(f"tar на сервере завершился с кодом {exit_status}: {error}")
+    return sum(bundle_file.size for bundle_file in files)
+
+
+def remote_listing_command(deploy_path: str, files: List[BundleFile], checksum: bool) -> str:
+    """Одна команда, выводящая sha256 (или размер) каждого файла сайта; отсутствующие файлы пропускаются"""
+    paths = ' '.join(shlex.quote(f.path) for f in files)
+    listing = f"sha256sum -- {paths}" if checksum else f"stat -c '%s %n' -- {paths}"
+    return f"cd {shlex.quote(deploy_path)} && {listing} 2>/dev/null || true"
+
+
+def parse_remote_listing(output: str, checksum: bool) -> Dict[str, str]:
+    """Разбирает вывод remote_listing_command: путь -> sha256 или размер (строкой)"""
+    listing = {}
+    for line in output.strip().splitlines():
+        value, _, name = line.partition(' ')
+        if checksum:
+            # sha256sum разделяет хеш и имя двумя символами: пробелом и признаком режима (' ' или '*')
+            name = name[1:]
+        listing[name] = value
+    return listing
+
+
+def expected_listing_value(bundle_file: BundleFile, checksum: bool) -> str:
+    return bundle_file.sha256() if checksum else str(bundle_file.size)
+
+
+def _deploy_files(
+    ssh: paramiko.SSHClient,
+    zip_path: str,
+    deploy_path: str,
+    username: str,
+    timeout: int,
+    previous_manifest: Optional[Dict[str, Dict[str, Any]]] = None,
+    transport: str = UPLOAD_TRANSPORT_SFTP,
+    sftp_channels: int = DEFAULT_SFTP_CHANNELS,
+    release_id: Optional[str] = None,
+    keep_releases: int = DEFAULT_KEEP_RELEASES,
+    build_stages: Optional[List[BuildStage]] = None
+) -> Tuple[bool, str, Dict[str, Any]]:
+    """Загрузка файлов по уже установленному подключению"""
+    report: Dict[str, Any] = {'steps': []}
+    release_id = release_id or make_release_id()
+    site_root = release_path(deploy_path, release_id)
+    checksum = transport == UPLOAD_TRANSPORT_TAR
+    upload_stats = {'seconds': 0.0, 'bytes': 0, 'channels': 1, 'retries': 0}
+    
+    def send(files: List[BundleFile]) -> None:
+        if not files:
+            return
+        if transport == UPLOAD_TRANSPORT_TAR:
+            started = time.monotonic()
+            upload_stats['bytes'] += upload_bundle_tar(ssh, files, site_root, timeout=max(timeout, 120))
+            upload_stats['seconds'] += time.monotonic() - started
+            return
+        stats = upload_bundle_parallel(ssh, files, site_root, channels=sftp_channels)
+        upload_stats['seconds'] += stats['seconds']
+        upload_stats['bytes'] += stats['bytes']
+        upload_stats['channels'] = max(upload_stats['channels'], stats['channels'])
+        upload_stats['retries'] += stats['retries']
+        if stats['failed']:
+            details = '; '.join(f"{path}: {error}" for path, error in sorted(stats['failed'].items()))
+            raise RuntimeError(f"Не удалось загрузить {len(stats['failed'])} из {len(files)} файлов ({details})")
+    
+    try:
+        with SiteBundle.from_zip(zip_path) as bundle:
+            if 'index.html' not in bundle:
+                return False, "В архиве отсутствует index.html", report
+            index_size = bundle.get('index.html').size
+            if index_size == 0:
+                return False, f"Файл index.html пустой! Размер: {index_size} байт", report
             
-            index_path = os.path.join(extract_dir, 'index.html')
-            if not os.path.exists(index_path):
-                return False, "В архиве отсутствует index.html"
+            report['build'] = run_stages(bundle, build_stages)
             
-            sftp = ssh.open_sftp()
+            # После сборки стили могут называться по хешу содержимого (styles.<hash>.css)
+            css_file = next((f for f in bundle if original_path(f.path) == 'styles.css'), None)
+            if css_file is None:
+                print(f"⚠️ Предупреждение: styles.css не найден в архиве!")
+            elif css_file.size == 0:
+                print(f"⚠️ Предупреждение: {css_file.path} пустой!")
+            else:
+                print(f"📄 Найден {css_file.path} ({css_file.size} байт)")
             
-            commands = [
-                f"mkdir -p {deploy_path}",
-                f"chmod 755 {deploy_path}",
-                f"chown -R $USER:$USER {deploy_path}"
-            ]
+            deployed = []
+            for bundle_file in bundle:
+                if bundle_file.size == 0 and original_path(bundle_file.path) not in ('index.html', 'styles.css'):
+                    print(f"⚠️ Предупреждение: файл {bundle_file.path} пустой, пропускаем")
+                    continue
+                deployed.append(bundle_file)
             
-            for cmd in commands:
-                stdin, stdout, stderr = ssh.exec_command(cmd, timeout=timeout)
-                exit_status = stdout.channel.recv_exit_status()
-                if exit_status != 0:
-                    error = safe_decode(stderr.read())
-                    if 'chown' not in cmd or 'Permission denied' not in error:
-                        return False, f"Ошибка создания директории: {error}"
+            # Загружаются только новые и изменённые файлы, удалённые из сайта в новый релиз не попадают
+            manifest = {f.path: {'sha256': f.sha256(), 'size': f.size} for f in deployed}
+            changed, unchanged, removed = diff_manifests(manifest, previous_manifest)
             
-            remote_index_path = f"{deploy_path}/index.html"
-            sftp.put(index_path, remote_index_path)
+            remote_root = shlex.quote(site_root)
+            current = shlex.quote(current_release_path(deploy_path))
             
-            css_path = os.path.join(extract_dir, 'styles.css')
-            if os.path.exists(css_path):
-                css_size = os.path.getsize(css_path)
-                if css_size == 0:
-                    print(f"⚠️ Предупреждение: styles.css пустой!")
-                else:
-                    print(f"📄 Найден styles.css ({css_size} байт)")
-                
-                remote_css_path = f"{deploy_path}/styles.css"
-                sftp.put(css_path, remote_css_path)
-                
-                stdin, stdout, stderr = ssh.exec_command(
-                    f"test -f {remote_css_path} && stat -c '%s' {remote_css_path} || echo '0'",
-                    timeout=timeout
+            prepare = RemoteScript()
+            prepare.add("создание директории", f"mkdir -p {remote_root}")
+            prepare.add(
+                "права на директорию",
+                f"chmod 755 {shlex.quote(deploy_path)} {shlex.quote(f'{deploy_path}/{RELEASES_DIR}')}"
+            )
+            prepare.add(
+                "владелец директории",
+                f'chown "$USER:$USER" {shlex.quote(deploy_path)} {shlex.quote(f"{deploy_path}/{RELEASES_DIR}")} {remote_root}',
+                critical=False
+            )
+            if previous_manifest:
+                # Жёсткие ссылки на файлы текущего релиза; без текущего релиза - пустой релиз и полная загрузка
+                prepare.add(
+                    "копирование текущего релиза",
+                    f'if [ -d {current} ] && cp -al {current}/. {remote_root}/; then echo "seeded $(readlink {current})"; '
+                    f'else rm -rf {remote_root} && mkdir -p {remote_root} && echo "empty $(readlink {current})"; fi'
                 )
-                remote_css_size = safe_decode(stdout.read()).strip()
-                if remote_css_size == '0':
-                    error = safe_decode(stderr.read())
-                    print(f"⚠️ Предупреждение: styles.css не найден на сервере после загрузки: {error}")
-                elif int(remote_css_size) != css_size:
-                    print(f"⚠️ Предупреждение: размер styles.css не совпадает (локально: {css_size}, на сервере: {remote_css_size})")
-                else:
-                    print(f"📄 Загружен styles.css ({css_size} байт)")
-            else:
-                print(f"⚠️ Предупреждение: styles.css не найден в архиве!")
-            
-            images_dir = os.path.join(extract_dir, 'images')
-            if os.path.exists(images_dir) and os.path.isdir(images_dir):
-                remote_images_dir = f"{deploy_path}/images"
-                stdin, stdout, stderr = ssh.exec_command(f"mkdir -p {remote_images_dir}", timeout=timeout)
-                exit_status = stdout.channel.recv_exit_status()
-                if exit_status != 0:
-                    error = safe_decode(stderr.read())
-                    return False, f"Ошибка создания папки images: {error}"
-                
-                image_files = [f for f in os.listdir(images_dir) if os.path.isfile(os.path.join(images_dir, f))]
-                for image_file in image_files:
-                    local_image_path = os.path.join(images_dir, image_file)
-                    remote_image_path = f"{remote_images_dir}/{image_file}"
-                    
-                    file_size = os.path.getsize(local_image_path)
-                    if file_size == 0:
-                        print(f"⚠️ Предупреждение: файл {image_file} пустой, пропускаем")
-                        continue
-                    
-                    sftp.put(local_image_path, remote_image_path)
-                    
-                    stdin, stdout, stderr = ssh.exec_command(
-                        f"test -f {remote_image_path} && stat -c '%s' {remote_image_path} || echo '0'",
-                        timeout=timeout
+                stale = changed + removed
+                if stale:
+                    # Изменённые файлы - общие inode с прошлым релизом, запись поверх них изменила бы его
+                    prepare.add(
+                        "удаление изменённых и устаревших файлов",
+                        "rm -f " + ' '.join(shlex.quote(f"{site_root}/{path}") for path in stale),
+                        sudo=True
                     )
-                    remote_size = safe_decode(stdout.read()).strip()
-                    if remote_size == '0' or int(remote_size) != file_size:
-                        error = safe_decode(stderr.read())
-                        return False, f"Ошибка загрузки изображения {image_file}: размер не совпадает (локально: {file_size}, на сервере: {remote_size})"
-                    
-                    print(f"🖼️ Загружено изображение: {image_file} ({file_size} байт)")
+            else:
+                prepare.add("текущий релиз", f'echo "empty $(readlink {current})"')
+            directories = bundle.directories()
+            if directories:
+                prepare.add(
+                    "создание вложенных директорий",
+                    "mkdir -p " + ' '.join(shlex.quote(f"{site_root}/{d}") for d in directories)
+                )
             
-            chown_commands = [
-                f"sudo chown -R {username}:{username} {deploy_path}",
-            ]
+            result = prepare.run(ssh, timeout=timeout)
+            report['steps'] += result.as_list()
+            if not result.ok:
+                return False, result.error_message(), report
             
-            for cmd in chown_commands:
-                stdin, stdout, stderr = ssh.exec_command(cmd, timeout=timeout)
-                exit_status = stdout.channel.recv_exit_status()
-                if exit_status != 0:
-                    error = safe_decode(stderr.read())
-                    cmd_no_sudo = cmd.replace('sudo ', '')
-                    stdin, stdout, stderr = ssh.exec_command(cmd_no_sudo, timeout=timeout)
-                    exit_status = stdout.channel.recv_exit_status()
-                    if exit_status != 0:
-                        error = safe_decode(stderr.read())
-                        print(f"⚠️ Предупреждение: не удалось установить владельца ({cmd}): {error}")
+            seed_step = result.get("копирование текущего релиза") or result.get("текущий релиз")
+            seed_state, _, previous_link = seed_step.stdout.strip().partition(' ')
+            previous_release = previous_link.rsplit('/', 1)[-1] or None
+            if seed_state != 'seeded':
+                changed, unchanged = sorted(manifest), []
+            uploads = [bundle.get(path) for path in changed]
             
-            commands = [
-                f"sudo chmod 755 {deploy_path}",
-                f"sudo chmod 644 {remote_index_path}",
-            ]
-            
-            if os.path.exists(css_path):
-                commands.append(f"sudo chmod 644 {deploy_path}/styles.css")
-            
-            if os.path.exists(images_dir) and os.path.isdir(images_dir):
-                commands.append(f"sudo chmod 755 {deploy_path}/images")
-                image_files = [f for f in os.listdir(images_dir) if os.path.isfile(os.path.join(images_dir, f))]
-                for image_file in image_files:
-                    commands.append(f"sudo chmod 644 {deploy_path}/images/{image_file}")
+            send(uploads)
             
-            path_parts = deploy_path.strip('/').split('/')
+            remote_index_path = shlex.quote(f"{site_root}/index.html")
+            parents = []
+            path_parts = site_root.strip('/').split('/')
             for i in range(1, len(path_parts) + 1):
                 parent_path = '/' + '/'.join(path_parts[:i])
                 if parent_path != '/':
-                    commands.append(f"sudo chmod 755 {parent_path}")
-            
-            for cmd in commands:
-                stdin, stdout, stderr = ssh.exec_command(cmd, timeout=timeout)
-                exit_status = stdout.channel.recv_exit_status()
-                if exit_status != 0:
-                    cmd_no_sudo = cmd.replace('sudo ', '')
-                    stdin, stdout, stderr = ssh.exec_command(cmd_no_sudo, timeout=timeout)
-                    exit_status = stdout.channel.recv_exit_status()
-                    if exit_status != 0:
-                        error = safe_decode(stderr.read())
-                        if 'chmod 755' in cmd and parent_path in cmd:
-                            print(f"⚠️ Предупреждение: не удалось установить права для {parent_path}: {error}")
-                        else:
-                            return False, f"Ошибка установки прав ({cmd}): {error}"
+                    parents.append(shlex.quote(parent_path))
             
-            stdin, stdout, stderr = ssh.exec_command(
-                f"test -f {remote_index_path} && echo 'OK' || echo 'FAIL'",
-                timeout=timeout
-            )
-            check_result = safe_decode(stdout.read()).strip()
-            if check_result != 'OK':
-                return False, f"Файл не найден после загрузки: {remote_index_path}"
+            finalize = RemoteScript()
+            if removed and seed_state == 'seeded':
+                finalize.add("удаление пустых директорий", f"find {remote_root} -mindepth 1 -type d -empty -delete", critical=False)
+            finalize.add("владелец файлов", f"chown -R {username}:{username} {remote_root}", sudo=True, critical=False)
+            finalize.add("права на директории", f"find {remote_root} -type d -exec chmod 755 {{}} +", sudo=True)
+            finalize.add("права на файлы", f"find {remote_root} -type f -exec chmod 644 {{}} +", sudo=True)
+            if parents:
+                finalize.add("права на родительские директории", f"chmod 755 {' '.join(parents)}", sudo=True, critical=False)
+            # Проверяются все файлы сайта, включая пропущенные: отсутствующие на сервере будут загружены повторно
+            finalize.add("проверка файлов", remote_listing_command(site_root, deployed, checksum))
+            finalize.add("информация о файле", f"ls -lh {remote_index_path} && stat -c '%a %U:%G' {remote_index_path}", critical=False)
+            finalize.add("чтение пользователем", f"sudo -n -u {username} test -r {remote_index_path}", critical=False)
+            finalize.add("первые строки index.html", f"head -n 5 {remote_index_path}", critical=False)
             
-            stdin, stdout, stderr = ssh.exec_command(
-                f"ls -lh {remote_index_path} && stat -c '%a %U:%G' {remote_index_path}",
-                timeout=timeout
-            )
-            file_info = safe_decode(stdout.read()).strip()
-            if file_info:
-                print(f"📄 Информация о файле: {file_info}")
+            result = finalize.run(ssh, timeout=timeout)
+            report['steps'] += result.as_list()
+            if not result.ok:
+                return False, result.error_message(), report
             
-            stdin, stdout, stderr = ssh.exec_command(
-                f"sudo -u {username} test -r {remote_index_path} && echo 'READABLE' || echo 'NOT_READABLE'",
-                timeout=timeout
-            )
-            readable_check = safe_decode(stdout.read()).strip()
-            if readable_check != 'READABLE':
-                error = safe_decode(stderr.read())
-                print(f"⚠️ Предупреждение: файл может быть недоступен для чтения пользователем {username}: {error}")
+            for step in result.warnings:
+                print(f"⚠️ Предупреждение: шаг «{step.name}» не выполнен: {step.stderr.strip()}")
             
-            stdin, stdout, stderr = ssh.exec_command(
-                f"test -r {remote_index_path} && echo 'READABLE' || echo 'NOT_READABLE'",
-                timeout=timeout
-            )
-            world_readable = safe_decode(stdout.read()).strip()
-            if world_readable != 'READABLE':
-                error = safe_decode(stderr.read())
-                print(f"⚠️ Предупреждение: файл не читаемый для всех пользователей. Исправляем права...")
-                stdin, stdout, stderr = ssh.exec_command(
-                    f"sudo chmod 644 {remote_index_path}",
-                    timeout=timeout
-                )
-                exit_status = stdout.channel.recv_exit_status()
-                if exit_status != 0:
-                    print(f"❌ Не удалось исправить права доступа: {safe_decode(stderr.read())}")
-            
-            stdin, stdout, stderr = ssh.exec_command(
-                f"head -n 5 {remote_index_path}",
-                timeout=timeout
-            )
-            file_preview = safe_decode(stdout.read()).strip()
-            if file_preview:
-                print(f"📋 Первые строки index.html: {file_preview[:200]}")
+            what = "контрольная сумма" if checksum else "размер"
+            remote = parse_remote_listing(result.get("проверка файлов").stdout, checksum)
+            for bundle_file in uploads:
+                expected = expected_listing_value(bundle_file, checksum)
+                if remote.get(bundle_file.path) != expected:
+                    return False, f"Ошибка загрузки {bundle_file.path}: {what} не совпадает (локально: {expected}, на сервере: {remote.get(bundle_file.path, 'нет файла')})", report
             
-            stdin, stdout, stderr = ssh.exec_command(
-                f"wc -c < {remote_index_path}",
-                timeout=timeout
-            )
-            file_size = safe_decode(stdout.read()).strip()
-            if file_size and int(file_size) == 0:
-                return False, f"Файл index.html пустой! Размер: {file_size} байт"
-            print(f"📏 Размер index.html: {file_size} байт")
-            
-            import shutil
-            shutil.rmtree(extract_dir)
-            
-            return True, f"Файлы успешно загружены в {deploy_path}"
-            
-        except zipfile.BadZipFile:
-            return False, "Некорректный формат ZIP архива"
-        except Exception as e:
-            return False, f"Ошибка при развёртывании: {str(e)}"
-        finally:
-            if os.path.exists(extract_dir):
-                import shutil
-                shutil.rmtree(extract_dir)
+            repaired = [
+                bundle.get(path) for path in unchanged
+                if remote.get(path) != expected_listing_value(bundle.get(path), checksum)
+            ]
+            if repaired:
+                for bundle_file in repaired:
+                    print(f"⚠️ Файл {bundle_file.path} изменён или удалён на сервере, загружаем заново")
+                repaired_paths = ' '.join(shlex.quote(f"{site_root}/{f.path}") for f in repaired)
+                unlink = RemoteScript()
+                unlink.add("удаление повреждённых файлов", f"rm -f {repaired_paths}", sudo=True)
+                unlink_result = unlink.run(ssh, timeout=timeout)
+                report['steps'] += unlink_result.as_list()
+                if not unlink_result.ok:
+                    return False, unlink_result.error_message(), report
+                send(repaired)
                 
-    finally:
-        if sftp:
-            sftp.close()
+                check = RemoteScript()
+                check.add("права на восстановленные файлы", f"chmod 644 {repaired_paths}", sudo=True)
+                check.add("проверка восстановленных файлов", remote_listing_command(site_root, repaired, checksum))
+                check_result = check.run(ssh, timeout=timeout)
+                report['steps'] += check_result.as_list()
+                if not check_result.ok:
+                    return False, check_result.error_message(), report
+                remote = parse_remote_listing(check_result.get("проверка восстановленных файлов").stdout, checksum)
+                for bundle_file in repaired:
+                    if remote.get(bundle_file.path) != expected_listing_value(bundle_file, checksum):
+                        return False, f"Ошибка загрузки {bundle_file.path}: {what} не совпадает после повторной загрузки", report
+            
+            activate = RemoteScript()
+            activate.add("переключение релиза", activate_release_command(deploy_path, release_id), sudo=True)
+            activate.add("удаление старых релизов", prune_releases_command(deploy_path, keep_releases), sudo=True, critical=False)
+            activate_result = activate.run(ssh, timeout=timeout)
+            report['steps'] += activate_result.as_list()
+            if not activate_result.ok:
+                return False, activate_result.error_message(), report
+            pruned_step = activate_result.get("удаление старых релизов")
+            report['release'] = {
+                'id': release_id,
+                'path': site_root,
+                'previous': previous_release,
+                'pruned': pruned_step.stdout.split() if pruned_step.ok else [],
+            }
+        
+        transferred = uploads + repaired
+        skipped = [f for f in deployed if f not in transferred]
+        report['manifest'] = manifest
+        report['transfer'] = {
+            'files_uploaded': len(transferred),
+            'bytes_uploaded': sum(f.size for f in transferred),
+            'files_skipped': len(skipped),
+            'bytes_skipped': sum(f.size for f in skipped),
+            'files_deleted': len(removed),
+            'files_repaired': len(repaired),
+            'transport': transport,
+            'channels': upload_stats['channels'],
+            'retries': upload_stats['retries'],
+            'upload_seconds': round(upload_stats['seconds'], 3),
+            'bytes_per_second': int(upload_stats['bytes'] / upload_stats['seconds']) if upload_stats['seconds'] else 0,
+        }
+        
+        file_info = result.get("информация о файле").stdout.strip()
+        if file_info:
+            print(f"📄 Информация о файле: {file_info}")
+        file_preview = result.get("первые строки index.html").stdout.strip()
+        if file_preview:
+            print(f"📋 Первые строки index.html: {file_preview[:200]}")
+        print(f"📏 Размер index.html: {index_size} байт")
+        
+        transfer = report['transfer']
+        return True, (
+            f"Релиз {release_id} загружен в {deploy_path} и активирован: "
+            f"загружено {transfer['files_uploaded']} ({transfer['bytes_uploaded']} байт), "
+            f"без изменений {transfer['files_skipped']} ({transfer['bytes_skipped']} байт), "
+            f"удалено {transfer['files_deleted']}, "
+            f"{transfer['bytes_per_second'] / 1024:.1f} КБ/с"
+        ), report
+        
+    except zipfile.BadZipFile:
+        return False, "Некорректный формат ZIP архива", report
+    except ValidationError as e:
+        return False, ' '.join(e.messages), report
+    except Exception as e:
+        return False, f"Ошибка при развёртывании: {str(e)}", report
 
 
 def generate_nginx_config(
@@ -335,10 +629,27 @@ def generate_nginx_config(
     deploy_path: str,
     server_name: Optional[str] = None,
     use_ssl: bool = False,
-    config_name: Optional[str] = None
+    config_name: Optional[str] = None,
+    brotli_static: bool = False
 ) -> str:
-    """Генерирует Nginx конфигурацию для статического сайта с поддержкой SSL и кеширования"""
+    """
+    Генерирует Nginx конфигурацию для статического сайта с поддержкой SSL и кеширования. root - симлинк на активный релиз.
+    Сжатые при сборке .gz (и .br при brotli_static, нужен модуль ngx_brotli) отдаются без сжатия на лету.
+    Файлы с хешем в имени кешируются на год, HTML и файлы без хеша браузер проверяет при каждом запросе (ETag).
+    """
     server_name = server_name or domain
+    document_root = current_release_path(deploy_path)
+    compression = "gzip_static on;\n    gzip_vary on;"
+    if brotli_static:
+        compression += "\n    brotli_static on;"
+    # Год и immutable только для имён с хешем содержимого (api.site_fingerprint), остальное - с ревалидацией
+    extensions = '|'.join(FINGERPRINT_EXTENSIONS)
+    caching = (
+        f'location ~* "\\.[0-9a-f]{{{FINGERPRINT_LENGTH}}}\\.({extensions})$" {{\n'
+        '        expires 1y;\n'
+        '        add_header Cache-Control "public, immutable";\n'
+        '    }'
+    )
     
     is_ip = re.match(r'^(\d{1,3}\.){3}\d{1,3}$', domain)
     if is_ip:
@@ -363,21 +674,20 @@ server {{
     ssl_protocols TLSv1.2 TLSv1.3;
     ssl_ciphers HIGH:!aNULL:!MD5;
     ssl_prefer_server_ciphers on;
-    root {deploy_path};
+    root {document_root};
     index index.html index.htm;
+    {compression}
     access_log /var/log/nginx/{log_name}_access.log;
     error_log /var/log/nginx/{log_name}_error.log;
     location / {{
         try_files $uri $uri/ /index.html;
+        add_header Cache-Control "no-cache";
     }}
     location = /favicon.ico {{
         log_not_found off;
         access_log off;
     }}
-    location ~* \\.(jpg|jpeg|png|gif|ico|css|js|svg|woff|woff2|ttf|eot)$ {{
-        expires 1y;
-        add_header Cache-Control "public, immutable";
-    }}
+    {caching}
     location ~ /\\. {{
         deny all;
         access_log off;
@@ -389,21 +699,20 @@ server {{
         config = f"""server {{
     listen 80;
     server_name {server_name};
-    root {deploy_path};
+    root {document_root};
     index index.html index.htm;
+    {compression}
     access_log /var/log/nginx/{log_name}_access.log;
     error_log /var/log/nginx/{log_name}_error.log;
     location / {{
         try_files $uri $uri/ /index.html;
+        add_header Cache-Control "no-cache";
     }}
     location = /favicon.ico {{
         log_not_found off;
         access_log off;
     }}
-    location ~* \\.(jpg|jpeg|png|gif|ico|css|js|svg|woff|woff2|ttf|eot)$ {{
-        expires 1y;
-        add_header Cache-Control "public, immutable";
-    }}
+    {caching}
     location ~ /\\. {{
         deny all;
         access_log off;
@@ -415,12 +724,23 @@ server {{
 
 
 def obtain_ssl_certificate(
-    ssh: paramiko.SSHClient,
+    target: SSHTarget,
     domain: str,
     email: str,
     timeout: int = 120
 ) -> Tuple[bool, str]:
     """Получает SSL сертификат через Let's Encrypt certbot в standalone режиме"""
+    with get_ssh_pool().connection(target) as ssh:
+        return _obtain_ssl_certificate(ssh, domain, email, timeout)
+
+
+def _obtain_ssl_certificate(
+    ssh: paramiko.SSHClient,
+    domain: str,
+    email: str,
+    timeout: int
+) -> Tuple[bool, str]:
+    """Получение сертификата по уже установленному подключению"""
     try:
         stdin, stdout, stderr = ssh.exec_command("which certbot", timeout=10)
         exit_status = stdout.channel.recv_exit_status()
@@ -477,7 +797,7 @@ def obtain_ssl_certificate(
 
 
 def deploy_nginx_config(
-    ssh: paramiko.SSHClient,
+    target: SSHTarget,
     domain: str,
     deploy_path: str,
     username: str,
@@ -486,16 +806,47 @@ def deploy_nginx_config(
     timeout: int = 30
 ) -> Tuple[bool, str]:
     """Генерирует Nginx конфиг, загружает на сервер, создаёт симлинк, проверяет и перезагружает Nginx"""
+    with get_ssh_pool().connection(target) as ssh:
+        return _deploy_nginx_config(ssh, domain, deploy_path, username, config_name, use_ssl, timeout)
+
+
+def nginx_has_brotli(ssh: paramiko.SSHClient, timeout: int = 30) -> bool:
+    """Есть ли в Nginx модуль ngx_brotli (встроенный или подключаемый): без него brotli_static ломает конфиг"""
+    stdin, stdout, stderr = ssh.exec_command(
+        "nginx -V 2>&1 | grep -qi brotli || grep -rqsi 'brotli' /etc/nginx/modules-enabled",
+        timeout=timeout
+    )
+    return stdout.channel.recv_exit_status() == 0
+
+
+def _deploy_nginx_config(
+    ssh: paramiko.SSHClient,
+    domain: str,
+    deploy_path: str,
+    username: str,
+    config_name: Optional[str],
+    use_ssl: bool,
+    timeout: int
+) -> Tuple[bool, str]:
+    """Настройка Nginx по уже установленному подключению"""
     if not config_name:
         config_name = domain.replace('.', '-') + '.conf'
     
-    config_content = generate_nginx_config(domain, deploy_path, use_ssl=use_ssl, config_name=config_name)
+    site_root = current_release_path(deploy_path)
+    config_content = generate_nginx_config(
+        domain,
+        deploy_path,
+        use_ssl=use_ssl,
+        config_name=config_name,
+        brotli_static=nginx_has_brotli(ssh, timeout)
+    )
     
     try:
         with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.conf') as config_file:
             config_file.write(config_content)
             config_file_path = config_file.name
         
+        sftp = None
         try:
             sftp = ssh.open_sftp()
             
@@ -571,15 +922,15 @@ def deploy_nginx_config(
                 return False, f"Симлинк Nginx не создан. Проверьте: ls -la /etc/nginx/sites-enabled/{config_name}"
             
             stdin, stdout, stderr = ssh.exec_command(
-                f"test -f {deploy_path}/index.html && echo 'EXISTS' || echo 'NOT_EXISTS'",
+                f"test -f {site_root}/index.html && echo 'EXISTS' || echo 'NOT_EXISTS'",
                 timeout=timeout
             )
             index_check = safe_decode(stdout.read()).strip()
             if index_check != 'EXISTS':
-                return False, f"Файл index.html не найден в {deploy_path}. Проверьте путь развёртывания."
+                return False, f"Файл index.html не найден в {site_root}. Проверьте путь развёртывания."
             
             stdin, stdout, stderr = ssh.exec_command(
-                f"ls -la {deploy_path}/index.html && stat -c '%a %U:%G' {deploy_path}/index.html",
+                f"ls -la {site_root}/index.html && stat -c '%a %U:%G' {site_root}/index.html",
                 timeout=timeout
             )
             file_perms = safe_decode(stdout.read()).strip()
@@ -603,41 +954,20 @@ def deploy_nginx_config(
             
             commands = [
                 f"sudo chmod 755 {deploy_path}",
-                f"sudo chmod 644 {deploy_path}/index.html",
+                f"sudo chmod 644 {site_root}/index.html",
+                # Стили после сборки называются по хешу содержимого (styles.<hash>.css): права - всем CSS
+                f"sudo find -H {site_root} -maxdepth 1 -type f -name '*.css' -exec chmod 644 {{}} +",
             ]
             
             stdin, stdout, stderr = ssh.exec_command(
-                f"test -f {deploy_path}/styles.css && echo 'EXISTS' || echo 'NOT_EXISTS'",
-                timeout=timeout
-            )
-            css_check = safe_decode(stdout.read()).strip()
-            if css_check == 'EXISTS':
-                commands.append(f"sudo chmod 644 {deploy_path}/styles.css")
-                stdin, stdout, stderr = ssh.exec_command(
-                    f"stat -c '%s' {deploy_path}/styles.css",
-                    timeout=timeout
-                )
-                css_size = safe_decode(stdout.read()).strip()
-                print(f"📄 CSS файл найден, размер: {css_size} байт")
-                stdin, stdout, stderr = ssh.exec_command(
-                    f"head -n 3 {deploy_path}/styles.css",
-                    timeout=timeout
-                )
-                css_preview = safe_decode(stdout.read()).strip()
-                if css_preview:
-                    print(f"📋 Первые строки CSS: {css_preview[:200]}")
-            else:
-                print(f"❌ ВНИМАНИЕ: styles.css не найден в {deploy_path}!")
-            
-            stdin, stdout, stderr = ssh.exec_command(
-                f"test -d {deploy_path}/images && echo 'EXISTS' || echo 'NOT_EXISTS'",
+                f"test -d {site_root}/images && echo 'EXISTS' || echo 'NOT_EXISTS'",
                 timeout=timeout
             )
             images_check = safe_decode(stdout.read()).strip()
             if images_check == 'EXISTS':
-                commands.append(f"sudo chmod 755 {deploy_path}/images")
+                commands.append(f"sudo chmod 755 {site_root}/images")
                 stdin, stdout, stderr = ssh.exec_command(
-                    f"find {deploy_path}/images -type f -exec sudo chmod 644 {{}} \\;",
+                    f"find {site_root}/images -type f -exec sudo chmod 644 {{}} \\;",
                     timeout=timeout
                 )
             
@@ -649,12 +979,12 @@ def deploy_nginx_config(
                     print(f"⚠️ Предупреждение при установке прав ({cmd}): {error}")
             
             stdin, stdout, stderr = ssh.exec_command(
-                f"sudo -u {username} test -r {deploy_path}/index.html && echo 'READABLE' || echo 'NOT_READABLE'",
+                f"sudo -u {username} test -r {site_root}/index.html && echo 'READABLE' || echo 'NOT_READABLE'",
                 timeout=timeout
             )
             readable_check = safe_decode(stdout.read()).strip()
             if readable_check != 'READABLE':
-                return False, f"Файл не читаемый для пользователя {username} после установки прав. Проверьте вручную: sudo -u {username} test -r {deploy_path}/index.html"
+                return False, f"Файл не читаемый для пользователя {username} после установки прав. Проверьте вручную: sudo -u {username} test -r {site_root}/index.html"
             
             stdin, stdout, stderr = ssh.exec_command(
                 f"sudo -u {username} test -x {deploy_path} && echo 'ACCESSIBLE' || echo 'NOT_ACCESSIBLE'",
@@ -690,15 +1020,15 @@ def deploy_nginx_config(
                 return False, f"Путь {deploy_path} не существует на сервере!"
             
             stdin, stdout, stderr = ssh.exec_command(
-                f"test -f {deploy_path}/index.html && echo 'EXISTS' || echo 'NOT_EXISTS'",
+                f"test -f {site_root}/index.html && echo 'EXISTS' || echo 'NOT_EXISTS'",
                 timeout=timeout
             )
             index_exists = safe_decode(stdout.read()).strip()
             if index_exists != 'EXISTS':
-                return False, f"Файл {deploy_path}/index.html не существует!"
+                return False, f"Файл {site_root}/index.html не существует!"
             
             stdin, stdout, stderr = ssh.exec_command(
-                f"sudo -u {username} ls -la {deploy_path}/index.html",
+                f"sudo -u {username} ls -la {site_root}/index.html",
                 timeout=timeout
             )
             user_ls = safe_decode(stdout.read()).strip()
@@ -706,7 +1036,7 @@ def deploy_nginx_config(
                 print(f"📄 Список файлов от {username}: {user_ls}")
             
             stdin, stdout, stderr = ssh.exec_command(
-                f"sudo -u {username} cat {deploy_path}/index.html | head -n 1",
+                f"sudo -u {username} cat {site_root}/index.html | head -n 1",
                 timeout=timeout
             )
             user_read = safe_decode(stdout.read()).strip()
@@ -741,21 +1071,31 @@ def deploy_nginx_config(
                 if nginx_errors:
                     print(f"⚠️ Последние ошибки Nginx:\n{nginx_errors}")
                     if "502" in nginx_errors or "Bad Gateway" in nginx_errors or "Permission denied" in nginx_errors:
-                        return False, f"Ошибка Nginx (502 Bad Gateway). Логи:\n{nginx_errors}\n\nПроверьте:\n1. Права доступа: sudo chmod 755 {deploy_path} && sudo chmod 644 {deploy_path}/index.html\n2. Владелец: sudo chown -R {username}:{username} {deploy_path}\n3. Логи: sudo tail -f /var/log/nginx/error.log"
+                        return False, f"Ошибка Nginx (502 Bad Gateway). Логи:\n{nginx_errors}\n\nПроверьте:\n1. Права доступа: sudo chmod 755 {deploy_path} && sudo chmod 644 {site_root}/index.html\n2. Владелец: sudo chown -R {username}:{username} {deploy_path}\n3. Логи: sudo tail -f /var/log/nginx/error.log"
             except Exception as e:
                 print(f"⚠️ Не удалось прочитать логи Nginx: {str(e)}")
             
+            # Стили называются по хешу содержимого (styles.<hash>.css), а несуществующий путь try_files отдаёт
+            # как index.html с кодом 200: проверяется файл стилей релиза и тип ответа
             stdin, stdout, stderr = ssh.exec_command(
-                f"curl -I http://localhost/styles.css 2>&1 | head -n 5",
+                f"find -H {site_root} -maxdepth 1 -type f -name '*.css' -printf '%f\\n' | sort | head -n 1",
                 timeout=timeout
             )
-            css_http_check = safe_decode(stdout.read()).strip()
-            if css_http_check:
-                print(f"🌐 Проверка доступности CSS через HTTP:\n{css_http_check}")
-                if "404" in css_http_check or "Not Found" in css_http_check:
-                    print(f"❌ ВНИМАНИЕ: CSS файл не доступен через HTTP (404)!")
-                elif "200" in css_http_check or "OK" in css_http_check:
-                    print(f"✓ CSS файл доступен через HTTP")
+            css_name = safe_decode(stdout.read()).strip()
+            if css_name:
+                stdin, stdout, stderr = ssh.exec_command(
+                    f"curl -sI -H {shlex.quote(f'Host: {domain}')} {shlex.quote(f'http://localhost/{css_name}')} "
+                    "2>&1 | head -n 10",
+                    timeout=timeout
+                )
+                css_http_check = safe_decode(stdout.read()).strip()
+                if css_http_check:
+                    print(f"🌐 Проверка доступности {css_name} через HTTP:\n{css_http_check}")
+                    status_line = css_http_check.splitlines()[0]
+                    if " 200" in status_line and "text/css" in css_http_check.lower():
+                        print(f"✓ CSS файл доступен через HTTP")
+                    else:
+                        print(f"❌ ВНИМАНИЕ: CSS файл не отдаётся через HTTP как text/css!")
             
             try:
                 stdin, stdout, stderr = ssh.exec_command(
@@ -770,11 +1110,11 @@ def deploy_nginx_config(
             except Exception as e:
                 print(f"⚠️ Не удалось выполнить тест curl: {str(e)}")
             
-            sftp.close()
-            
             return True, f"Nginx конфиг успешно применён: {config_name}. Сайт должен быть доступен по указанному адресу."
             
         finally:
+            if sftp:
+                sftp.close()
             if os.path.exists(config_file_path):
                 os.unlink(config_file_path)
                 
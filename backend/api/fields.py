@@ -0,0 +1,133 @@
+"""
+Поля моделей со сжатием: значение хранится в бинарной колонке как заголовок и байты, сжатые zlib или zstd
+(если установлен пакет zstandard). Строки, записанные до перехода на сжатие (текст или JSON без заголовка),
+читаются как есть и сжимаются при следующей записи.
+"""
+import json
+import zlib
+from typing import Any, Optional
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+
+try:
+    import zstandard
+except ImportError:  # Необязательная зависимость: без неё используется zlib
+    zstandard = None
+
+
+# Заголовок: NUL не встречается в начале HTML, CSS и JSON, поэтому старые несжатые значения не спутать со сжатыми
+MAGIC = b'\x00NC'
+ALGORITHMS = {'none': b'r', 'zlib': b'z', 'zstd': b's'}
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+COMPRESS_MIN_SIZE = 256  # Меньшие значения хранятся без сжатия
+
+
+def compression_algorithm() -> str:
+    """Алгоритм из PROJECT_CONTENT_COMPRESSION; zstd без пакета zstandard заменяется на zlib"""
+    algorithm = settings.PROJECT_CONTENT_COMPRESSION
+    if algorithm not in ALGORITHMS:
+        raise ImproperlyConfigured(f"PROJECT_CONTENT_COMPRESSION: неизвестный алгоритм {algorithm!r}")
+    if algorithm == 'zstd' and zstandard is None:
+        return 'zlib'
+    return algorithm
+
+
+def compress(data: bytes, algorithm: Optional[str] = None) -> bytes:
+    """Байты с заголовком алгоритма; если сжатие не уменьшает размер, данные хранятся как есть"""
+    algorithm = algorithm or compression_algorithm()
+    if algorithm != 'none' and len(data) >= COMPRESS_MIN_SIZE:
+        if algorithm == 'zstd':
+            compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+        else:
+            compressed = zlib.compress(data, ZLIB_LEVEL)
+        if len(compressed) < len(data):
+            return MAGIC + ALGORITHMS[algorithm] + compressed
+    return MAGIC + ALGORITHMS['none'] + data
+
+
+def decompress(value: Any) -> bytes:
+    """Исходные байты значения из БД (сжатого или записанного до перехода на сжатие)"""
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    elif isinstance(value, str):
+        return value.encode('utf-8')
+    if not value.startswith(MAGIC):
+        return value
+    marker, payload = value[len(MAGIC):len(MAGIC) + 1], value[len(MAGIC) + 1:]
+    if marker == ALGORITHMS['zlib']:
+        return zlib.decompress(payload)
+    if marker == ALGORITHMS['zstd']:
+        if zstandard is None:
+            raise ImproperlyConfigured("Значение сжато zstd: установите пакет zstandard")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    if marker == ALGORITHMS['none']:
+        return payload
+    raise ValueError(f"Неизвестный алгоритм сжатия: {marker!r}")
+
+
+class CompressedField(models.Field):
+    """Основа сжатых полей: encode/decode переводят значение Python в байты и обратно"""
+
+    def get_internal_type(self) -> str:
+        return 'BinaryField'
+
+    def get_placeholder(self, value, compiler, connection):
+        return connection.ops.binary_placeholder_sql(value)
+
+    def encode(self, value: Any) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, data: bytes) -> Any:
+        raise NotImplementedError
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return self.decode(decompress(value))
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is None:
+            return None
+        return connection.Database.Binary(compress(self.encode(value)))
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+
+class CompressedTextField(CompressedField):
+    """Текст (HTML, CSS), хранящийся сжатым"""
+    description = "Сжатый текст"
+
+    def encode(self, value: Any) -> bytes:
+        return str(value).encode('utf-8')
+
+    def decode(self, data: bytes) -> str:
+        return data.decode('utf-8')
+
+    def to_python(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        return str(value)
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{'form_class': forms.CharField, 'widget': forms.Textarea, **kwargs})
+
+
+class CompressedJSONField(CompressedField):
+    """JSON (данные GrapesJS), хранящийся сжатым; запросы по ключам JSON для него недоступны"""
+    description = "Сжатый JSON"
+
+    def encode(self, value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(data)
+
+    def to_python(self, value):
+        return value
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{'form_class': forms.JSONField, **kwargs})
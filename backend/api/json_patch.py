@@ -0,0 +1,212 @@
+"""
+Частичные изменения содержимого проекта: JSON Patch (RFC 6902) для json_content и вставки/удаления
+фрагментов текста для html_content и css_content. Используются автосохранением редактора вместо
+отправки всего проекта; make_json_patch и make_text_splices строят такие изменения при сравнении ревизий.
+"""
+import copy
+import difflib
+import re
+from typing import Any, Dict, List, Tuple
+
+# Токены текста для сравнения: HTML и CSS редактора часто записаны одной строкой, поэтому границы - после ">", "}" и
+# перевода строки
+TEXT_TOKEN_RE = re.compile(r'[^>}\n]*[>}\n]|[^>}\n]+')
+
+
+class PatchError(ValueError):
+    """Операция не применима к документу (неверный путь, тип или не прошла проверка test)"""
+
+
+def escape_pointer_key(key: Any) -> str:
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+
+def parse_pointer(pointer: str) -> List[str]:
+    """JSON Pointer (RFC 6901) в список ключей: "/a/b~1c" -> ["a", "b/c"]"""
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise PatchError(f'Путь должен начинаться с "/": {pointer}')
+    return [part.replace('~1', '/').replace('~0', '~') for part in pointer[1:].split('/')]
+
+
+def _array_index(container: list, key: str, allow_end: bool) -> int:
+    if allow_end and key == '-':
+        return len(container)
+    if not key.isdigit() or (len(key) > 1 and key.startswith('0')):
+        raise PatchError(f'Неверный индекс массива: {key}')
+    index = int(key)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f'Индекс вне массива: {key}')
+    return index
+
+
+def _resolve(document: Any, pointer: str) -> Tuple[Any, str]:
+    """Контейнер и последний ключ пути; для корня ("") - (None, "")"""
+    parts = parse_pointer(pointer)
+    if not parts:
+        return None, ''
+    container = document
+    for key in parts[:-1]:
+        container = _get(container, key)
+    return container, parts[-1]
+
+
+def _get(container: Any, key: str) -> Any:
+    if isinstance(container, dict):
+        if key not in container:
+            raise PatchError(f'Нет ключа: {key}')
+        return container[key]
+    if isinstance(container, list):
+        return container[_array_index(container, key, allow_end=False)]
+    raise PatchError(f'Путь проходит через значение, которое не является объектом или массивом: {key}')
+
+
+def _get_path(document: Any, pointer: str) -> Any:
+    container, key = _resolve(document, pointer)
+    return document if container is None and not key else _get(container, key)
+
+
+def _add(document: Any, pointer: str, value: Any) -> Any:
+    container, key = _resolve(document, pointer)
+    if container is None and not key:
+        return value
+    if isinstance(container, dict):
+        container[key] = value
+    elif isinstance(container, list):
+        container.insert(_array_index(container, key, allow_end=True), value)
+    else:
+        raise PatchError(f'Нельзя добавить значение в {pointer}')
+    return document
+
+
+def _remove(document: Any, pointer: str) -> Tuple[Any, Any]:
+    container, key = _resolve(document, pointer)
+    if container is None and not key:
+        raise PatchError('Нельзя удалить корень документа')
+    if isinstance(container, dict):
+        if key not in container:
+            raise PatchError(f'Нет ключа: {key}')
+        return document, container.pop(key)
+    if isinstance(container, list):
+        return document, container.pop(_array_index(container, key, allow_end=False))
+    raise PatchError(f'Нельзя удалить значение {pointer}')
+
+
+def apply_json_patch(document: Any, operations: List[Dict[str, Any]]) -> Any:
+    """
+    Применяет операции add, remove, replace, move, copy и test к копии документа и возвращает результат.
+    Патч применяется целиком или не применяется: при ошибке любой операции - PatchError.
+    """
+    document = copy.deepcopy(document)
+    for number, operation in enumerate(operations, start=1):
+        op = operation.get('op')
+        path = operation.get('path')
+        if not isinstance(path, str):
+            raise PatchError(f'Операция {number}: нет пути "path"')
+        try:
+            if op in ('add', 'replace', 'test') and 'value' not in operation:
+                raise PatchError('нет значения "value"')
+            if op == 'add':
+                document = _add(document, path, copy.deepcopy(operation['value']))
+            elif op == 'remove':
+                document, _ = _remove(document, path)
+            elif op == 'replace':
+                document, _ = _remove(document, path) if path else (document, None)
+                document = _add(document, path, copy.deepcopy(operation['value']))
+            elif op in ('move', 'copy'):
+                source = operation.get('from')
+                if not isinstance(source, str):
+                    raise PatchError('нет пути "from"')
+                if op == 'move':
+                    if path.startswith(source + '/'):
+                        raise PatchError('нельзя переместить значение внутрь самого себя')
+                    document, value = _remove(document, source)
+                else:
+                    value = copy.deepcopy(_get_path(document, source))
+                document = _add(document, path, value)
+            elif op == 'test':
+                if _get_path(document, path) != operation['value']:
+                    raise PatchError(f'значение {path} отличается от ожидаемого')
+            else:
+                raise PatchError(f'неизвестная операция {op!r}')
+        except PatchError as e:
+            raise PatchError(f'Операция {number} ({op}): {e}') from None
+    return document
+
+
+def apply_text_splices(text: str, splices: List[Dict[str, Any]]) -> str:
+    """
+    Применяет по порядку вставки/удаления {"pos", "delete", "insert"} к тексту: каждая считается от результата
+    предыдущей. Позиции и длины - в единицах UTF-16, как индексы строк JavaScript в редакторе.
+    """
+    data = text.encode('utf-16-le')
+    for number, splice in enumerate(splices, start=1):
+        start = splice['pos'] * 2
+        end = start + splice.get('delete', 0) * 2
+        if end > len(data):
+            raise PatchError(f'Фрагмент {number}: позиция за концом текста')
+        data = data[:start] + splice.get('insert', '').encode('utf-16-le') + data[end:]
+    try:
+        return data.decode('utf-16-le')
+    except UnicodeDecodeError:
+        raise PatchError('Фрагменты разрезают символ (суррогатную пару UTF-16)') from None
+
+
+def make_json_patch(source: Any, target: Any, path: str = '') -> List[Dict[str, Any]]:
+    """Операции JSON Patch, превращающие source в target (для apply_json_patch)"""
+    if source == target:
+        return []
+    if isinstance(source, dict) and isinstance(target, dict):
+        operations = []
+        for key in source:
+            if key not in target:
+                operations.append({'op': 'remove', 'path': f'{path}/{escape_pointer_key(key)}'})
+        for key, value in target.items():
+            key_path = f'{path}/{escape_pointer_key(key)}'
+            if key in source:
+                operations += make_json_patch(source[key], value, key_path)
+            else:
+                operations.append({'op': 'add', 'path': key_path, 'value': value})
+        return operations
+    if isinstance(source, list) and isinstance(target, list):
+        # Общие начало и конец списка не меняются, середина заменяется поэлементно и дополняется или обрезается
+        prefix = 0
+        while prefix < min(len(source), len(target)) and source[prefix] == target[prefix]:
+            prefix += 1
+        suffix = 0
+        while (suffix < min(len(source), len(target)) - prefix
+               and source[len(source) - 1 - suffix] == target[len(target) - 1 - suffix]):
+            suffix += 1
+        old, new = source[prefix:len(source) - suffix], target[prefix:len(target) - suffix]
+        operations = []
+        for index in range(min(len(old), len(new))):
+            operations += make_json_patch(old[index], new[index], f'{path}/{prefix + index}')
+        for index in range(len(old) - 1, len(new) - 1, -1):
+            operations.append({'op': 'remove', 'path': f'{path}/{prefix + index}'})
+        for index in range(len(old), len(new)):
+            operations.append({'op': 'add', 'path': f'{path}/{prefix + index}', 'value': new[index]})
+        return operations
+    return [{'op': 'replace', 'path': path, 'value': target}]
+
+
+def _utf16_length(text: str) -> int:
+    return len(text.encode('utf-16-le')) // 2
+
+
+def make_text_splices(source: str, target: str) -> List[Dict[str, Any]]:
+    """Фрагменты {"pos", "delete", "insert"}, превращающие source в target (для apply_text_splices)"""
+    old, new = TEXT_TOKEN_RE.findall(source), TEXT_TOKEN_RE.findall(target)
+    splices = []
+    position = 0
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        inserted = ''.join(new[j1:j2])
+        if tag != 'equal':
+            splices.append({
+                'pos': position,
+                'delete': _utf16_length(''.join(old[i1:i2])),
+                'insert': inserted,
+            })
+        position += _utf16_length(inserted)
+    return splices
@@ -0,0 +1,81 @@
+import json
+import time
+import zlib
+
+from django.core.management.base import BaseCommand, CommandError
+from api.fields import CompressedJSONField, CompressedTextField, zstandard
+from api.models import ProjectContent
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает степень и скорость сжатия содержимого проектов (zlib по уровням и zstd, если установлен)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=200, help='Сколько проектов взять из БД')
+        parser.add_argument('--file', action='append', default=[],
+                            help='JSON проекта, экспортированный из редактора (можно несколько раз)')
+        parser.add_argument('--runs', type=int, default=3, help='Повторов сжатия и распаковки каждого документа')
+
+    def handle(self, *args, **options):
+        documents = self.load_documents(options)
+        if not documents:
+            raise CommandError('Нет содержимого для сравнения: создайте проекты или передайте --file')
+        total = sum(len(data) for data in documents)
+        self.stdout.write(f'Документов: {len(documents)}, всего {total / 1024:.0f} КБ')
+
+        codecs = [(f'zlib {level}', self.zlib_codec(level)) for level in (1, 6, 9)]
+        if zstandard is not None:
+            codecs += [(f'zstd {level}', self.zstd_codec(level)) for level in (1, 3, 9, 19)]
+        else:
+            self.stdout.write('zstandard не установлен: zstd пропущен')
+
+        for name, (compress, decompress) in codecs:
+            compressed = [compress(data) for data in documents]
+            size = sum(len(data) for data in compressed)
+            started = time.perf_counter()
+            for _ in range(options['runs']):
+                for data in documents:
+                    compress(data)
+            encode = (time.perf_counter() - started) / options['runs']
+            started = time.perf_counter()
+            for _ in range(options['runs']):
+                for data in compressed:
+                    decompress(data)
+            decode = (time.perf_counter() - started) / options['runs']
+            self.stdout.write(
+                f'{name:8} размер {size / total:6.1%}  сжатие {total / encode / 2**20:7.1f} МБ/с  '
+                f'распаковка {total / decode / 2**20:7.1f} МБ/с'
+            )
+
+    def load_documents(self, options):
+        """Несжатые байты html, css и json содержимого проектов - как их кодируют поля ProjectContent"""
+        text, data = CompressedTextField(), CompressedJSONField()
+        documents = []
+        for content in ProjectContent.objects.order_by('-updated_at')[:options['limit']]:
+            documents += [
+                text.encode(content.html_content), text.encode(content.css_content), data.encode(content.json_content)
+            ]
+        for path in options['file']:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    project = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'{path}: {e}')
+            if isinstance(project, dict) and any(key in project for key in ProjectContent.FIELDS):
+                documents += [
+                    text.encode(project.get('html_content', '')),
+                    text.encode(project.get('css_content', '')),
+                    data.encode(project.get('json_content', {})),
+                ]
+            else:
+                documents.append(data.encode(project))
+        return [document for document in documents if document]
+
+    @staticmethod
+    def zlib_codec(level):
+        return (lambda data: zlib.compress(data, level)), zlib.decompress
+
+    @staticmethod
+    def zstd_codec(level):
+        compressor, decompressor = zstandard.ZstdCompressor(level=level), zstandard.ZstdDecompressor()
+        return compressor.compress, decompressor.decompress
@@ -0,0 +1,144 @@
+import os
+import shlex
+import tempfile
+import time
+import zipfile
+
+from django.core.management.base import BaseCommand, CommandError
+from api.deploy_utils import DEFAULT_SFTP_CHANNELS, UPLOAD_TRANSPORTS, deploy_files, validate_deploy_path
+from api.models import VPSServer
+from api.remote_exec import RemoteScript
+from api.ssh_pool import SSHTarget, get_ssh_pool
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает способы загрузки файлов (SFTP и tar) на сайте из множества мелких файлов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', type=int, help='ID VPS сервера (по умолчанию - сервер по умолчанию)')
+        parser.add_argument('--host', help='Хост SSH вместо VPS сервера из админки')
+        parser.add_argument('--port', type=int, default=22, help='SSH порт (с --host)')
+        parser.add_argument('--username', help='SSH пользователь (с --host)')
+        parser.add_argument('--password', help='SSH пароль (с --host)')
+        parser.add_argument('--path', help='Базовый путь для тестовых загрузок (удаляется после замера)')
+        parser.add_argument('--files', type=int, default=500, help='Количество файлов в тестовом сайте')
+        parser.add_argument('--size', type=int, default=2048, help='Размер каждого файла в байтах')
+        parser.add_argument('--runs', type=int, default=3, help='Количество замеров для каждого способа')
+        parser.add_argument(
+            '--transport',
+            action='append',
+            choices=UPLOAD_TRANSPORTS,
+            help='Способ загрузки (можно указать несколько раз, по умолчанию - все)',
+        )
+        parser.add_argument(
+            '--sftp-channels',
+            type=int,
+            action='append',
+            help=f'Параллельных SFTP каналов (можно указать несколько раз, по умолчанию 1 и {DEFAULT_SFTP_CHANNELS})',
+        )
+
+    def handle(self, *args, **options):
+        target, username, base_path = self._resolve_target(options)
+        validate_deploy_path(base_path)
+        transports = options['transport'] or list(UPLOAD_TRANSPORTS)
+        variants = []
+        for transport in transports:
+            if transport == 'sftp':
+                for channels in options['sftp_channels'] or [1, DEFAULT_SFTP_CHANNELS]:
+                    variants.append((f'sftp×{channels}', transport, channels))
+            else:
+                variants.append((transport, transport, 1))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            zip_path = os.path.join(tmp, 'site.zip')
+            total_size = self._build_site(zip_path, options['files'], options['size'])
+            files_count = options['files'] + 2
+            self.stdout.write(
+                f'Тестовый сайт: {files_count} файлов, {total_size / 1024:.1f} КБ; сервер {target.host}:{target.port}'
+            )
+
+            results = {}
+            try:
+                for name, transport, channels in variants:
+                    timings = []
+                    for run in range(options['runs']):
+                        deploy_path = f'{base_path}/{transport}-{channels}-{run}'
+                        started = time.monotonic()
+                        success, message, _ = deploy_files(
+                            target=target,
+                            zip_path=zip_path,
+                            deploy_path=deploy_path,
+                            username=username,
+                            transport=transport,
+                            sftp_channels=channels,
+                        )
+                        elapsed = time.monotonic() - started
+                        if not success:
+                            raise CommandError(f'{name}: {message}')
+                        timings.append(elapsed)
+                    results[name] = timings
+            finally:
+                self._cleanup(target, base_path)
+
+        self.stdout.write('')
+        self.stdout.write(f'{"Способ":<10}{"лучшее, с":>12}{"среднее, с":>12}{"файлов/с":>12}{"МБ/с":>10}')
+        for transport, timings in results.items():
+            best = min(timings)
+            average = sum(timings) / len(timings)
+            self.stdout.write(
+                f'{transport:<10}{best:>12.3f}{average:>12.3f}'
+                f'{files_count / best:>12.1f}{total_size / best / 1024 / 1024:>10.2f}'
+            )
+
+        if len(results) > 1:
+            fastest = min(results, key=lambda t: min(results[t]))
+            slowest = max(results, key=lambda t: min(results[t]))
+            speedup = min(results[slowest]) / min(results[fastest])
+            self.stdout.write(self.style.SUCCESS(f'✅ {fastest} быстрее {slowest} в {speedup:.1f} раза'))
+
+    def _resolve_target(self, options):
+        if options['host']:
+            if not options['username'] or not options['password']:
+                raise CommandError('С --host нужно указать --username и --password')
+            target = SSHTarget(
+                host=options['host'],
+                port=options['port'],
+                username=options['username'],
+                password=options['password'],
+            )
+            base_path = options['path'] or f"/home/{options['username']}/nimble-bench"
+            return target, options['username'], base_path
+
+        servers = VPSServer.objects.filter(is_active=True)
+        if options['server']:
+            server = servers.filter(pk=options['server']).first()
+        else:
+            server = servers.order_by('-is_default', 'id').first()
+        if not server:
+            raise CommandError('Не найден активный VPS сервер')
+        base_path = options['path'] or f'{server.deploy_path}/.nimble-bench'
+        return SSHTarget.from_server(server), server.username, base_path
+
+    def _build_site(self, zip_path, files, size):
+        """Сайт из index.html, styles.css и множества мелких несжимаемых файлов"""
+        total = 0
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as archive:
+            links = []
+            for i in range(files):
+                name = f'assets/{i // 100:03d}/file-{i:05d}.txt'
+                data = os.urandom(size // 2).hex().encode()
+                archive.writestr(name, data)
+                links.append(f'<a href="{name}">{i}</a>')
+                total += len(data)
+            index = f'<!DOCTYPE html><html><body>{"".join(links)}</body></html>'.encode()
+            styles = b'body { margin: 0; }'
+            archive.writestr('index.html', index)
+            archive.writestr('styles.css', styles)
+            total += len(index) + len(styles)
+        return total
+
+    def _cleanup(self, target, base_path):
+        with get_ssh_pool().connection(target) as ssh:
+            script = RemoteScript()
+            script.add('удаление тестовых файлов', f'rm -rf {shlex.quote(base_path)}', sudo=True, critical=False)
+            script.run(ssh)
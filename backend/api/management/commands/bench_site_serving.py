@@ -0,0 +1,45 @@
+import shutil
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from api.subdomain_utils import get_deploy_path
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает отдачу файла сайта через /api/deployed/ и по поддомену (SubdomainSiteMiddleware)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Количество запросов для каждого способа')
+        parser.add_argument('--size', type=int, default=4096, help='Размер тестового файла в байтах')
+
+    def handle(self, *args, **options):
+        subdomain = 'bench-site-serving'
+        deploy_path = get_deploy_path(subdomain)
+        deploy_path.mkdir(parents=True, exist_ok=True)
+        (deploy_path / 'index.html').write_text('x' * options['size'])
+        host = f"{subdomain}.{settings.DEPLOY_BASE_DOMAIN}"
+        try:
+            with override_settings(DEPLOY_SUBDOMAIN_HOSTING=True):
+                client = Client()
+                variants = [
+                    ('/api/deployed/', lambda: client.get(f'/api/deployed/{subdomain}/')),
+                    ('поддомен', lambda: client.get('/', HTTP_HOST=host)),
+                ]
+                results = {}
+                for name, request in variants:
+                    response = request()
+                    if response.status_code != 200:
+                        self.stderr.write(f'{name}: ответ {response.status_code}')
+                        return
+                    started = time.perf_counter()
+                    for _ in range(options['requests']):
+                        request()
+                    results[name] = options['requests'] / (time.perf_counter() - started)
+                    self.stdout.write(f'{name}: {results[name]:.0f} запросов/с')
+        finally:
+            shutil.rmtree(deploy_path, ignore_errors=True)
+
+        base, subdomain_rps = results['/api/deployed/'], results['поддомен']
+        self.stdout.write(self.style.SUCCESS(f'Поддомен быстрее в {subdomain_rps / base:.1f} раза'))
@@ -0,0 +1,94 @@
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from api.models import Project, ProjectContent
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет списки проектов (/api/projects/ и /api/auth/my-projects/) на пользователе с большим числом '
+        'проектов: число запросов на страницу, отсутствие содержимого сайтов в SQL и пиковую память. '
+        'Тестовые данные создаются в транзакции и откатываются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', type=int, default=10000, help='Количество проектов у пользователя')
+        parser.add_argument('--content-size', type=int, default=20000, help='Размер HTML и CSS каждого проекта')
+        parser.add_argument('--page-size', type=int, default=100, help='Размер страницы')
+        parser.add_argument('--max-queries', type=int, default=3, help='Допустимое число запросов на страницу')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._check(options)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def _check(self, options):
+        user = User.objects.create(username=f'check-project-list-{time.time_ns()}')
+        content = '<div>' + 'x' * options['content_size'] + '</div>'
+        Project.objects.bulk_create(
+            [Project(user=user, title=f'Проект {i}', slug=f'project-{i}') for i in range(options['projects'])],
+            batch_size=500,
+        )
+        ProjectContent.objects.bulk_create(
+            [
+                ProjectContent(project_id=project_id, html_content=content, css_content=content)
+                for project_id in Project.objects.filter(user=user).values_list('id', flat=True)
+            ],
+            batch_size=500,
+        )
+        self.stdout.write(f"Создано {options['projects']} проектов по {len(content) * 2 / 1024:.0f} КБ содержимого")
+
+        client = APIClient()
+        client.force_authenticate(user)
+        failures = []
+        for url in ('/api/projects/', '/api/auth/my-projects/'):
+            ids = []
+            pages = 0
+            max_queries = 0
+            heavy_sql = False
+            next_url = f"{url}?page_size={options['page_size']}"
+            tracemalloc.start()
+            started = time.perf_counter()
+            while next_url:
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get(next_url)
+                if response.status_code != 200:
+                    raise CommandError(f'{url}: ответ {response.status_code}')
+                data = response.json()
+                ids.extend(item['id'] for item in data['results'])
+                pages += 1
+                max_queries = max(max_queries, len(queries))
+                heavy_sql = heavy_sql or any(
+                    ProjectContent._meta.db_table in query['sql'] for query in queries.captured_queries
+                )
+                next_url = data['next']
+            elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            self.stdout.write(
+                f'{url}: {pages} страниц за {elapsed:.2f} с, до {max_queries} запросов на страницу, '
+                f'пиковая память {peak / 1024 / 1024:.1f} МБ'
+            )
+            if len(ids) != options['projects'] or len(set(ids)) != len(ids):
+                failures.append(f'{url}: получено {len(set(ids))} уникальных проектов из {options["projects"]}')
+            if max_queries > options['max_queries']:
+                failures.append(f'{url}: {max_queries} запросов на страницу (допустимо {options["max_queries"]})')
+            if heavy_sql:
+                failures.append(f'{url}: SQL списка загружает содержимое сайтов')
+
+        if failures:
+            raise CommandError('\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Списки проектов в порядке'))
@@ -0,0 +1,93 @@
+import shlex
+from typing import Iterable
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api.models import Project, ViewLogImport, VPSServer
+from api.ssh_pool import SSHTarget, get_ssh_pool
+from api.view_counter import add_views, count_log_views
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует просмотры сайтов из access log Nginx на VPS серверах конструктора '
+        '(или из локального файла лога) в Project.views_count; повторный запуск учитывает только новые строки. '
+        'У сервера конструктора один домен и один лог, поэтому серверы, на которые деплоились несколько проектов, '
+        'пропускаются: просмотры в их логе нельзя разделить по проектам'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--server',
+            type=int,
+            action='append',
+            help='ID VPS сервера (можно указать несколько раз, по умолчанию - активные серверы с настройкой Nginx)',
+        )
+        parser.add_argument('--log', help='Локальный файл access log (например, скопированный со своего VPS)')
+        parser.add_argument('--project', type=int, help='ID проекта для --log')
+        parser.add_argument('--dry-run', action='store_true', help='Посчитать просмотры без записи в БД')
+
+    def handle(self, *args, **options):
+        if options['log']:
+            if not options['project']:
+                raise CommandError('Для --log нужен --project')
+            project = Project.objects.filter(id=options['project']).first()
+            if project is None:
+                raise CommandError(f"Проект {options['project']} не найден")
+            with open(options['log'], encoding='utf-8', errors='replace') as lines:
+                self._import(f"file:{options['log']}", project, lines, options['dry_run'])
+            return
+
+        servers = VPSServer.objects.filter(is_active=True, nginx_config_enabled=True)
+        if options['server']:
+            servers = VPSServer.objects.filter(id__in=options['server'])
+        for server in servers:
+            # Конфиг Nginx сервера (домен и лог) общий для всех проектов, задеплоенных на сервер
+            projects = list(Project.objects.filter(deploy_manifests__vps_server=server).distinct()[:2])
+            if not projects:
+                self.stdout.write(f'{server.name}: нет задеплоенных проектов')
+                continue
+            if len(projects) > 1:
+                self.stderr.write(
+                    f'{server.name}: пропущен - на сервер деплоились несколько проектов, '
+                    'просмотры в общем логе нельзя разделить по проектам'
+                )
+                continue
+            domain = server.domain or server.host
+            log_path = f"/var/log/nginx/{domain.replace('.', '-')}_access.log"
+            try:
+                with get_ssh_pool().connection(SSHTarget.from_server(server)) as ssh:
+                    lines = self._remote_lines(ssh, log_path)
+                    self._import(f"server:{server.id}:{log_path}", projects[0], lines, options['dry_run'])
+            except Exception as e:
+                self.stderr.write(f'{server.name}: ошибка чтения {log_path}: {e}')
+
+    @staticmethod
+    def _remote_lines(ssh, log_path: str) -> Iterable[str]:
+        """Строки ротированного (.1) и текущего лога по порядку; через sudo, если он доступен без пароля"""
+        read = ' '.join(
+            f'[ -r {shlex.quote(path)} ] && cat {shlex.quote(path)};' for path in (f'{log_path}.1', log_path)
+        )
+        command = f'if sudo -n true 2>/dev/null; then sudo -n sh -c {shlex.quote(read)}; else sh -c {shlex.quote(read)}; fi'
+        stdin, stdout, stderr = ssh.exec_command(command, timeout=300)
+        for line in stdout:
+            yield line
+
+    def _import(self, source: str, project: Project, lines: Iterable[str], dry_run: bool) -> int:
+        # Позиция блокируется на время подсчёта: параллельный запуск не учтёт те же строки дважды
+        with transaction.atomic():
+            ViewLogImport.objects.get_or_create(source=source)
+            cursor = ViewLogImport.objects.select_for_update().get(source=source)
+            views, last_time, last_lines = count_log_views(lines, cursor.last_time, cursor.last_time_lines)
+            self.stdout.write(f'{source}: {views} просмотров для проекта {project.id} ({project.title})')
+            if dry_run:
+                transaction.set_rollback(True)
+                return views
+
+            add_views({project.id: views})
+            cursor.project = project
+            cursor.last_time = last_time
+            cursor.last_time_lines = last_lines
+            cursor.views += views
+            cursor.save()
+        return views
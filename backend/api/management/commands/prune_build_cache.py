@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.site_builder import get_site_builder
+from api.site_images import get_image_cache
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из build_cache давно не использованные сборки сайтов и оптимизированные изображения '
+        'сверх SITE_BUILD_CACHE_MAX_BYTES и SITE_IMAGE_CACHE_MAX_BYTES и брошенные временные директории'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Посчитать удаляемое без изменений на диске')
+
+    def handle(self, *args, **options):
+        removed, freed = get_site_builder().prune(dry_run=options['dry_run'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Сборок сайтов удалено: {removed} ({freed / 2**20:.1f} МБ, '
+            f'лимит {settings.SITE_BUILD_CACHE_MAX_BYTES / 2**20:.0f} МБ)'
+        ))
+        removed, freed = get_image_cache().prune(dry_run=options['dry_run'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Изображений удалено: {removed} ({freed / 2**20:.1f} МБ, '
+            f'лимит {settings.SITE_IMAGE_CACHE_MAX_BYTES / 2**20:.0f} МБ)'
+        ))
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.revisions import compact_chunks, prune_revisions
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет ревизии проектов по политике хранения (PROJECT_REVISION_KEEP_LAST, PROJECT_REVISION_KEEP_DAYS) '
+        'и фрагменты содержимого, на которые больше не ссылается ни одна ревизия'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, help='Только ревизии этого проекта (фрагменты очищаются все)')
+        parser.add_argument('--dry-run', action='store_true', help='Посчитать удаляемое без изменений в БД')
+
+    def handle(self, *args, **options):
+        removed = prune_revisions(options['project'], dry_run=options['dry_run'])
+        self.stdout.write(
+            f"Ревизий удалено: {removed} (хранятся последние {settings.PROJECT_REVISION_KEEP_LAST}, "
+            f"остальные - по одной за час/день до {settings.PROJECT_REVISION_KEEP_DAYS} дней)"
+        )
+        # В пробном запуске ревизии не удалены, поэтому считаются только уже ненужные фрагменты
+        chunks, freed = compact_chunks(dry_run=options['dry_run'])
+        self.stdout.write(self.style.SUCCESS(f'Фрагментов удалено: {chunks} ({freed / 1024:.0f} КБ)'))
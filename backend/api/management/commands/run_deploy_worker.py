@@ -0,0 +1,48 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.deploy_queue import DeployWorkerPool
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркер, выполняющий задачи деплоя из очереди в БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.DEPLOY_WORKER_CONCURRENCY,
+            help='Количество одновременно выполняемых деплоев',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Интервал опроса очереди в секундах',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить задачи, которые уже стоят в очереди, и завершиться',
+        )
+
+    def handle(self, *args, **options):
+        pool = DeployWorkerPool(
+            concurrency=options['concurrency'],
+            poll_interval=options['poll_interval'],
+        )
+
+        def shutdown(signum, frame):
+            self.stdout.write('Остановка воркера: ожидание текущих деплоев...')
+            pool.stop()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'🚀 Воркер деплоя {pool.worker_name} запущен (параллельно: {pool.concurrency})'
+            )
+        )
+        pool.serve_forever(once=options['once'])
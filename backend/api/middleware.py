@@ -0,0 +1,59 @@
+"""
+Виртуальные хосты для сайтов на поддоменах конструктора: запросы к <поддомен>.DEPLOY_BASE_DOMAIN отдаются
+из директории сайта до остальных middleware (сессии, CSRF, авторизация) и разбора URL.
+"""
+from django.conf import settings
+from django.core.exceptions import DisallowedHost, MiddlewareNotUsed
+from django.http import Http404, HttpResponseNotAllowed, HttpResponseNotFound
+from .site_serving import serve_site_file
+
+
+def split_host(host: str) -> str:
+    """Хост без порта в нижнем регистре"""
+    host = host.lower().rstrip('.')
+    if host.startswith('['):
+        return host.split(']', 1)[0] + ']'
+    return host.rsplit(':', 1)[0] if ':' in host else host
+
+
+class SubdomainSiteMiddleware:
+    """
+    Отдаёт задеплоенные сайты по заголовку Host. Должна стоять первой в MIDDLEWARE: ответ для сайта
+    возвращается без вызова следующих middleware. Запросы к основному домену и зарезервированным
+    поддоменам (DEPLOY_RESERVED_SUBDOMAINS) проходят дальше без изменений.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DEPLOY_SUBDOMAIN_HOSTING:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.suffix = '.' + split_host(settings.DEPLOY_BASE_DOMAIN)
+        self.reserved = frozenset(settings.DEPLOY_RESERVED_SUBDOMAINS)
+
+    def __call__(self, request):
+        subdomain = self.site_subdomain(request)
+        if subdomain is None:
+            return self.get_response(request)
+
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        path = request.path_info.lstrip('/')
+        if not path or path.endswith('/'):
+            path += 'index.html'
+        try:
+            return serve_site_file(request, subdomain, path)
+        except Http404:
+            return HttpResponseNotFound('Not Found', content_type='text/plain; charset=utf-8')
+
+    def site_subdomain(self, request):
+        """Поддомен сайта из Host или None, если запрос не к сайту"""
+        try:
+            host = split_host(request.get_host())
+        except DisallowedHost:
+            return None
+        if not host.endswith(self.suffix):
+            return None
+        subdomain = host[:-len(self.suffix)]
+        if not subdomain or '.' in subdomain or subdomain in self.reserved:
+            return None
+        return subdomain
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_change_deploy_type_to_builder_vps'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeployJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deploy_type', models.CharField(choices=[('vps', 'VPS (свой сервер)'), ('builder_vps', 'VPS сервер конструктора')], default='vps', max_length=20, verbose_name='Тип деплоя')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('success', 'Успешно'), ('failed', 'Ошибка')], default='queued', max_length=20, verbose_name='Статус')),
+                ('stage', models.CharField(blank=True, max_length=20, verbose_name='Текущий этап')),
+                ('stages', models.JSONField(blank=True, default=list, verbose_name='Этапы')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='Параметры деплоя')),
+                ('archive_path', models.CharField(max_length=500, verbose_name='Путь к архиву сайта')),
+                ('message', models.TextField(blank=True, verbose_name='Сообщение')),
+                ('result', models.JSONField(blank=True, default=dict, verbose_name='Результат')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток')),
+                ('worker', models.CharField(blank=True, max_length=255, verbose_name='Воркер')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начата')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='Последняя активность')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершена')),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deploy_jobs', to='api.project', verbose_name='Проект')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deploy_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('vps_server', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deploy_jobs', to='api.vpsserver', verbose_name='VPS сервер')),
+            ],
+            options={
+                'verbose_name': 'Задача деплоя',
+                'verbose_name_plural': 'Задачи деплоя',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='api_deployj_status_55d34c_idx'), models.Index(fields=['user', 'created_at'], name='api_deployj_user_id_751d54_idx')],
+            },
+        ),
+    ]
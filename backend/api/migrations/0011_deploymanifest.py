@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_deployjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeployManifest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_key', models.CharField(max_length=64, unique=True, verbose_name='Ключ цели деплоя')),
+                ('target', models.CharField(max_length=1000, verbose_name='Цель деплоя')),
+                ('files', models.JSONField(blank=True, default=dict, verbose_name='Файлы')),
+                ('total_size', models.BigIntegerField(default=0, verbose_name='Общий размер')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлён')),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deploy_manifests', to='api.project', verbose_name='Проект')),
+            ],
+            options={
+                'verbose_name': 'Манифест деплоя',
+                'verbose_name_plural': 'Манифесты деплоя',
+                'ordering': ['-updated_at'],
+            },
+        ),
+    ]
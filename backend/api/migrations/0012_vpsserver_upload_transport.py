@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_deploymanifest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vpsserver',
+            name='upload_transport',
+            field=models.CharField(choices=[('sftp', 'SFTP (по одному файлу)'), ('tar', 'Поток tar по SSH (один канал)')], default='sftp', help_text='tar быстрее для сайтов из множества мелких файлов, требует tar и sha256sum на сервере', max_length=10, verbose_name='Способ загрузки файлов'),
+        ),
+    ]
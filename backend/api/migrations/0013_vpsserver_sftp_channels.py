@@ -0,0 +1,24 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:24
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_vpsserver_upload_transport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vpsserver',
+            name='sftp_channels',
+            field=models.PositiveSmallIntegerField(default=4, help_text='Одновременных загрузок файлов через SFTP в одном SSH подключении (1-8)', validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(8)], verbose_name='Параллельных SFTP каналов'),
+        ),
+        migrations.AlterField(
+            model_name='vpsserver',
+            name='upload_transport',
+            field=models.CharField(choices=[('sftp', 'SFTP (параллельные каналы)'), ('tar', 'Поток tar по SSH (один канал)')], default='sftp', help_text='tar быстрее для сайтов из множества мелких файлов, требует tar и sha256sum на сервере', max_length=10, verbose_name='Способ загрузки файлов'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_vpsserver_sftp_channels'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deploymanifest',
+            name='current_release',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Текущий релиз'),
+        ),
+        migrations.AddField(
+            model_name='deploymanifest',
+            name='deploy_path',
+            field=models.CharField(blank=True, max_length=500, verbose_name='Путь деплоя'),
+        ),
+        migrations.AddField(
+            model_name='deploymanifest',
+            name='host',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Хост'),
+        ),
+        migrations.AddField(
+            model_name='deploymanifest',
+            name='port',
+            field=models.IntegerField(default=22, verbose_name='SSH порт'),
+        ),
+        migrations.AddField(
+            model_name='deploymanifest',
+            name='username',
+            field=models.CharField(blank=True, max_length=100, verbose_name='SSH пользователь'),
+        ),
+        migrations.AddField(
+            model_name='deploymanifest',
+            name='vps_server',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deploy_manifests', to='api.vpsserver', verbose_name='VPS сервер конструктора'),
+        ),
+        migrations.CreateModel(
+            name='DeployRelease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('release_id', models.CharField(max_length=64, verbose_name='ID релиза')),
+                ('files', models.JSONField(blank=True, default=dict, verbose_name='Файлы')),
+                ('total_size', models.BigIntegerField(default=0, verbose_name='Общий размер')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='releases', to='api.deployjob', verbose_name='Задача деплоя')),
+                ('manifest', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='releases', to='api.deploymanifest', verbose_name='Цель деплоя')),
+            ],
+            options={
+                'verbose_name': 'Релиз',
+                'verbose_name_plural': 'Релизы',
+                'ordering': ['-release_id'],
+                'unique_together': {('manifest', 'release_id')},
+            },
+        ),
+    ]
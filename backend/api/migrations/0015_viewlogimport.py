@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_deployrelease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ViewLogImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=1000, unique=True, verbose_name='Источник')),
+                ('last_time', models.DateTimeField(blank=True, null=True, verbose_name='Время последней строки')),
+                ('last_time_lines', models.IntegerField(default=0, verbose_name='Строк с этим временем')),
+                ('views', models.BigIntegerField(default=0, verbose_name='Импортировано просмотров')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлён')),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='view_log_imports', to='api.project', verbose_name='Проект')),
+            ],
+            options={
+                'verbose_name': 'Импорт просмотров',
+                'verbose_name_plural': 'Импорт просмотров',
+                'ordering': ['-updated_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_viewlogimport'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['user', '-updated_at', 'id'], name='api_project_user_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_project_user_updated_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectContent',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='content', serialize=False, to='api.project', verbose_name='Проект')),
+                ('html_content', models.TextField(blank=True, verbose_name='HTML содержимое')),
+                ('css_content', models.TextField(blank=True, verbose_name='CSS содержимое')),
+                ('json_content', models.JSONField(blank=True, default=dict, verbose_name='JSON данные GrapesJS')),
+                ('header_settings', models.JSONField(blank=True, default=dict, verbose_name='Настройки Header')),
+                ('footer_settings', models.JSONField(blank=True, default=dict, verbose_name='Настройки Footer')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Содержимое проекта',
+                'verbose_name_plural': 'Содержимое проектов',
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:49
+
+from django.db import migrations
+
+CONTENT_FIELDS = ('html_content', 'css_content', 'json_content', 'header_settings', 'footer_settings')
+BATCH_SIZE = 200  # Содержимое проекта может занимать мегабайты: копируется небольшими пачками
+
+
+def copy_to_content(apps, schema_editor):
+    """Переносит содержимое сайтов из строк Project в ProjectContent"""
+    Project = apps.get_model('api', 'Project')
+    ProjectContent = apps.get_model('api', 'ProjectContent')
+    last_id = 0
+    while True:
+        batch = list(
+            Project.objects.filter(id__gt=last_id).order_by('id').values('id', *CONTENT_FIELDS)[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        ProjectContent.objects.bulk_create(
+            [ProjectContent(project_id=row['id'], **{field: row[field] for field in CONTENT_FIELDS}) for row in batch],
+            ignore_conflicts=True,
+        )
+        last_id = batch[-1]['id']
+
+
+def copy_to_project(apps, schema_editor):
+    """Обратный перенос содержимого в строки Project"""
+    Project = apps.get_model('api', 'Project')
+    ProjectContent = apps.get_model('api', 'ProjectContent')
+    for content in ProjectContent.objects.order_by('project_id').iterator(chunk_size=BATCH_SIZE):
+        Project.objects.filter(id=content.project_id).update(
+            **{field: getattr(content, field) for field in CONTENT_FIELDS}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_projectcontent'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_to_content, copy_to_project),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:49
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_copy_project_content'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='project',
+            name='css_content',
+        ),
+        migrations.RemoveField(
+            model_name='project',
+            name='footer_settings',
+        ),
+        migrations.RemoveField(
+            model_name='project',
+            name='header_settings',
+        ),
+        migrations.RemoveField(
+            model_name='project',
+            name='html_content',
+        ),
+        migrations.RemoveField(
+            model_name='project',
+            name='json_content',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_move_project_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectcontent',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, verbose_name='Ревизия'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:53
+
+import api.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_projectcontent_revision'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='projectcontent',
+            name='css_content',
+            field=api.fields.CompressedTextField(blank=True, default='', verbose_name='CSS содержимое'),
+        ),
+        migrations.AlterField(
+            model_name='projectcontent',
+            name='html_content',
+            field=api.fields.CompressedTextField(blank=True, default='', verbose_name='HTML содержимое'),
+        ),
+        migrations.AlterField(
+            model_name='projectcontent',
+            name='json_content',
+            field=api.fields.CompressedJSONField(blank=True, default=dict, verbose_name='JSON данные GrapesJS'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:53
+
+import json
+
+from django.db import migrations
+
+COMPRESSED_FIELDS = ('html_content', 'css_content', 'json_content')
+BATCH_SIZE = 200
+
+
+def compress_rows(apps, schema_editor):
+    """Перезаписывает содержимое пачками: поля сжимают значения при записи (старые читаются и без этого)"""
+    ProjectContent = apps.get_model('api', 'ProjectContent')
+    last_id = 0
+    while True:
+        batch = list(
+            ProjectContent.objects.filter(project_id__gt=last_id).order_by('project_id')
+            .values('project_id', *COMPRESSED_FIELDS)[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for row in batch:
+            ProjectContent.objects.filter(project_id=row['project_id']).update(
+                **{field: row[field] for field in COMPRESSED_FIELDS}
+            )
+        last_id = batch[-1]['project_id']
+
+
+# Типы колонок до сжатия (MySQL): при откате в них переводятся бинарные колонки
+MYSQL_TEXT_TYPES = {'html_content': 'LONGTEXT', 'css_content': 'LONGTEXT', 'json_content': 'JSON'}
+
+
+def decompress_rows(apps, schema_editor):
+    """Обратно: несжатые UTF-8 значения, которые читаются текстовыми и JSON колонками после отката типа полей"""
+    ProjectContent = apps.get_model('api', 'ProjectContent')
+    quote = schema_editor.quote_name
+    table = quote(ProjectContent._meta.db_table)
+    columns = ', '.join(f'{quote(field)} = %s' for field in COMPRESSED_FIELDS)
+    rows = ProjectContent.objects.order_by('project_id').values_list('project_id', *COMPRESSED_FIELDS)
+    with schema_editor.connection.cursor() as cursor:
+        for project_id, html, css, data in rows.iterator(chunk_size=BATCH_SIZE):
+            cursor.execute(
+                f'UPDATE {table} SET {columns} WHERE project_id = %s',
+                [html, css, json.dumps(data, ensure_ascii=False), project_id],
+            )
+
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    # MySQL не переводит BLOB с двоичной кодировкой в JSON/LONGTEXT при откате 0021 (ALTER ... MODIFY):
+    # колонки переводятся здесь через CONVERT(... USING utf8mb4), и откат 0021 меняет тип на тот же
+    for field, db_type in MYSQL_TEXT_TYPES.items():
+        column, converted = quote(field), quote(f'{field}_text')
+        schema_editor.execute(f'ALTER TABLE {table} ADD COLUMN {converted} {db_type} NULL')
+        schema_editor.execute(f'UPDATE {table} SET {converted} = CONVERT({column} USING utf8mb4)')
+        schema_editor.execute(f'ALTER TABLE {table} DROP COLUMN {column}')
+        schema_editor.execute(f'ALTER TABLE {table} CHANGE {converted} {column} {db_type} NOT NULL')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_compress_project_content'),
+    ]
+
+    operations = [
+        migrations.RunPython(compress_rows, decompress_rows),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:56
+
+import api.fields
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_compress_existing_content'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentChunk',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='SHA-256')),
+                ('data', api.fields.CompressedTextField(verbose_name='Данные')),
+                ('size', models.PositiveIntegerField(verbose_name='Размер')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+            ],
+            options={
+                'verbose_name': 'Фрагмент ревизий',
+                'verbose_name_plural': 'Фрагменты ревизий',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProjectRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('revision', models.PositiveIntegerField(verbose_name='Ревизия содержимого')),
+                ('reason', models.CharField(choices=[('save', 'Сохранение'), ('autosave', 'Автосохранение'), ('manual', 'Сохранена вручную'), ('restore', 'Восстановление')], default='save', max_length=20, verbose_name='Причина')),
+                ('label', models.CharField(blank=True, max_length=255, verbose_name='Название')),
+                ('manifest', models.JSONField(default=dict, verbose_name='Манифест')),
+                ('size', models.BigIntegerField(default=0, verbose_name='Размер содержимого')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Создана')),
+                ('author', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='project_revisions', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('chunks', models.ManyToManyField(related_name='revisions', to='api.contentchunk', verbose_name='Фрагменты')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='api.project', verbose_name='Проект')),
+            ],
+            options={
+                'verbose_name': 'Ревизия проекта',
+                'verbose_name_plural': 'Ревизии проектов',
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['project', '-created_at'], name='api_revision_project_idx')],
+            },
+        ),
+    ]
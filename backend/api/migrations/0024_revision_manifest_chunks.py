@@ -0,0 +1,44 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:07
+
+from django.db import migrations
+
+BATCH_SIZE = 200
+
+
+def chunks_to_manifest(apps, schema_editor):
+    """Список фрагментов ревизии из таблицы связей переносится в manifest["chunks"]"""
+    ProjectRevision = apps.get_model('api', 'ProjectRevision')
+    Link = ProjectRevision.chunks.through
+    for revision in ProjectRevision.objects.order_by('id').iterator(chunk_size=BATCH_SIZE):
+        revision.manifest['chunks'] = list(
+            Link.objects.filter(projectrevision_id=revision.id).values_list('contentchunk_id', flat=True)
+        )
+        revision.save(update_fields=['manifest'])
+
+
+def manifest_to_chunks(apps, schema_editor):
+    ProjectRevision = apps.get_model('api', 'ProjectRevision')
+    Link = ProjectRevision.chunks.through
+    for revision in ProjectRevision.objects.order_by('id').iterator(chunk_size=BATCH_SIZE):
+        Link.objects.bulk_create(
+            [Link(projectrevision_id=revision.id, contentchunk_id=digest)
+             for digest in revision.manifest.pop('chunks', [])],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+        revision.save(update_fields=['manifest'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_project_revisions'),
+    ]
+
+    operations = [
+        migrations.RunPython(chunks_to_manifest, manifest_to_chunks),
+        migrations.RemoveField(
+            model_name='projectrevision',
+            name='chunks',
+        ),
+    ]
@@ -1,10 +1,14 @@
 """
 Модели для хранения проектов
 """
-from django.db import models
+import hashlib
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
+from typing import Any, Optional
+from .fields import CompressedJSONField, CompressedTextField
 
 
 class Subscription(models.Model):
@@ -52,6 +56,29 @@ class Subscription(models.Model):
         return current_count < limit
 
 
+class ProjectQuerySet(models.QuerySet):
+    def for_list(self) -> 'ProjectQuerySet':
+        """Проекты для списков: пользователь загружается тем же запросом (содержимое сайта хранится отдельно)"""
+        return self.select_related('user')
+
+    def with_content(self) -> 'ProjectQuerySet':
+        """Проекты вместе с содержимым сайта и пользователем одним запросом (редактирование, экспорт, сборка)"""
+        return self.select_related('user', 'content')
+
+
+def _content_property(name: str) -> property:
+    """Поле ProjectContent как атрибут проекта: чтение загружает содержимое, запись сохраняется в Project.save()"""
+
+    def getter(self) -> Any:
+        return getattr(self.site_content, name)
+
+    def setter(self, value: Any) -> None:
+        setattr(self.site_content, name, value)
+        self._content_changed = True
+
+    return property(getter, setter)
+
+
 class Project(models.Model):
     """Модель проекта (сайта)"""
     user = models.ForeignKey(
@@ -63,13 +90,13 @@ class Project(models.Model):
     title = models.CharField(max_length=255, verbose_name="Название проекта")
     slug = models.SlugField(max_length=255, verbose_name="URL-адрес")
     description = models.TextField(blank=True, null=True, verbose_name="Описание")
-    html_content = models.TextField(blank=True, verbose_name="HTML содержимое")
-    css_content = models.TextField(blank=True, verbose_name="CSS содержимое")
-    json_content = models.JSONField(default=dict, blank=True, verbose_name="JSON данные GrapesJS")
     
-    # Настройки Header/Footer
-    header_settings = models.JSONField(default=dict, blank=True, verbose_name="Настройки Header")
-    footer_settings = models.JSONField(default=dict, blank=True, verbose_name="Настройки Footer")
+    # Содержимое сайта и настройки Header/Footer хранятся в ProjectContent
+    html_content = _content_property('html_content')
+    css_content = _content_property('css_content')
+    json_content = _content_property('json_content')
+    header_settings = _content_property('header_settings')
+    footer_settings = _content_property('footer_settings')
     
     # Метаданные
     is_published = models.BooleanField(default=False, verbose_name="Опубликован")
@@ -95,6 +122,8 @@ class Project(models.Model):
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлен")
     published_at = models.DateTimeField(null=True, blank=True, verbose_name="Опубликован")
     
+    objects = ProjectQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Проект"
         verbose_name_plural = "Проекты"
@@ -104,17 +133,148 @@ class Project(models.Model):
             models.Index(fields=['user', 'slug']),
             models.Index(fields=['slug', 'is_published']),
             models.Index(fields=['is_published']),
+            # Списки проектов пользователя с курсорной пагинацией (api.pagination.ProjectCursorPagination)
+            models.Index(fields=['user', '-updated_at', 'id'], name='api_project_user_updated_idx'),
         ]
     
     def __str__(self) -> str:
         return self.title
     
+    @property
+    def site_content(self) -> 'ProjectContent':
+        """Содержимое сайта: загружается отдельным запросом при первом обращении, у нового проекта - пустое"""
+        try:
+            return self.content
+        except ProjectContent.DoesNotExist:
+            self.content = ProjectContent(project=self)
+            self._content_changed = True
+            return self.content
+    
     def save(self, *args, **kwargs):
         if self.is_published and not self.published_at:
             self.published_at = timezone.now()
         elif not self.is_published:
             self.published_at = None
+        
+        # Содержимое перезаписывается, только если оно изменено через атрибуты проекта
+        update_fields = kwargs.get('update_fields')
+        save_content = getattr(self, '_content_changed', False) or self._state.adding
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            save_content = save_content and bool(update_fields & set(ProjectContent.FIELDS))
+            kwargs['update_fields'] = update_fields - set(ProjectContent.FIELDS)
+        
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if save_content:
+                content = self.site_content
+                content.project = self
+                content.save()
+                self._content_changed = False
+
+
+class ProjectContent(models.Model):
+    """
+    Содержимое сайта проекта (HTML, CSS, данные GrapesJS, шапка и подвал) в отдельной таблице:
+    списки, деплой и админка работают со строкой Project и не читают и не перезаписывают содержимое
+    """
+    FIELDS = ('html_content', 'css_content', 'json_content', 'header_settings', 'footer_settings')
+
+    project = models.OneToOneField(
+        Project,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='content',
+        verbose_name="Проект"
+    )
+    # Самые объёмные поля хранятся сжатыми (PROJECT_CONTENT_COMPRESSION)
+    html_content = CompressedTextField(default='', blank=True, verbose_name="HTML содержимое")
+    css_content = CompressedTextField(default='', blank=True, verbose_name="CSS содержимое")
+    json_content = CompressedJSONField(default=dict, blank=True, verbose_name="JSON данные GrapesJS")
+    header_settings = models.JSONField(default=dict, blank=True, verbose_name="Настройки Header")
+    footer_settings = models.JSONField(default=dict, blank=True, verbose_name="Настройки Footer")
+    # Увеличивается при каждой записи: частичные изменения (PATCH /projects/{id}/content/) применяются к ревизии
+    revision = models.PositiveIntegerField(default=0, verbose_name="Ревизия")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+
+    class Meta:
+        verbose_name = "Содержимое проекта"
+        verbose_name_plural = "Содержимое проектов"
+
+    def __str__(self) -> str:
+        return f"Содержимое: {self.project_id}"
+
+    def save(self, *args, **kwargs):
+        # Ревизия увеличивается в БД: параллельная запись не может получить тот же номер
+        adding = self._state.adding
+        self.revision = 1 if adding else models.F('revision') + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'revision', 'updated_at'}
         super().save(*args, **kwargs)
+        if not adding:
+            self.refresh_from_db(fields=['revision'])
+
+
+class ContentChunk(models.Model):
+    """
+    Фрагмент содержимого ревизий проектов (часть HTML/CSS или узел дерева JSON), адресуемый по SHA-256:
+    одинаковые фрагменты всех ревизий и проектов хранятся один раз. created_at обновляется, когда новая ревизия
+    снова ссылается на фрагмент, - очистка (revisions.compact_chunks) не удаляет недавно использованные фрагменты
+    """
+    hash = models.CharField(max_length=64, primary_key=True, verbose_name="SHA-256")
+    data = CompressedTextField(verbose_name="Данные")
+    size = models.PositiveIntegerField(verbose_name="Размер")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+
+    class Meta:
+        verbose_name = "Фрагмент ревизий"
+        verbose_name_plural = "Фрагменты ревизий"
+
+    def __str__(self) -> str:
+        return self.hash
+
+
+class ProjectRevision(models.Model):
+    """Снимок содержимого проекта: манифест ссылается на фрагменты ContentChunk по хешам (api.revisions)"""
+    REASONS = [
+        ('save', 'Сохранение'),
+        ('autosave', 'Автосохранение'),
+        ('manual', 'Сохранена вручную'),
+        ('restore', 'Восстановление'),
+    ]
+
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.CASCADE,
+        related_name='revisions',
+        verbose_name="Проект"
+    )
+    revision = models.PositiveIntegerField(verbose_name="Ревизия содержимого")
+    reason = models.CharField(max_length=20, choices=REASONS, default='save', verbose_name="Причина")
+    # Ревизии с названием не удаляются политикой хранения
+    label = models.CharField(max_length=255, blank=True, verbose_name="Название")
+    author = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='project_revisions',
+        verbose_name="Автор"
+    )
+    manifest = models.JSONField(default=dict, verbose_name="Манифест")
+    size = models.BigIntegerField(default=0, verbose_name="Размер содержимого")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Создана")
+
+    class Meta:
+        verbose_name = "Ревизия проекта"
+        verbose_name_plural = "Ревизии проектов"
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['project', '-created_at'], name='api_revision_project_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.project_id} @ {self.revision}"
 
 
 class CustomBlock(models.Model):
@@ -218,6 +378,23 @@ class VPSServer(models.Model):
         default=False,
         verbose_name="Использовать SSL по умолчанию"
     )
+    UPLOAD_TRANSPORTS = [
+        ('sftp', 'SFTP (параллельные каналы)'),
+        ('tar', 'Поток tar по SSH (один канал)'),
+    ]
+    upload_transport = models.CharField(
+        max_length=10,
+        choices=UPLOAD_TRANSPORTS,
+        default='sftp',
+        verbose_name="Способ загрузки файлов",
+        help_text="tar быстрее для сайтов из множества мелких файлов, требует tar и sha256sum на сервере"
+    )
+    sftp_channels = models.PositiveSmallIntegerField(
+        default=4,
+        validators=[MinValueValidator(1), MaxValueValidator(8)],
+        verbose_name="Параллельных SFTP каналов",
+        help_text="Одновременных загрузок файлов через SFTP в одном SSH подключении (1-8)"
+    )
     notes = models.TextField(blank=True, null=True, verbose_name="Заметки")
     
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
@@ -254,3 +431,250 @@ class VPSServer(models.Model):
         self.clean()
         super().save(*args, **kwargs)
 
+
+class DeployJob(models.Model):
+    """Задача деплоя: выполняется воркером вне HTTP-запроса, очередь хранится в БД"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCESS = 'success'
+    STATUS_FAILED = 'failed'
+    STATUSES = [
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_SUCCESS, 'Успешно'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    STAGES = [
+        ('connect', 'Подключение по SSH'),
+        ('upload', 'Загрузка файлов'),
+        ('ssl', 'SSL сертификат'),
+        ('nginx', 'Настройка Nginx'),
+        ('finalize', 'Сохранение результата'),
+    ]
+
+    class Lost(Exception):
+        """Задачу вернули в очередь и забрал другой запуск: этот запуск больше не может её менять"""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='deploy_jobs',
+        verbose_name="Пользователь"
+    )
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='deploy_jobs',
+        verbose_name="Проект"
+    )
+    vps_server = models.ForeignKey(
+        VPSServer,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='deploy_jobs',
+        verbose_name="VPS сервер"
+    )
+    deploy_type = models.CharField(
+        max_length=20,
+        choices=Project.DEPLOY_TYPES,
+        default='vps',
+        verbose_name="Тип деплоя"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUSES,
+        default=STATUS_QUEUED,
+        verbose_name="Статус"
+    )
+    stage = models.CharField(max_length=20, blank=True, verbose_name="Текущий этап")
+    stages = models.JSONField(default=list, blank=True, verbose_name="Этапы")
+
+    # Параметры подключения для своего VPS (пароль стирается после завершения задачи)
+    params = models.JSONField(default=dict, blank=True, verbose_name="Параметры деплоя")
+    archive_path = models.CharField(max_length=500, verbose_name="Путь к архиву сайта")
+
+    message = models.TextField(blank=True, verbose_name="Сообщение")
+    result = models.JSONField(default=dict, blank=True, verbose_name="Результат")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Попыток")
+    worker = models.CharField(max_length=255, blank=True, verbose_name="Воркер")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начата")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="Последняя активность")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершена")
+
+    class Meta:
+        verbose_name = "Задача деплоя"
+        verbose_name_plural = "Задачи деплоя"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['user', 'created_at']),
+        ]
+
+    def __str__(self) -> str:
+        return f"Деплой #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (self.STATUS_SUCCESS, self.STATUS_FAILED)
+
+    def start_stage(self, name: str) -> None:
+        """Отмечает начало этапа и сохраняет прогресс"""
+        now = timezone.now()
+        self.stage = name
+        self.stages = [s for s in self.stages if s.get('name') != name] + [{
+            'name': name,
+            'title': dict(self.STAGES).get(name, name),
+            'status': self.STATUS_RUNNING,
+            'message': '',
+            'started_at': now.isoformat(),
+            'finished_at': None,
+        }]
+        self.heartbeat_at = now
+        self.save_progress('stage', 'stages', 'heartbeat_at')
+
+    def finish_stage(
+        self,
+        name: str,
+        success: bool = True,
+        message: str = '',
+        status: Optional[str] = None,
+        details: Optional[dict] = None
+    ) -> None:
+        """Отмечает завершение этапа (status='skipped' для пропущенных этапов), details - отчёт этапа"""
+        now = timezone.now()
+        for stage in self.stages:
+            if stage.get('name') == name:
+                stage['status'] = status or (self.STATUS_SUCCESS if success else self.STATUS_FAILED)
+                stage['message'] = message
+                stage['finished_at'] = now.isoformat()
+                if details is not None:
+                    stage['details'] = details
+        self.heartbeat_at = now
+        self.save_progress('stages', 'heartbeat_at')
+
+    def claimed(self) -> models.QuerySet:
+        """
+        Эта задача, пока она выполняется тем же запуском: воркер и номер попытки меняются при каждом захвате,
+        поэтому запуск, у которого задачу забрали, не затрёт прогресс и статус нового
+        """
+        return DeployJob.objects.filter(
+            pk=self.pk, status=self.STATUS_RUNNING, worker=self.worker, attempts=self.attempts
+        )
+
+    def save_progress(self, *fields: str) -> None:
+        """Сохраняет поля выполняющейся задачи. Бросает DeployJob.Lost, если задачу забрал другой запуск"""
+        if not self.claimed().update(**{field: getattr(self, field) for field in fields}):
+            raise self.Lost(f"Задача деплоя #{self.pk} выполняется другим воркером")
+
+
+
+class DeployManifest(models.Model):
+    """Манифест последнего деплоя в путь на сервере: хеши и размеры загруженных файлов"""
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='deploy_manifests',
+        verbose_name="Проект"
+    )
+    vps_server = models.ForeignKey(
+        VPSServer,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='deploy_manifests',
+        verbose_name="VPS сервер конструктора"
+    )
+    target_key = models.CharField(max_length=64, unique=True, verbose_name="Ключ цели деплоя")
+    target = models.CharField(max_length=1000, verbose_name="Цель деплоя")
+    host = models.CharField(max_length=255, blank=True, verbose_name="Хост")
+    port = models.IntegerField(default=22, verbose_name="SSH порт")
+    username = models.CharField(max_length=100, blank=True, verbose_name="SSH пользователь")
+    deploy_path = models.CharField(max_length=500, blank=True, verbose_name="Путь деплоя")
+    current_release = models.CharField(max_length=64, blank=True, verbose_name="Текущий релиз")
+    files = models.JSONField(default=dict, blank=True, verbose_name="Файлы")
+    total_size = models.BigIntegerField(default=0, verbose_name="Общий размер")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлён")
+
+    class Meta:
+        verbose_name = "Манифест деплоя"
+        verbose_name_plural = "Манифесты деплоя"
+        ordering = ['-updated_at']
+
+    def __str__(self) -> str:
+        return self.target
+
+    @staticmethod
+    def make_target(host: str, port: int, username: str, deploy_path: str) -> str:
+        return f"{username}@{host}:{port}:{deploy_path}"
+
+    @staticmethod
+    def make_key(target: str) -> str:
+        return hashlib.sha256(target.encode('utf-8')).hexdigest()
+
+
+class DeployRelease(models.Model):
+    """Релиз сайта на сервере: директория releases/<release_id> в пути деплоя и её манифест"""
+    manifest = models.ForeignKey(
+        DeployManifest,
+        on_delete=models.CASCADE,
+        related_name='releases',
+        verbose_name="Цель деплоя"
+    )
+    job = models.ForeignKey(
+        DeployJob,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='releases',
+        verbose_name="Задача деплоя"
+    )
+    release_id = models.CharField(max_length=64, verbose_name="ID релиза")
+    files = models.JSONField(default=dict, blank=True, verbose_name="Файлы")
+    total_size = models.BigIntegerField(default=0, verbose_name="Общий размер")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+
+    class Meta:
+        verbose_name = "Релиз"
+        verbose_name_plural = "Релизы"
+        ordering = ['-release_id']
+        unique_together = [['manifest', 'release_id']]
+
+    def __str__(self) -> str:
+        return f"{self.manifest.target} @ {self.release_id}"
+
+    @property
+    def is_current(self) -> bool:
+        return self.manifest.current_release == self.release_id
+
+
+class ViewLogImport(models.Model):
+    """Позиция импорта просмотров из access log Nginx: строки до неё уже учтены в Project.views_count"""
+    source = models.CharField(max_length=1000, unique=True, verbose_name="Источник")
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='view_log_imports',
+        verbose_name="Проект"
+    )
+    last_time = models.DateTimeField(null=True, blank=True, verbose_name="Время последней строки")
+    last_time_lines = models.IntegerField(default=0, verbose_name="Строк с этим временем")
+    views = models.BigIntegerField(default=0, verbose_name="Импортировано просмотров")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлён")
+
+    class Meta:
+        verbose_name = "Импорт просмотров"
+        verbose_name_plural = "Импорт просмотров"
+        ordering = ['-updated_at']
+
+    def __str__(self) -> str:
+        return self.source
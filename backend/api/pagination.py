@@ -0,0 +1,15 @@
+"""
+Пагинация списков API
+"""
+from rest_framework.pagination import CursorPagination
+
+
+class ProjectCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация проектов по (-updated_at, id): страница выбирается условием по индексу
+    (user, -updated_at, id) без OFFSET и COUNT, поэтому её стоимость не растёт с числом проектов.
+    Ответ: {"next": ..., "previous": ..., "results": [...]}, размер страницы - ?page_size= (до 100).
+    """
+    ordering = ('-updated_at', 'id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,186 @@
+"""
+Пакетное выполнение команд на VPS: все шаги собираются в один shell-скрипт
+и выполняются в одном SSH канале с разбором результата по шагам
+"""
+import shlex
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import paramiko
+
+
+@dataclass
+class RemoteStep:
+    """Шаг скрипта"""
+    name: str
+    command: str
+    sudo: bool = False  # Сначала через sudo, при ошибке без sudo
+    critical: bool = True  # Ошибка критичного шага прерывает оставшиеся шаги
+
+
+@dataclass
+class StepResult:
+    """Результат выполнения шага"""
+    name: str
+    command: str
+    exit_status: Optional[int]  # None, если шаг не выполнялся
+    stdout: str = ''
+    stderr: str = ''
+    used_sudo: bool = False
+    critical: bool = True
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_status == 0
+
+    @property
+    def skipped(self) -> bool:
+        return self.exit_status is None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'command': self.command,
+            'exit_status': self.exit_status,
+            'ok': self.ok,
+            'skipped': self.skipped,
+            'used_sudo': self.used_sudo,
+            'stderr': self.stderr,
+        }
+
+
+@dataclass
+class ScriptResult:
+    """Результаты всех шагов скрипта"""
+    steps: List[StepResult] = field(default_factory=list)
+    exit_status: int = 0
+    raw_stderr: str = ''
+
+    @property
+    def ok(self) -> bool:
+        return self.failed_step is None
+
+    @property
+    def failed_step(self) -> Optional[StepResult]:
+        """Первый проваленный критичный шаг"""
+        for step in self.steps:
+            if step.critical and not step.ok:
+                return step
+        return None
+
+    @property
+    def warnings(self) -> List[StepResult]:
+        """Проваленные некритичные шаги"""
+        return [step for step in self.steps if not step.critical and not step.ok and not step.skipped]
+
+    def get(self, name: str) -> Optional[StepResult]:
+        for step in self.steps:
+            if step.name == name:
+                return step
+        return None
+
+    def error_message(self) -> str:
+        step = self.failed_step
+        if step is None:
+            return ''
+        if step.skipped:
+            return f"Шаг «{step.name}» не выполнен: {self.raw_stderr.strip() or 'скрипт прерван'}"
+        return f"Ошибка на шаге «{step.name}» ({step.command}): {step.stderr.strip() or step.stdout.strip()}"
+
+    def as_list(self) -> List[Dict[str, Any]]:
+        return [step.as_dict() for step in self.steps]
+
+
+class RemoteScript:
+    """
+    Собирает шаги в один скрипт. Вывод каждого шага перенаправляется во временные файлы
+    и печатается между маркерами с уникальным токеном, поэтому stdout/stderr и код
+    возврата каждого шага восстанавливаются из одного потока.
+    """
+
+    def __init__(self):
+        self.steps: List[RemoteStep] = []
+        self.token = f"__NIMBLE_{uuid.uuid4().hex}__"
+
+    def add(self, name: str, command: str, sudo: bool = False, critical: bool = True) -> 'RemoteScript':
+        self.steps.append(RemoteStep(name=name, command=command, sudo=sudo, critical=critical))
+        return self
+
+    def render(self) -> str:
+        t = self.token
+        lines = [
+            'o=$(mktemp) || exit 97',
+            'e=$(mktemp) || exit 97',
+            "trap 'rm -f \"$o\" \"$e\"' EXIT",
+            'abort=',
+        ]
+        for index, step in enumerate(self.steps):
+            if step.sudo:
+                run = (
+                    f'sudo -n sh -c {shlex.quote(step.command)} >"$o" 2>"$e"; rc=$?; su=1\n'
+                    f'  if [ $rc -ne 0 ]; then {{ {step.command} ; }} >"$o" 2>"$e" </dev/null; rc=$?; su=0; fi'
+                )
+            else:
+                run = f'{{ {step.command} ; }} >"$o" 2>"$e" </dev/null; rc=$?; su=0'
+            on_fail = 'abort=1' if step.critical else ':'
+            lines.append(
+                f'if [ -z "$abort" ]; then\n'
+                f'  {run}\n'
+                f'  printf \'\\n{t} STATUS {index} %d %d\\n\' "$rc" "$su"\n'
+                f'  printf \'{t} STDOUT {index}\\n\'; cat "$o"\n'
+                f'  printf \'\\n{t} STDERR {index}\\n\'; cat "$e"\n'
+                f'  printf \'\\n{t} END {index}\\n\'\n'
+                f'  [ $rc -eq 0 ] || {on_fail}\n'
+                f'fi'
+            )
+        return '\n'.join(lines) + '\n'
+
+    def parse(self, output: str) -> List[StepResult]:
+        results = [
+            StepResult(name=step.name, command=step.command, exit_status=None, critical=step.critical)
+            for step in self.steps
+        ]
+        t = self.token
+        current = None
+        section = None
+        buffers: Dict[str, List[str]] = {}
+
+        for line in output.split('\n'):
+            if line.startswith(t):
+                parts = line[len(t):].split()
+                marker, index = parts[0], int(parts[1])
+                if marker == 'STATUS':
+                    current = results[index]
+                    current.exit_status = int(parts[2])
+                    current.used_sudo = parts[3] == '1'
+                    buffers = {'STDOUT': [], 'STDERR': []}
+                elif marker in ('STDOUT', 'STDERR'):
+                    section = marker
+                elif marker == 'END' and current is not None:
+                    # Последний перевод строки добавлен скриптом перед маркером
+                    current.stdout = '\n'.join(buffers['STDOUT'])
+                    current.stderr = '\n'.join(buffers['STDERR'])
+                    current = section = None
+                continue
+            if current is not None and section:
+                buffers[section].append(line)
+
+        return results
+
+    def run(self, ssh: paramiko.SSHClient, timeout: int = 120) -> ScriptResult:
+        """Выполняет скрипт в одном канале"""
+        from .deploy_utils import safe_decode
+
+        stdin, stdout, stderr = ssh.exec_command('sh -s', timeout=timeout)
+        stdin.write(self.render())
+        stdin.channel.shutdown_write()
+
+        output = safe_decode(stdout.read())
+        raw_stderr = safe_decode(stderr.read())
+        exit_status = stdout.channel.recv_exit_status()
+
+        return ScriptResult(
+            steps=self.parse(output),
+            exit_status=exit_status,
+            raw_stderr=raw_stderr,
+        )
@@ -0,0 +1,310 @@
+"""
+История содержимого проектов. Ревизия (ProjectRevision) хранит не копию полей, а манифест со ссылками на фрагменты
+ContentChunk, адресуемые по SHA-256 (список всех фрагментов ревизии - manifest["chunks"]), поэтому каждая ревизия
+добавляет в хранилище только изменённые фрагменты:
+- HTML и CSS режутся на фрагменты по границам, которые зависят от содержимого, а не от смещения: правка меняет
+  один-два фрагмента, остальные совпадают с фрагментами прошлых ревизий;
+- JSON (данные GrapesJS, шапка, подвал) хранится деревом: объекты и массивы от JSON_NODE_MIN_SIZE байт становятся
+  отдельными узлами со ссылками на дочерние узлы, и неизменённые поддеревья остаются теми же узлами; большие узлы
+  (например, список компонентов страницы) делятся на сегменты так же, как текст.
+Автосохранения создают ревизию не чаще раза в PROJECT_REVISION_AUTOSAVE_INTERVAL секунд на проект.
+"""
+import hashlib
+import json
+import zlib
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from .json_patch import TEXT_TOKEN_RE, make_json_patch, make_text_splices
+from .models import ContentChunk, ProjectContent, ProjectRevision
+
+TEXT_FIELDS = ('html_content', 'css_content')
+JSON_FIELDS = ('json_content', 'header_settings', 'footer_settings')
+TEXT_CHUNK_MIN_SIZE = 2048
+TEXT_CHUNK_MAX_SIZE = 32768
+TEXT_CHUNK_BOUNDARY_MASK = 0x1f  # После минимального размера граница в среднем на каждом 32-м токене
+JSON_NODE_MIN_SIZE = 1024  # Меньшие значения хранятся внутри родительского узла
+JSON_SEGMENT_MAX_SIZE = 16384
+JSON_SEGMENT_BOUNDARY_MASK = 0x7
+COMPACT_GRACE = timedelta(minutes=10)  # Фрагменты и ревизии моложе считаются используемыми при очистке
+HOURLY_RETENTION = timedelta(days=1)  # За последние сутки хранится ревизия на каждый час, раньше - на каждый день
+BATCH_SIZE = 500
+
+
+class RevisionDamaged(ValueError):
+    """В хранилище нет фрагментов ревизии: её содержимое нельзя собрать"""
+
+
+def _put(chunks: Dict[str, str], data: str) -> str:
+    digest = hashlib.sha256(data.encode('utf-8')).hexdigest()
+    chunks.setdefault(digest, data)
+    return digest
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def split_text(text: str) -> List[str]:
+    """Фрагменты текста: граница после токена с подходящим crc32, но не раньше TEXT_CHUNK_MIN_SIZE символов"""
+    pieces, current, size = [], [], 0
+    for token in TEXT_TOKEN_RE.findall(text):
+        current.append(token)
+        size += len(token)
+        if size >= TEXT_CHUNK_MAX_SIZE or (
+            size >= TEXT_CHUNK_MIN_SIZE and not zlib.crc32(token.encode('utf-8')) & TEXT_CHUNK_BOUNDARY_MASK
+        ):
+            pieces.append(''.join(current))
+            current, size = [], 0
+    if current:
+        pieces.append(''.join(current))
+    return pieces
+
+
+def _store_json(value: Any, chunks: Dict[str, str]) -> Tuple[Any, bool, int]:
+    """Значение или хеш его узла, признак ссылки и размер значения в JSON"""
+    if isinstance(value, dict):
+        entries = [(key, *_store_json(child, chunks)) for key, child in value.items()]
+        size = 2 + sum(len(_dumps(key)) + 1 + child_size for key, _, _, child_size in entries)
+    elif isinstance(value, list):
+        entries = [(index, *_store_json(child, chunks)) for index, child in enumerate(value)]
+        size = 1 + sum(child_size + 1 for _, _, _, child_size in entries)
+    else:
+        return value, False, len(_dumps(value))
+    if size < JSON_NODE_MIN_SIZE:
+        return value, False, size
+    return _store_node(isinstance(value, dict), entries, chunks), True, size
+
+
+def _node(is_object: bool, entries: List[Tuple[Any, Any, bool, int]]) -> Dict[str, Any]:
+    """Узел объекта - {"o": {...}, "r": [ключи-ссылки]}, узел массива - {"a": [...], "r": [индексы-ссылки]}"""
+    if is_object:
+        return {'o': {key: item for key, item, _, _ in entries}, 'r': [key for key, _, is_ref, _ in entries if is_ref]}
+    return {'a': [item for _, item, _, _ in entries], 'r': [i for i, (_, _, is_ref, _) in enumerate(entries) if is_ref]}
+
+
+def _store_node(is_object: bool, entries: List[Tuple[Any, Any, bool, int]], chunks: Dict[str, str]) -> str:
+    """
+    Хеш узла. Большой узел делится на сегменты {"s": [хеши], "k": "o"|"a"} по границам, зависящим от элементов:
+    изменение одного элемента меняет только его сегмент и список сегментов
+    """
+    segments, current, size = [], [], 0
+    for entry in entries:
+        key, item, is_ref, item_size = entry
+        current.append(entry)
+        size += len(item) + 2 if is_ref else item_size
+        boundary = not zlib.crc32(_dumps([key if is_object else 0, item]).encode('utf-8')) & JSON_SEGMENT_BOUNDARY_MASK
+        if size >= JSON_SEGMENT_MAX_SIZE or (size >= JSON_NODE_MIN_SIZE and boundary):
+            segments.append(current)
+            current, size = [], 0
+    if current:
+        segments.append(current)
+    if len(segments) == 1:
+        return _put(chunks, _dumps(_node(is_object, entries)))
+    return _put(chunks, _dumps({
+        's': [_put(chunks, _dumps(_node(is_object, segment))) for segment in segments],
+        'k': 'o' if is_object else 'a',
+    }))
+
+
+def _load_json(digest: str, chunks: Dict[str, str]) -> Any:
+    node = json.loads(chunks[digest])
+    if 's' in node:
+        parts = [_load_json(segment, chunks) for segment in node['s']]
+        if node['k'] == 'o':
+            return {key: value for part in parts for key, value in part.items()}
+        return [value for part in parts for value in part]
+    if 'o' in node:
+        value = node['o']
+        for key in node['r']:
+            value[key] = _load_json(value[key], chunks)
+    else:
+        value = node['a']
+        for index in node['r']:
+            value[index] = _load_json(value[index], chunks)
+    return value
+
+
+def snapshot(content: ProjectContent) -> Tuple[Dict[str, Any], Dict[str, str], int]:
+    """Манифест содержимого, его фрагменты (хеш -> данные) и размер содержимого в байтах"""
+    manifest, chunks, size = {}, {}, 0
+    for field in TEXT_FIELDS:
+        text = getattr(content, field) or ''
+        manifest[field] = [_put(chunks, piece) for piece in split_text(text)]
+        size += len(text.encode('utf-8'))
+    for field in JSON_FIELDS:
+        value, is_ref, value_size = _store_json(getattr(content, field), chunks)
+        manifest[field] = {'#': value} if is_ref else {'=': value}
+        size += value_size
+    manifest['chunks'] = list(chunks)
+    return manifest, chunks, size
+
+
+def _batches(items: List[str]) -> Iterable[List[str]]:
+    for start in range(0, len(items), BATCH_SIZE):
+        yield items[start:start + BATCH_SIZE]
+
+
+def load_revision(revision: ProjectRevision) -> Dict[str, Any]:
+    """Содержимое ревизии: поля ProjectContent из фрагментов манифеста. Бросает RevisionDamaged, если фрагментов нет"""
+    hashes = revision.manifest.get('chunks', [])
+    chunks = {}
+    for batch in _batches(hashes):
+        chunks.update(ContentChunk.objects.filter(hash__in=batch).values_list('hash', 'data'))
+    missing = len(set(hashes) - chunks.keys())
+    if missing:
+        raise RevisionDamaged(f'Ревизия #{revision.id} повреждена: в хранилище нет фрагментов ({missing})')
+    data = {}
+    for field in TEXT_FIELDS:
+        data[field] = ''.join(chunks[digest] for digest in revision.manifest.get(field, []))
+    for field in JSON_FIELDS:
+        item = revision.manifest.get(field, {'=': {}})
+        data[field] = _load_json(item['#'], chunks) if '#' in item else item['=']
+    return data
+
+
+def current_content(content: ProjectContent) -> Dict[str, Any]:
+    return {field: getattr(content, field) for field in ProjectContent.FIELDS}
+
+
+def diff_content(source: Dict[str, Any], target: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Изменённые поля и изменения, превращающие source в target: фрагменты текста для HTML/CSS и JSON Patch для
+    JSON - в тех же форматах, что принимает PATCH /projects/{id}/content/
+    """
+    changes = {}
+    for field in TEXT_FIELDS:
+        if source[field] != target[field]:
+            changes[field] = make_text_splices(source[field], target[field])
+    for field in JSON_FIELDS:
+        if source[field] != target[field]:
+            changes[field] = make_json_patch(source[field], target[field])
+    return changes
+
+
+def create_revision(
+    content: ProjectContent,
+    reason: str = 'save',
+    author: Optional[User] = None,
+    label: str = '',
+) -> ProjectRevision:
+    """
+    Ревизия текущего содержимого проекта. Если содержимое не изменилось с последней ревизии и название не задано,
+    возвращается последняя ревизия
+    """
+    manifest, chunks, size = snapshot(content)
+    latest = ProjectRevision.objects.filter(project_id=content.project_id).first()
+    if latest and not label and latest.manifest == manifest:
+        return latest
+
+    # Фрагменты последней ревизии уже в хранилище и не удаляются очисткой, пока ревизия есть. Остальные могут быть
+    # фрагментами без ссылок, которые compact_chunks удаляет прямо сейчас: обновление created_at (с блокировкой строк
+    # до конца транзакции) выводит их из-под очистки, а удалённые до этого записываются заново
+    known = set(latest.manifest.get('chunks', [])) if latest else set()
+    new = [digest for digest in chunks if digest not in known]
+    now = timezone.now()
+    with transaction.atomic():
+        existing = set()
+        for batch in _batches(new):
+            ContentChunk.objects.filter(hash__in=batch).update(created_at=now)
+            existing.update(ContentChunk.objects.filter(hash__in=batch).values_list('hash', flat=True))
+        ContentChunk.objects.bulk_create(
+            [ContentChunk(hash=digest, data=chunks[digest], size=len(chunks[digest].encode('utf-8')))
+             for digest in new if digest not in existing],
+            batch_size=100,
+            ignore_conflicts=True,
+        )
+        return ProjectRevision.objects.create(
+            project_id=content.project_id,
+            revision=content.revision,
+            reason=reason,
+            label=label,
+            author=author,
+            manifest=manifest,
+            size=size,
+        )
+
+
+def autosave_revision(content: ProjectContent, author: Optional[User] = None) -> Optional[ProjectRevision]:
+    """
+    Ревизия автосохранения, если у проекта нет ревизий за PROJECT_REVISION_AUTOSAVE_INTERVAL секунд, иначе None:
+    частые сохранения редактора не снимают и не хешируют всё содержимое. Текущее содержимое всегда в ProjectContent,
+    а перед восстановлением ревизии оно сохраняется в историю
+    """
+    since = timezone.now() - timedelta(seconds=settings.PROJECT_REVISION_AUTOSAVE_INTERVAL)
+    if ProjectRevision.objects.filter(project_id=content.project_id, created_at__gte=since).exists():
+        return None
+    return create_revision(content, 'autosave', author)
+
+
+def expired_revisions(revisions: List[Tuple[int, str, Any]], now) -> List[int]:
+    """
+    ID ревизий проекта (id, название, время; от новых к старым), удаляемых политикой хранения: остаются последние
+    PROJECT_REVISION_KEEP_LAST, ревизии с названием, последняя за каждый час прошедших суток и за каждый день
+    до PROJECT_REVISION_KEEP_DAYS дней
+    """
+    keep_days = timedelta(days=settings.PROJECT_REVISION_KEEP_DAYS)
+    expired, buckets = [], set()
+    for index, (revision_id, label, created_at) in enumerate(revisions):
+        age = now - created_at
+        bucket = created_at.strftime('%Y-%m-%d %H') if age <= HOURLY_RETENTION else created_at.date()
+        if index < settings.PROJECT_REVISION_KEEP_LAST or label:
+            buckets.add(bucket)
+        elif age > keep_days or bucket in buckets:
+            expired.append(revision_id)
+        else:
+            buckets.add(bucket)
+    return expired
+
+
+def prune_revisions(project_id: Optional[int] = None, dry_run: bool = False) -> int:
+    """Удаляет ревизии по политике хранения (expired_revisions); возвращает их количество"""
+    now = timezone.now()
+    projects = ProjectRevision.objects.order_by('project_id').values_list('project_id', flat=True).distinct()
+    if project_id is not None:
+        projects = projects.filter(project_id=project_id)
+    removed = 0
+    for project in projects:
+        revisions = ProjectRevision.objects.filter(project_id=project).values_list('id', 'label', 'created_at')
+        expired = expired_revisions(list(revisions), now)
+        removed += len(expired)
+        if not dry_run:
+            for start in range(0, len(expired), BATCH_SIZE):
+                ProjectRevision.objects.filter(id__in=expired[start:start + BATCH_SIZE]).delete()
+    return removed
+
+
+def _referenced_chunks(revisions) -> Set[str]:
+    hashes = set()
+    for manifest in revisions.values_list('manifest', flat=True).iterator(chunk_size=BATCH_SIZE):
+        hashes.update(manifest.get('chunks', []))
+    return hashes
+
+
+def compact_chunks(dry_run: bool = False) -> Tuple[int, int]:
+    """
+    Удаляет фрагменты, которых нет в манифестах ревизий; возвращает их количество и размер. Фрагменты моложе
+    COMPACT_GRACE не удаляются, а перед удалением каждой пачки заново учитываются ревизии за это время.
+    create_revision обновляет created_at фрагментов, на которые снова ссылается, поэтому удаление проверяет
+    created_at ещё раз: фрагмент новой, ещё не записанной ревизии остаётся в хранилище
+    """
+    started = timezone.now()
+    referenced = _referenced_chunks(ProjectRevision.objects.all())
+    candidates = ContentChunk.objects.filter(created_at__lt=started - COMPACT_GRACE).order_by('hash')
+    removed, freed, last_hash = 0, 0, ''
+    while True:
+        batch = list(candidates.filter(hash__gt=last_hash).values_list('hash', 'size')[:BATCH_SIZE])
+        if not batch:
+            break
+        last_hash = batch[-1][0]
+        orphans = [(digest, size) for digest, size in batch if digest not in referenced]
+        if orphans and not dry_run:
+            recent = _referenced_chunks(ProjectRevision.objects.filter(created_at__gte=started - COMPACT_GRACE))
+            orphans = [(digest, size) for digest, size in orphans if digest not in recent]
+            candidates.filter(hash__in=[digest for digest, _ in orphans]).delete()
+        removed += len(orphans)
+        freed += sum(size for _, size in orphans)
+    return removed, freed
@@ -3,11 +3,44 @@
 """
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Project, Subscription, CustomBlock
+from .models import Project, ProjectRevision, Subscription, CustomBlock, DeployJob, DeployRelease
 from .validators import validate_password_custom, validate_username_english
 
 
-class ProjectSerializer(serializers.ModelSerializer):
+class ProjectContentFields(serializers.Serializer):
+    """
+    Поля содержимого сайта: они хранятся в ProjectContent и доступны через свойства Project,
+    поэтому объявляются явно (ModelSerializer сделал бы свойства полями только для чтения)
+    """
+    html_content = serializers.CharField(required=False, allow_blank=True, trim_whitespace=False)
+    css_content = serializers.CharField(required=False, allow_blank=True, trim_whitespace=False)
+    json_content = serializers.JSONField(required=False)
+    header_settings = serializers.JSONField(required=False)
+    footer_settings = serializers.JSONField(required=False)
+    content_revision = serializers.IntegerField(source='site_content.revision', read_only=True)
+
+
+class TextSpliceSerializer(serializers.Serializer):
+    """Замена delete символов с позиции pos на insert (позиции в единицах UTF-16, как в JavaScript)"""
+    pos = serializers.IntegerField(min_value=0)
+    delete = serializers.IntegerField(min_value=0, default=0)
+    insert = serializers.CharField(allow_blank=True, trim_whitespace=False, default='')
+
+
+class ProjectContentPatchSerializer(serializers.Serializer):
+    """Частичное изменение содержимого проекта относительно ревизии base_revision"""
+    base_revision = serializers.IntegerField(min_value=0)
+    json_patch = serializers.ListField(child=serializers.DictField(), required=False)
+    html = TextSpliceSerializer(many=True, required=False)
+    css = TextSpliceSerializer(many=True, required=False)
+
+    def validate(self, attrs):
+        if not any(attrs.get(name) for name in ('json_patch', 'html', 'css')):
+            raise serializers.ValidationError('Нужны изменения: json_patch, html или css')
+        return attrs
+
+
+class ProjectSerializer(ProjectContentFields, serializers.ModelSerializer):
     """Сериализатор для проекта"""
     user = serializers.ReadOnlyField(source='user.username')
     
@@ -24,6 +57,7 @@ class ProjectSerializer(serializers.ModelSerializer):
             'json_content',
             'header_settings',
             'footer_settings',
+            'content_revision',
             'views_count',
             'deploy_type',
             'deployed_url',
@@ -66,7 +100,7 @@ class ProjectListSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'user', 'views_count', 'created_at', 'updated_at']
 
 
-class ProjectCreateSerializer(serializers.ModelSerializer):
+class ProjectCreateSerializer(ProjectContentFields, serializers.ModelSerializer):
     """Сериализатор для создания проекта"""
     
     class Meta:
@@ -80,6 +114,7 @@ class ProjectCreateSerializer(serializers.ModelSerializer):
             'json_content',
             'header_settings',
             'footer_settings',
+            'content_revision',
         ]
     
     def create(self, validated_data):
@@ -177,7 +212,7 @@ class DeploySerializer(serializers.Serializer):
         default='vps',
         help_text="Тип деплоя"
     )
-    site_zip = serializers.FileField(required=True, help_text="ZIP архив с index.html")
+    site_zip = serializers.FileField(required=False, help_text="ZIP архив с index.html (без него сайт собирается из проекта project_id)")
     # Поля для VPS деплоя
     host = serializers.CharField(required=False, max_length=255, help_text="IP адрес или домен VPS")
     port = serializers.IntegerField(required=False, default=22, min_value=1, max_value=65535, help_text="SSH порт")
@@ -189,6 +224,7 @@ class DeploySerializer(serializers.Serializer):
     nginx_config = serializers.BooleanField(required=False, default=False, help_text="Нужен ли Nginx конфиг")
     enable_ssl = serializers.BooleanField(required=False, default=False, help_text="Получить SSL сертификат через Let's Encrypt")
     project_id = serializers.IntegerField(required=False, allow_null=True, help_text="ID проекта для сохранения информации о деплое")
+    optimize = serializers.BooleanField(required=False, default=True, help_text="Минифицировать HTML/CSS и удалить неиспользуемые CSS правила")
     
     def validate_username(self, value):
         """Валидация имени пользователя"""
@@ -227,6 +263,9 @@ class DeploySerializer(serializers.Serializer):
         """Валидация зависимостей между полями"""
         deploy_type = attrs.get('deploy_type', 'vps')
         
+        if not attrs.get('site_zip') and not attrs.get('project_id'):
+            raise serializers.ValidationError({'site_zip': 'Нужен ZIP архив сайта или project_id для сборки на сервере'})
+        
         if deploy_type == 'vps':
             # Валидация для VPS деплоя
             if not attrs.get('host'):
@@ -257,6 +296,60 @@ class DeploySerializer(serializers.Serializer):
         return attrs
 
 
+class DeployJobSerializer(serializers.ModelSerializer):
+    """Сериализатор статуса задачи деплоя"""
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    
+    class Meta:
+        model = DeployJob
+        fields = [
+            'id',
+            'project',
+            'deploy_type',
+            'status',
+            'status_display',
+            'stage',
+            'stages',
+            'message',
+            'result',
+            'attempts',
+            'created_at',
+            'started_at',
+            'finished_at',
+        ]
+        read_only_fields = fields
+
+
+class DeployReleaseSerializer(serializers.ModelSerializer):
+    """Сериализатор релиза сайта на сервере (без манифеста файлов)"""
+    is_current = serializers.BooleanField(read_only=True)
+    files_count = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = DeployRelease
+        fields = ['release_id', 'is_current', 'files_count', 'total_size', 'job', 'created_at']
+        read_only_fields = fields
+    
+    def get_files_count(self, obj):
+        return len(obj.files or {})
+
+
+class ProjectRevisionSerializer(serializers.ModelSerializer):
+    """Сериализатор ревизии содержимого проекта (без содержимого)"""
+    author = serializers.ReadOnlyField(source='author.username', default=None)
+    
+    class Meta:
+        model = ProjectRevision
+        fields = ['id', 'revision', 'reason', 'label', 'author', 'size', 'created_at']
+        read_only_fields = ['id', 'revision', 'reason', 'author', 'size', 'created_at']
+
+
+class RollbackSerializer(serializers.Serializer):
+    """Сериализатор отката на релиз"""
+    release_id = serializers.CharField(required=False, max_length=64, help_text="ID релиза (по умолчанию - предыдущий)")
+    password = serializers.CharField(required=False, write_only=True, help_text="SSH пароль (для своего VPS)")
+
+
 class CustomBlockSerializer(serializers.ModelSerializer):
     """Сериализатор для кастомного блока"""
     created_by = serializers.ReadOnlyField(source='created_by.username')
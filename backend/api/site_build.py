@@ -0,0 +1,90 @@
+"""
+Стадии сборки сайта перед загрузкой на сервер. Стадия получает SiteBundle, изменяет набор файлов
+(добавляет, заменяет, удаляет) и возвращает отчёт. Стадии выполняются по порядку в run_stages.
+"""
+import gzip
+import posixpath
+from typing import Any, Callable, Dict, List, Optional
+from django.conf import settings
+from .site_bundle import SiteBundle
+from .site_data_uris import extract_data_uris
+from .site_fingerprint import fingerprint_assets
+from .site_images import optimize_images
+from .site_minify import minify_site
+
+try:
+    import brotli
+except ImportError:  # Необязательная зависимость: без неё создаются только .gz
+    brotli = None
+
+
+BuildStage = Callable[[SiteBundle], Dict[str, Any]]
+
+# Текстовые форматы, которые имеет смысл сжимать (изображения кроме svg уже сжаты)
+PRECOMPRESS_EXTENSIONS = (
+    '.html', '.htm', '.css', '.js', '.mjs', '.json', '.map', '.svg', '.xml', '.txt', '.ico', '.webmanifest',
+)
+PRECOMPRESS_MAX_RATIO = 0.9  # Сжатый вариант сохраняется, только если он меньше 90% исходного
+
+
+def gzip_bytes(data: bytes) -> bytes:
+    """gzip без времени в заголовке: одинаковый вход даёт одинаковый выход, дельта-деплой не видит изменений"""
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def precompress(bundle: SiteBundle, min_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Создаёт рядом с текстовыми файлами больше min_size байт сжатые варианты .gz и,
+    если установлен brotli, .br. Nginx отдаёт их через gzip_static/brotli_static без сжатия на лету.
+    """
+    if min_size is None:
+        min_size = settings.SITE_PRECOMPRESS_MIN_SIZE
+
+    report = {'files': 0, 'bytes': 0, 'gzip_bytes': 0, 'brotli_bytes': 0, 'brotli': brotli is not None}
+    for bundle_file in list(bundle):
+        path = bundle_file.path
+        if posixpath.splitext(path)[1].lower() not in PRECOMPRESS_EXTENSIONS or bundle_file.size < min_size:
+            continue
+
+        data = bundle_file.read()
+        variants = {'.gz': gzip_bytes(data)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(data, quality=11)
+
+        compressed = False
+        for suffix, variant in variants.items():
+            if len(variant) > len(data) * PRECOMPRESS_MAX_RATIO:
+                bundle.remove(path + suffix)
+                continue
+            bundle.add_bytes(path + suffix, variant)
+            report['gzip_bytes' if suffix == '.gz' else 'brotli_bytes'] += len(variant)
+            compressed = True
+        if compressed:
+            report['files'] += 1
+            report['bytes'] += len(data)
+    return report
+
+
+# Стадии деплоя на VPS по порядку
+DEPLOY_STAGES: List[BuildStage] = [
+    extract_data_uris,
+    minify_site,
+    optimize_images,
+    fingerprint_assets,
+    precompress,
+]
+# Стадии, которые отключаются параметром optimize=false
+OPTIMIZE_STAGES = (minify_site,)
+
+
+def deploy_stages(optimize: bool = True) -> List[BuildStage]:
+    """Стадии деплоя; без optimize HTML и CSS загружаются как есть"""
+    return [stage for stage in DEPLOY_STAGES if optimize or stage not in OPTIMIZE_STAGES]
+
+
+def run_stages(bundle: SiteBundle, stages: Optional[List[BuildStage]] = None) -> Dict[str, Dict[str, Any]]:
+    """Выполняет стадии по порядку, возвращает отчёты по именам стадий"""
+    reports = {}
+    for stage in DEPLOY_STAGES if stages is None else stages:
+        reports[stage.__name__] = stage(bundle)
+    return reports
@@ -0,0 +1,192 @@
+"""
+Сборка сайта из проекта на сервере: ZIP с index.html, styles.css и images/ для деплоя и отдельная страница
+со встроенными стилями для предпросмотра и экспорта. Шапка и подвал из header_settings/footer_settings
+добавляются, если их ещё нет в html_content. Результат кешируется на диске по хешу полей проекта,
+одновременные запросы одной сборки (из потоков и процессов) ждут одну сборку. Размер кеша ограничен
+SITE_BUILD_CACHE_MAX_BYTES: давно не использованные сборки удаляются (api/build_cache.py).
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import quote
+from django.conf import settings
+from django.template.loader import render_to_string
+from .build_cache import PRUNE_INTERVAL, prune_cache, touch
+from .site_bundle import SiteBundle
+from .site_data_uris import extract_data_uris
+
+
+BUILDER_VERSION = 2  # Увеличивается при изменении шаблонов, чтобы не использовать старые сборки
+CONTENT_FIELDS = ('title', 'html_content', 'css_content', 'header_settings', 'footer_settings')
+LOCK_STRIPES = 64  # Блокировки сборок по хешу: их число не растёт с количеством проектов
+
+DEFAULT_CSS = """* { margin: 0; padding: 0; box-sizing: border-box; }
+body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; }"""
+DEFAULT_NAV_ITEMS = ['О продукте', 'Возможности', 'Тарифы', 'Команда']
+FAVICON_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 32 32">'
+    '<path d="M16 2L28 8V24L16 30L4 24V8L16 2Z" fill="#667eea" stroke="#764ba2" stroke-width="1"/>'
+    '<path d="M11 16L16 11L21 16L16 21L11 16Z" fill="white" fill-opacity="0.9"/></svg>'
+)
+
+
+@dataclass(frozen=True)
+class SiteArtifact:
+    """Собранный сайт в кеше: <root>/<ключ>/ с site.zip и document.html"""
+    key: str
+    path: Path
+
+    @property
+    def zip_path(self) -> Path:
+        return self.path / 'site.zip'
+
+    @property
+    def document_path(self) -> Path:
+        return self.path / 'document.html'
+
+    def document(self) -> str:
+        return self.document_path.read_text(encoding='utf-8')
+
+
+class SiteBuilder:
+    """Сборщик сайтов проектов с дисковым кешем по хешу содержимого"""
+
+    def __init__(self, cache_root: Path, max_bytes: int = 0):
+        self.root = Path(cache_root) / 'sites'
+        self.max_bytes = max_bytes  # 0 - кеш не ограничен
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._pruned_at: Optional[float] = None
+        self.builds = 0  # Количество фактических сборок в процессе (без попаданий в кеш)
+
+    @staticmethod
+    def content_hash(project) -> str:
+        raw = json.dumps(
+            [BUILDER_VERSION] + [getattr(project, name) for name in CONTENT_FIELDS],
+            sort_keys=True, ensure_ascii=False, default=str,
+        )
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def artifact(self, key: str) -> SiteArtifact:
+        return SiteArtifact(key=key, path=self.root / key[:2] / key)
+
+    def build(self, project) -> SiteArtifact:
+        """Возвращает сборку из кеша или собирает сайт; параллельные вызовы с одним хешем собирают его один раз"""
+        artifact = self.artifact(self.content_hash(project))
+        if artifact.path.exists():
+            touch(artifact.path)
+            return artifact
+
+        stripe = int(artifact.key[:8], 16) % LOCK_STRIPES
+        with self._locks[stripe]:
+            # Блокировка потоков внутри процесса, flock - между воркерами gunicorn и воркером деплоя
+            locks_dir = self.root / '.locks'
+            locks_dir.mkdir(parents=True, exist_ok=True)
+            with open(locks_dir / f'{stripe}.lock', 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                if not artifact.path.exists():
+                    self._write(artifact, self.render(project))
+        self._prune_if_due()
+        return artifact
+
+    def prune(self, dry_run: bool = False) -> Tuple[int, int]:
+        """Удаляет давно не использованные сборки сверх max_bytes: (сборок удалено, байт освобождено)"""
+        self._pruned_at = time.monotonic()
+        return prune_cache(self.root, self.max_bytes, dry_run=dry_run)
+
+    def _prune_if_due(self) -> None:
+        """После новой сборки размер кеша проверяется не чаще раза в PRUNE_INTERVAL"""
+        if not self.max_bytes:
+            return
+        if self._pruned_at is None or time.monotonic() - self._pruned_at >= PRUNE_INTERVAL:
+            self.prune()
+
+    def render(self, project) -> Dict[str, str]:
+        """Файлы сайта: index.html со ссылкой на styles.css, styles.css и document.html со встроенными стилями"""
+        html = project.html_content or ''
+        css = project.css_content or ''
+        header_settings = project.header_settings or {}
+        footer_settings = project.footer_settings or {}
+
+        header = ''
+        if header_settings and 'nimble-header' not in html:
+            header = render_to_string('site/header.html', self._header_context(header_settings))
+        footer = ''
+        if footer_settings and 'nimble-footer' not in html:
+            footer = render_to_string('site/footer.html', self._footer_context(footer_settings))
+        if (header or footer) and '.nimble-header' not in css:
+            css = f"{css}\n{render_to_string('site/header_footer.css')}"
+        if not css.strip():
+            css = DEFAULT_CSS
+
+        context = {
+            'title': project.title,
+            'favicon': f"data:image/svg+xml,{quote(FAVICON_SVG)}",
+            'header': header,
+            'html': html,
+            'footer': footer,
+            'css': css,
+        }
+        return {
+            'index.html': render_to_string('site/index.html', {**context, 'inline_css': False}),
+            'styles.css': css,
+            'document.html': render_to_string('site/index.html', {**context, 'inline_css': True}),
+        }
+
+    @staticmethod
+    def _header_context(header: Dict[str, Any]) -> Dict[str, Any]:
+        company_name = str(header.get('companyName') or '')
+        return {
+            'header': header,
+            'nav_items': header.get('navItems') or DEFAULT_NAV_ITEMS,
+            'logo_fallback': (company_name.strip()[:2] or 'NM').upper(),
+        }
+
+    @staticmethod
+    def _footer_context(footer: Dict[str, Any]) -> Dict[str, Any]:
+        copyright_text = '© '.join(str(footer.get('copyright') or '').split('©')).strip()
+        return {'footer': footer, 'copyright': copyright_text or '© 2025 Nimble'}
+
+    def _write(self, artifact: SiteArtifact, files: Dict[str, str]) -> None:
+        """Запись через временную директорию и rename: читатели не видят недописанную сборку"""
+        artifact.path.parent.mkdir(parents=True, exist_ok=True)
+        temp = Path(tempfile.mkdtemp(dir=artifact.path.parent, prefix='.tmp-'))
+        try:
+            # В ZIP изображения из data URI выносятся в images/, document.html остаётся одним файлом
+            bundle = SiteBundle()
+            bundle.add_bytes('index.html', files['index.html'].encode('utf-8'))
+            bundle.add_bytes('styles.css', files['styles.css'].encode('utf-8'))
+            extract_data_uris(bundle)
+            with zipfile.ZipFile(temp / 'site.zip', 'w', zipfile.ZIP_DEFLATED) as archive:
+                for bundle_file in bundle:
+                    archive.writestr(bundle_file.path, bundle_file.read())
+            (temp / 'document.html').write_text(files['document.html'], encoding='utf-8')
+            os.rename(temp, artifact.path)
+        except OSError:
+            if not artifact.path.exists():
+                raise
+        else:
+            self.builds += 1
+        finally:
+            shutil.rmtree(temp, ignore_errors=True)
+
+
+_builder: Optional[SiteBuilder] = None
+_builder_lock = threading.Lock()
+
+
+def get_site_builder() -> SiteBuilder:
+    """Возвращает общий для процесса сборщик сайтов"""
+    global _builder
+    with _builder_lock:
+        if _builder is None:
+            _builder = SiteBuilder(settings.SITE_BUILD_CACHE_ROOT, settings.SITE_BUILD_CACHE_MAX_BYTES)
+        return _builder
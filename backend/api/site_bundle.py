@@ -0,0 +1,215 @@
+"""
+Файлы сайта из ZIP архива без распаковки на диск: каждый файл читается потоком
+и копируется в место назначения (удалённый SFTP файл или локальный файл) блоками
+"""
+import hashlib
+import io
+import os
+import posixpath
+import shutil
+import tempfile
+import uuid
+import zipfile
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+from django.core.exceptions import ValidationError
+
+
+CHUNK_SIZE = 64 * 1024
+
+# Служебные файлы архиваторов, которые не должны попадать на сервер
+IGNORED_PREFIXES = ('__MACOSX/',)
+IGNORED_NAMES = ('.DS_Store', 'Thumbs.db')
+
+
+def normalize_member_path(name: str) -> Optional[str]:
+    """Нормализует имя файла в архиве; None для директорий и служебных файлов. Бросает ValidationError для путей вне сайта"""
+    name = name.replace('\\', '/')
+    if name.endswith('/'):
+        return None
+    if name.startswith(IGNORED_PREFIXES) or posixpath.basename(name) in IGNORED_NAMES:
+        return None
+
+    path = posixpath.normpath(name)
+    if path.startswith('/') or path == '..' or path.startswith('../'):
+        raise ValidationError(f"Недопустимый путь в архиве: {name}")
+    return path
+
+
+def copy_stream(source: BinaryIO, destination: BinaryIO, chunk_size: int = CHUNK_SIZE) -> int:
+    """Копирует поток блоками фиксированного размера, возвращает количество байт"""
+    total = 0
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        destination.write(chunk)
+        total += len(chunk)
+    return total
+
+
+@dataclass
+class BundleFile:
+    """Файл сайта: путь относительно корня сайта, размер и способ открыть содержимое потоком"""
+    path: str
+    size: int
+    opener: Callable[[], BinaryIO]
+    _sha256: Optional[str] = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def from_bytes(cls, path: str, data: bytes) -> 'BundleFile':
+        """Файл, созданный стадией сборки (api.site_build), содержимое хранится в памяти"""
+        return cls(path=path, size=len(data), opener=lambda: io.BytesIO(data))
+
+    @classmethod
+    def from_path(cls, path: str, source: Path) -> 'BundleFile':
+        """Файл, содержимое которого лежит на диске и читается при открытии"""
+        return cls(path=path, size=os.path.getsize(source), opener=lambda: open(source, 'rb'))
+    
+    def open(self) -> BinaryIO:
+        return self.opener()
+
+    def read(self) -> bytes:
+        with self.open() as stream:
+            return stream.read()
+
+    def sha256(self) -> str:
+        """SHA-256 содержимого (считается потоком, результат кешируется)"""
+        if self._sha256 is None:
+            digest = hashlib.sha256()
+            with self.open() as stream:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            self._sha256 = digest.hexdigest()
+        return self._sha256
+
+    @property
+    def directory(self) -> str:
+        return posixpath.dirname(self.path)
+
+
+class SiteBundle:
+    """
+    Набор файлов сайта. Используется как контекстный менеджер,
+    пока он открыт, файлы читаются напрямую из архива.
+    """
+
+    def __init__(self, files: Optional[Dict[str, BundleFile]] = None):
+        self.files: Dict[str, BundleFile] = dict(files or {})
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._temp_dir: Optional[Path] = None
+
+    @classmethod
+    def from_zip(cls, zip_path: str) -> 'SiteBundle':
+        """Открывает архив и описывает его файлы без распаковки. Бросает zipfile.BadZipFile"""
+        bundle = cls()
+        archive = zipfile.ZipFile(zip_path, 'r')
+        bundle._zip = archive
+        try:
+            for info in archive.infolist():
+                path = normalize_member_path(info.filename)
+                if path is None:
+                    continue
+                bundle.files[path] = BundleFile(
+                    path=path,
+                    size=info.file_size,
+                    opener=lambda info=info: archive.open(info, 'r'),
+                )
+        except Exception:
+            bundle.close()
+            raise
+        return bundle
+
+    def close(self) -> None:
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+        if self._temp_dir is not None:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
+
+    def temp_dir(self) -> Path:
+        """Временная директория для файлов, созданных стадиями сборки; удаляется при закрытии набора"""
+        if self._temp_dir is None:
+            self._temp_dir = Path(tempfile.mkdtemp(prefix='site-bundle-'))
+        return self._temp_dir
+
+    def __enter__(self) -> 'SiteBundle':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.files
+
+    def __iter__(self) -> Iterator[BundleFile]:
+        return iter(self.files[path] for path in sorted(self.files))
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def get(self, path: str) -> Optional[BundleFile]:
+        return self.files.get(path)
+    
+    def add(self, bundle_file: BundleFile) -> BundleFile:
+        """Добавляет или заменяет файл"""
+        self.files[bundle_file.path] = bundle_file
+        return bundle_file
+    
+    def add_bytes(self, path: str, data: bytes) -> BundleFile:
+        return self.add(BundleFile.from_bytes(path, data))
+
+    def add_file(self, path: str, source: Path) -> BundleFile:
+        """
+        Добавляет файл с диска, не читая его в память: жёсткая ссылка (или копия) во временной директории
+        набора, поэтому источник может быть удалён до загрузки (например, при очистке кеша)
+        """
+        target = self.temp_dir() / uuid.uuid4().hex
+        try:
+            os.link(source, target)
+        except OSError:  # Источник на другой файловой системе
+            shutil.copyfile(source, target)
+        return self.add(BundleFile.from_path(path, target))
+    
+    def remove(self, path: str) -> None:
+        self.files.pop(path, None)
+
+    def directories(self) -> List[str]:
+        """Все директории, которые нужно создать для файлов сайта (родительские раньше вложенных)"""
+        result = set()
+        for bundle_file in self.files.values():
+            directory = bundle_file.directory
+            while directory:
+                result.add(directory)
+                directory = posixpath.dirname(directory)
+        return sorted(result, key=lambda d: (d.count('/'), d))
+
+    @property
+    def total_size(self) -> int:
+        return sum(bundle_file.size for bundle_file in self.files.values())
+
+    def manifest(self) -> Dict[str, Dict[str, object]]:
+        """Манифест сайта: путь -> {sha256, size}"""
+        return {
+            bundle_file.path: {'sha256': bundle_file.sha256(), 'size': bundle_file.size}
+            for bundle_file in self
+        }
+
+
+def diff_manifests(
+    current: Dict[str, Dict[str, object]],
+    previous: Optional[Dict[str, Dict[str, object]]]
+) -> Tuple[List[str], List[str], List[str]]:
+    """Сравнивает манифесты: (новые или изменённые, неизменные, удалённые) пути"""
+    previous = previous or {}
+    changed, unchanged = [], []
+    for path, entry in current.items():
+        old = previous.get(path)
+        if old and old.get('sha256') == entry['sha256'] and old.get('size') == entry['size']:
+            unchanged.append(path)
+        else:
+            changed.append(path)
+    removed = sorted(path for path in previous if path not in current)
+    return sorted(changed), sorted(unchanged), removed
@@ -0,0 +1,80 @@
+"""
+Вынос встроенных изображений (data:image/...;base64) из HTML и CSS в отдельные файлы images/<хеш>.<ext>.
+GrapesJS встраивает загруженные изображения в html_content и css_content: отдельными файлами они
+кешируются браузером и проходят оптимизацию изображений при сборке. Одинаковые изображения сохраняются один раз.
+"""
+import base64
+import binascii
+import hashlib
+import posixpath
+import re
+from typing import Any, Dict, Optional
+from django.conf import settings
+from .site_bundle import SiteBundle
+
+
+DATA_URI_RE = re.compile(r'data:image/([a-z0-9.+-]+);base64,([A-Za-z0-9+/]+={0,2})(?![A-Za-z0-9+/=])', re.I)
+DATA_URI_EXTENSIONS = {
+    'png': 'png',
+    'jpeg': 'jpg',
+    'jpg': 'jpg',
+    'gif': 'gif',
+    'webp': 'webp',
+    'avif': 'avif',
+    'svg+xml': 'svg',
+    'x-icon': 'ico',
+    'vnd.microsoft.icon': 'ico',
+}
+IMAGES_DIR = 'images'
+
+
+def extract_data_uris(bundle: SiteBundle, min_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Стадия сборки: заменяет data URI изображений от min_size байт (по умолчанию SITE_INLINE_IMAGE_MAX_SIZE)
+    в HTML и CSS файлах ссылками на файлы в images/. Меньшие изображения и некорректный base64 не меняются.
+    """
+    if min_size is None:
+        min_size = settings.SITE_INLINE_IMAGE_MAX_SIZE
+
+    report = {'images': 0, 'references': 0, 'bytes': 0, 'kept_inline': 0}
+    extracted: Dict[str, str] = {}  # sha256 -> путь файла
+
+    for bundle_file in list(bundle):
+        if not bundle_file.path.endswith(('.html', '.htm', '.css')):
+            continue
+        try:
+            text = bundle_file.read().decode('utf-8')
+        except UnicodeDecodeError:
+            continue
+        base_dir = bundle_file.directory
+        references = 0
+
+        def replace(match: 're.Match') -> str:
+            nonlocal references
+            extension = DATA_URI_EXTENSIONS.get(match.group(1).lower())
+            if extension is None:
+                return match.group(0)
+            try:
+                data = base64.b64decode(match.group(2), validate=True)
+            except (binascii.Error, ValueError):
+                return match.group(0)
+            if len(data) < min_size:
+                report['kept_inline'] += 1
+                return match.group(0)
+
+            digest = hashlib.sha256(data).hexdigest()
+            path = extracted.get(digest)
+            if path is None:
+                path = f"{IMAGES_DIR}/{digest[:16]}.{extension}"
+                bundle.add_bytes(path, data)
+                extracted[digest] = path
+                report['images'] += 1
+                report['bytes'] += len(data)
+            references += 1
+            return posixpath.relpath(path, base_dir or '.')
+
+        text = DATA_URI_RE.sub(replace, text)
+        if references:
+            bundle.add_bytes(bundle_file.path, text.encode('utf-8'))
+            report['references'] += references
+    return report
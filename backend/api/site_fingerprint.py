@@ -0,0 +1,173 @@
+"""
+Имена файлов с хешем содержимого (styles.css -> styles.3f9a1c2b.css) и замена ссылок на них в HTML и CSS.
+Nginx кеширует такие файлы на год с immutable, а HTML отдаёт с ревалидацией: после деплоя новая страница
+ссылается на новые имена, и браузер не использует устаревшие стили и скрипты из кеша.
+"""
+import posixpath
+import re
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+from .site_bundle import BundleFile, SiteBundle
+from .site_images import resolve_url
+
+
+FINGERPRINT_LENGTH = 8
+# favicon.ico не переименовывается: браузеры запрашивают /favicon.ico без ссылки из HTML
+FINGERPRINT_EXTENSIONS = (
+    'css', 'js', 'mjs', 'jpg', 'jpeg', 'png', 'gif', 'webp', 'avif', 'svg', 'woff', 'woff2', 'ttf', 'eot',
+)
+FINGERPRINTED_RE = re.compile(rf'\.[0-9a-f]{{{FINGERPRINT_LENGTH}}}\.[^./]+$')
+
+QUOTED_VALUE = r'''(?:"([^"]*)"|'([^']*)'|([^\s>"']+))'''
+URL_ATTR_RE = re.compile(rf'''((?<![\w-])(?:src|href|poster|data-src)\s*=\s*){QUOTED_VALUE}''', re.I)
+SRCSET_ATTR_RE = re.compile(rf'''((?<![\w-])(?:srcset|data-srcset|imagesrcset)\s*=\s*){QUOTED_VALUE}''', re.I)
+CSS_URL_RE = re.compile(r'''(url\(\s*)(?:"([^"]*)"|'([^']*)'|([^'")\s]+))(\s*\))''', re.I)
+CSS_IMPORT_RE = re.compile(r'''(@import\s+)(?:"([^"]*)"|'([^']*)')''', re.I)
+SCRIPT_BLOCK_RE = re.compile(r'<script\b[^>]*>(.*?)</script\s*>', re.I | re.S)
+
+
+def fingerprinted_path(path: str, sha256: str) -> str:
+    stem, ext = posixpath.splitext(path)
+    return f"{stem}.{sha256[:FINGERPRINT_LENGTH]}{ext}"
+
+
+def original_path(path: str) -> str:
+    """Путь файла до переименования: styles.3f9a1c2b.css -> styles.css"""
+    match = FINGERPRINTED_RE.search(path)
+    if not match:
+        return path
+    return path[:match.start()] + posixpath.splitext(path)[1]
+
+
+def rewrite_url(url: str, base_dir: str, mapping: Dict[str, str]) -> Optional[str]:
+    """Новая ссылка на переименованный файл в той же форме (относительная/абсолютная, ?query и #hash сохраняются)"""
+    match = re.match(r'([^?#]*)(.*)', url.strip(), re.S)
+    link, suffix = match.group(1), match.group(2)
+    path = resolve_url(link, base_dir)
+    if path not in mapping:
+        return None
+    old_name = posixpath.basename(path)
+    if not link.endswith(old_name):
+        return None
+    return link[:-len(old_name)] + posixpath.basename(mapping[path]) + suffix
+
+
+def _sub_urls(pattern: 're.Pattern', text: str, replace_value: Callable[[str], Optional[str]]) -> Tuple[str, int]:
+    """Заменяет значения (в кавычках или без) в совпадениях pattern: группа 1 - префикс, 2-4 - значение"""
+    count = 0
+
+    def replace(match: 're.Match') -> str:
+        nonlocal count
+        groups = match.groups()
+        value_index = next(i for i in (1, 2, 3) if i < len(groups) and groups[i] is not None)
+        new_value = replace_value(groups[value_index])
+        if new_value is None:
+            return match.group(0)
+        count += 1
+        quote = {1: '"', 2: "'", 3: ''}[value_index]
+        tail = groups[4] if len(groups) > 4 and groups[4] else ''
+        return f"{groups[0]}{quote}{new_value}{quote}{tail}"
+
+    return pattern.sub(replace, text), count
+
+
+def rewrite_css(css: str, base_dir: str, mapping: Dict[str, str]) -> Tuple[str, int]:
+    """Ссылки url(...) и @import в CSS (относительно директории файла стилей)"""
+    css, urls = _sub_urls(CSS_URL_RE, css, lambda url: rewrite_url(url, base_dir, mapping))
+    css, imports = _sub_urls(CSS_IMPORT_RE, css, lambda url: rewrite_url(url, base_dir, mapping))
+    return css, urls + imports
+
+
+def rewrite_html(html: str, base_dir: str, mapping: Dict[str, str]) -> Tuple[str, int]:
+    """Ссылки в src/href/poster, srcset (<img>, <source>) и url(...) во встроенных стилях"""
+
+    def srcset(value: str) -> Optional[str]:
+        changed = False
+        candidates = []
+        for candidate in value.split(','):
+            parts = candidate.strip().split(None, 1)
+            if parts:
+                new_url = rewrite_url(parts[0], base_dir, mapping)
+                if new_url is not None:
+                    parts[0] = new_url
+                    changed = True
+            candidates.append(' '.join(parts))
+        return ', '.join(candidates) if changed else None
+
+    html, attrs = _sub_urls(URL_ATTR_RE, html, lambda url: rewrite_url(url, base_dir, mapping))
+    html, srcsets = _sub_urls(SRCSET_ATTR_RE, html, srcset)
+    html, styles = rewrite_css(html, base_dir, mapping)
+    return html, attrs + srcsets + styles
+
+
+def fingerprint_assets(bundle: SiteBundle) -> Dict[str, Any]:
+    """
+    Стадия сборки: переименовывает CSS, JS, изображения и шрифты по хешу содержимого и заменяет ссылки
+    в HTML и CSS. Файл не переименовывается, если его имя встречается в скриптах (ссылку нельзя надёжно
+    заменить) или остаётся в HTML/CSS после замены ссылок.
+    """
+    report = {'assets': 0, 'references': 0, 'skipped': 0}
+    texts: Dict[str, str] = {}
+    for bundle_file in bundle:
+        if bundle_file.path.endswith(('.html', '.htm', '.css', '.js', '.mjs')):
+            try:
+                texts[bundle_file.path] = bundle_file.read().decode('utf-8')
+            except UnicodeDecodeError:
+                continue
+
+    scripts = [text for path, text in texts.items() if path.endswith(('.js', '.mjs'))]
+    for path, text in texts.items():
+        if path.endswith(('.html', '.htm')):
+            scripts.extend(SCRIPT_BLOCK_RE.findall(text))
+
+    candidates: Set[str] = set()
+    for bundle_file in bundle:
+        path = bundle_file.path
+        if posixpath.splitext(path)[1][1:].lower() not in FINGERPRINT_EXTENSIONS or FINGERPRINTED_RE.search(path):
+            continue
+        name = posixpath.basename(path)
+        if any(name in script for script in scripts):
+            report['skipped'] += 1
+            continue
+        candidates.add(path)
+
+    # Ссылки, которые не удалось заменить, исключают файл; замена повторяется без него
+    while True:
+        mapping = {
+            path: fingerprinted_path(path, bundle.get(path).sha256())
+            for path in candidates if not path.endswith('.css')
+        }
+        rewritten: Dict[str, str] = {}
+        references = 0
+        # CSS хешируется после замены ссылок на изображения и шрифты внутри него
+        for path, text in texts.items():
+            if path.endswith('.css'):
+                rewritten[path], count = rewrite_css(text, posixpath.dirname(path), mapping)
+                references += count
+        for path in candidates:
+            if path.endswith('.css'):
+                css = rewritten[path].encode('utf-8') if path in rewritten else bundle.get(path).read()
+                mapping[path] = fingerprinted_path(path, BundleFile.from_bytes(path, css).sha256())
+        for path, text in texts.items():
+            if path.endswith(('.html', '.htm')):
+                rewritten[path], count = rewrite_html(text, posixpath.dirname(path), mapping)
+                references += count
+
+        leftovers = {
+            path for path in mapping
+            if any(posixpath.basename(path) in text for text in rewritten.values())
+        }
+        if not leftovers:
+            break
+        candidates -= leftovers
+        report['skipped'] += len(leftovers)
+
+    for path, text in rewritten.items():
+        if text != texts[path]:
+            bundle.add_bytes(path, text.encode('utf-8'))
+    for path, new_path in mapping.items():
+        bundle_file = bundle.get(path)
+        bundle.remove(path)
+        bundle.add(BundleFile(path=new_path, size=bundle_file.size, opener=bundle_file.opener))
+    report['assets'] = len(mapping)
+    report['references'] = references
+    return report
@@ -0,0 +1,362 @@
+"""
+Оптимизация изображений сайта при сборке (Pillow): пережатие, удаление метаданных, уменьшение
+до максимальной ширины, WebP варианты нескольких ширин и <picture>/srcset в HTML.
+Изображения обрабатываются в пуле процессов, результаты кешируются на диске по хешу исходного файла
+(размер кеша ограничен SITE_IMAGE_CACHE_MAX_BYTES, давно не использованные результаты удаляются).
+"""
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from django.conf import settings
+from PIL import Image, ImageOps, features
+from .build_cache import PRUNE_INTERVAL, prune_cache, touch
+from .site_bundle import BundleFile, SiteBundle
+
+
+IMAGE_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG'}
+CACHE_VERSION = 1  # Увеличивается при изменении алгоритма, чтобы не использовать старые результаты
+IN_FLIGHT_PER_WORKER = 2  # Изображений в обработке на процесс пула: пока один результат сохраняется, следующее уже в работе
+
+# <img> и границы <picture> в порядке следования: вложенность отслеживается одним проходом по HTML
+PICTURE_SCAN_RE = re.compile(r'(<img\b[^>]*>)|(<picture(?=[\s/>]))|(</picture\s*>)', re.IGNORECASE)
+ATTR_RE = r'''(?<![\w-]){name}\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))'''
+
+
+def image_options() -> Dict[str, Any]:
+    """Настройки оптимизации; входят в ключ кеша"""
+    return {
+        'version': CACHE_VERSION,
+        'max_width': settings.SITE_IMAGE_MAX_WIDTH,
+        'jpeg_quality': settings.SITE_IMAGE_JPEG_QUALITY,
+        'webp_quality': settings.SITE_IMAGE_WEBP_QUALITY,
+        'srcset_widths': sorted(settings.SITE_IMAGE_SRCSET_WIDTHS),
+        'webp': features.check('webp'),
+    }
+
+
+def optimize_image(data: bytes, image_format: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Оптимизирует одно изображение (выполняется в дочернем процессе).
+    Возвращает {'data', 'width', 'height', 'webp': {ширина: байты}} или {'error'}.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            if getattr(source, 'is_animated', False):
+                return {'data': data, 'width': source.width, 'height': source.height, 'webp': {}}
+            icc_profile = source.info.get('icc_profile')
+            # Поворот из EXIF применяется к пикселям, потому что сами EXIF данные не сохраняются
+            image = ImageOps.exif_transpose(source)
+            image.load()
+
+        resized = False
+        if image.width > options['max_width']:
+            height = max(1, round(image.height * options['max_width'] / image.width))
+            image = image.resize((options['max_width'], height), Image.LANCZOS)
+            resized = True
+
+        output = io.BytesIO()
+        if image_format == 'JPEG':
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            image.save(
+                output, 'JPEG',
+                quality=options['jpeg_quality'], optimize=True, progressive=True, icc_profile=icc_profile
+            )
+        else:
+            image.save(output, 'PNG', optimize=True, icc_profile=icc_profile)
+        optimized = output.getvalue()
+        if not resized and len(optimized) >= len(data):
+            optimized = data
+
+        webp = {}
+        if options['webp']:
+            has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+            webp_source = image.convert('RGBA' if has_alpha else 'RGB')
+            widths = [w for w in options['srcset_widths'] if w < image.width] + [image.width]
+            for width in widths:
+                variant = webp_source
+                if width < image.width:
+                    variant = webp_source.resize(
+                        (width, max(1, round(image.height * width / image.width))), Image.LANCZOS
+                    )
+                output = io.BytesIO()
+                variant.save(output, 'WEBP', quality=options['webp_quality'], method=6)
+                webp[width] = output.getvalue()
+
+        return {'data': optimized, 'width': image.width, 'height': image.height, 'webp': webp}
+    except Exception as e:
+        return {'error': f"{e.__class__.__name__}: {e}"}
+
+
+class ImageCache:
+    """Дисковый кеш результатов optimize_image: <root>/<ключ>/ с meta.json и файлами вариантов"""
+
+    def __init__(self, root: Path, max_bytes: int = 0):
+        self.root = Path(root)
+        self.max_bytes = max_bytes  # 0 - кеш не ограничен
+        self._pruned_at: Optional[float] = None
+
+    @staticmethod
+    def key(data_sha256: str, image_format: str, options: Dict[str, Any]) -> str:
+        raw = json.dumps([data_sha256, image_format, options], sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Результат без чтения файлов: {'image': путь, 'width', 'height', 'webp': {ширина: путь}}"""
+        path = self._path(key)
+        try:
+            meta = json.loads((path / 'meta.json').read_text())
+            result = {
+                'image': path / 'image',
+                'width': meta['width'],
+                'height': meta['height'],
+                'webp': {int(w): path / f'{w}.webp' for w in meta['webp']},
+            }
+        except (OSError, ValueError, KeyError):
+            return None
+        touch(path)
+        return result
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        """Запись через временную директорию и rename: параллельные сборки не видят недописанный результат"""
+        path = self._path(key)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp = Path(tempfile.mkdtemp(dir=path.parent, prefix='.tmp-'))
+        try:
+            (temp / 'image').write_bytes(result['data'])
+            for width, data in result['webp'].items():
+                (temp / f'{width}.webp').write_bytes(data)
+            (temp / 'meta.json').write_text(json.dumps({
+                'width': result['width'],
+                'height': result['height'],
+                'webp': sorted(result['webp']),
+            }))
+            os.rename(temp, path)
+        except OSError:
+            shutil.rmtree(temp, ignore_errors=True)
+
+    def prune(self, dry_run: bool = False) -> Tuple[int, int]:
+        """Удаляет давно не использованные результаты сверх max_bytes: (результатов удалено, байт освобождено)"""
+        self._pruned_at = time.monotonic()
+        return prune_cache(self.root, self.max_bytes, dry_run=dry_run)
+
+    def prune_if_due(self) -> None:
+        """После записи новых результатов размер кеша проверяется не чаще раза в PRUNE_INTERVAL"""
+        if not self.max_bytes:
+            return
+        if self._pruned_at is None or time.monotonic() - self._pruned_at >= PRUNE_INTERVAL:
+            self.prune()
+
+
+_image_cache: Optional[ImageCache] = None
+_image_cache_lock = threading.Lock()
+
+
+def get_image_cache() -> ImageCache:
+    """Возвращает общий для процесса кеш оптимизированных изображений"""
+    global _image_cache
+    with _image_cache_lock:
+        if _image_cache is None:
+            _image_cache = ImageCache(
+                Path(settings.SITE_BUILD_CACHE_ROOT) / 'images', settings.SITE_IMAGE_CACHE_MAX_BYTES
+            )
+        return _image_cache
+
+
+def _optimize_all(
+    jobs: List[Tuple[BundleFile, str, str]],
+    options: Dict[str, Any]
+) -> Iterator[Tuple[Tuple[BundleFile, str, str], Dict[str, Any]]]:
+    """
+    Оптимизирует изображения (файл, формат, ключ) в пуле процессов и отдаёт результаты по мере готовности
+    (одно изображение - без пула). Исходники читаются, только когда в пуле есть место: в памяти не больше
+    IN_FLIGHT_PER_WORKER изображений и их результатов на процесс, а не весь сайт.
+    """
+    if len(jobs) == 1:
+        bundle_file, image_format, _ = jobs[0]
+        yield jobs[0], optimize_image(bundle_file.read(), image_format, options)
+        return
+    workers = min(len(jobs), settings.SITE_IMAGE_WORKERS or os.cpu_count() or 1)
+    queue = iter(jobs)
+    running: Dict[Future, Tuple[BundleFile, str, str]] = {}
+    # spawn: воркер деплоя многопоточный, fork из потока может унаследовать захваченные блокировки
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        while True:
+            for job in islice(queue, workers * IN_FLIGHT_PER_WORKER - len(running)):
+                running[pool.submit(optimize_image, job[0].read(), job[1], options)] = job
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield running.pop(future), future.result()
+
+
+def _webp_paths(bundle: SiteBundle, path: str, widths: List[int]) -> Dict[int, str]:
+    """
+    Имена WebP вариантов: images/photo.webp для полной ширины и images/photo-480w.webp для остальных.
+    Если имя занято (photo.webp в архиве или photo.jpg и photo.png рядом) - images/photo.png.webp.
+    """
+    stem = posixpath.splitext(path)[0]
+    full = f"{stem}.webp"
+    if full in bundle:
+        stem = path
+        full = f"{path}.webp"
+    largest = max(widths)
+    return {w: full if w == largest else f"{stem}-{w}w.webp" for w in widths}
+
+
+def _get_attr(tag: str, name: str) -> Optional[str]:
+    match = re.search(ATTR_RE.format(name=name), tag, re.IGNORECASE)
+    if not match:
+        return None
+    return next(group for group in match.groups() if group is not None)
+
+
+def resolve_url(url: str, base_dir: str) -> Optional[str]:
+    """Путь файла в сайте по относительной ссылке из HTML; None для внешних ссылок и data URI"""
+    url = url.strip().split('#', 1)[0].split('?', 1)[0]
+    if not url or url.startswith(('data:', '//')) or '://' in url:
+        return None
+    if url.startswith('/'):
+        return posixpath.normpath(url.lstrip('/'))
+    return posixpath.normpath(posixpath.join(base_dir, url))
+
+
+def rewrite_picture_tags(html: str, html_path: str, variants: Dict[str, Dict[int, str]]) -> Tuple[str, int]:
+    """
+    Оборачивает <img> с оптимизированными изображениями в <picture> с WebP <source srcset>.
+    Теги с собственным srcset и уже находящиеся внутри <picture> не меняются.
+    """
+    base_dir = posixpath.dirname(html_path)
+    rewritten = 0
+    depth = 0  # Открытых <picture> перед текущим тегом
+
+    def replace(match: 're.Match') -> str:
+        nonlocal rewritten, depth
+        tag = match.group(0)
+        if match.group(2):
+            depth += 1
+            return tag
+        if match.group(3):
+            depth = max(0, depth - 1)
+            return tag
+        if depth or _get_attr(tag, 'srcset') is not None:
+            return tag
+        src = _get_attr(tag, 'src')
+        path = resolve_url(src, base_dir) if src else None
+        if path not in variants:
+            return tag
+
+        srcset = ', '.join(
+            f"{posixpath.relpath(webp_path, base_dir or '.')} {width}w"
+            for width, webp_path in sorted(variants[path].items())
+        )
+        sizes = _get_attr(tag, 'sizes')
+        if not sizes:
+            width = _get_attr(tag, 'width')
+            sizes = f"{width}px" if width and width.isdigit() else '100vw'
+        rewritten += 1
+        return f'<picture><source type="image/webp" srcset="{srcset}" sizes="{sizes}">{tag}</picture>'
+
+    return PICTURE_SCAN_RE.sub(replace, html), rewritten
+
+
+def optimize_images(bundle: SiteBundle) -> Dict[str, Any]:
+    """
+    Стадия сборки: оптимизирует JPEG/PNG, добавляет WebP варианты и переписывает <img> в HTML файлах.
+    Ошибка обработки отдельного изображения оставляет его без изменений.
+    """
+    options = image_options()
+    cache = get_image_cache()
+    report = {
+        'images': 0, 'bytes_before': 0, 'bytes_after': 0, 'webp_files': 0,
+        'cache_hits': 0, 'rewritten_tags': 0, 'errors': {},
+    }
+
+    images: List[Tuple[BundleFile, str, str]] = []
+    for bundle_file in list(bundle):
+        image_format = IMAGE_FORMATS.get(posixpath.splitext(bundle_file.path)[1].lower())
+        if image_format and bundle_file.size:
+            key = ImageCache.key(bundle_file.sha256(), image_format, options)
+            images.append((bundle_file, image_format, key))
+    if not images:
+        return report
+
+    # Результаты хранятся на диске (в кеше или во временной директории набора), в памяти - только пути
+    results: Dict[str, Dict[str, Any]] = {}
+    pending = []
+    for bundle_file, image_format, key in images:
+        cached = cache.get(key)
+        if cached is not None:
+            results[bundle_file.path] = cached
+            report['cache_hits'] += 1
+        else:
+            pending.append((bundle_file, image_format, key))
+
+    if pending:
+        spool: Optional[ImageCache] = None
+        for (bundle_file, _, key), result in _optimize_all(pending, options):
+            if 'error' in result:
+                report['errors'][bundle_file.path] = result['error']
+                continue
+            cache.put(key, result)
+            stored = cache.get(key)
+            if stored is None:  # Кеш недоступен для записи: результат сохраняется до конца деплоя рядом с набором
+                spool = spool or ImageCache(bundle.temp_dir() / 'images')
+                spool.put(key, result)
+                stored = spool.get(key)
+            if stored is None:
+                report['errors'][bundle_file.path] = 'Не удалось сохранить результат оптимизации'
+                continue
+            results[bundle_file.path] = stored
+        cache.prune_if_due()
+
+    variants: Dict[str, Dict[int, str]] = {}
+    for bundle_file, _, _ in images:
+        result = results.get(bundle_file.path)
+        if result is None:
+            continue
+        optimized = BundleFile.from_path(bundle_file.path, result['image'])
+        report['images'] += 1
+        report['bytes_before'] += bundle_file.size
+        report['bytes_after'] += optimized.size
+        if optimized.sha256() != bundle_file.sha256():
+            bundle.add_file(bundle_file.path, result['image'])
+        if result['webp']:
+            paths = _webp_paths(bundle, bundle_file.path, list(result['webp']))
+            for width, source in result['webp'].items():
+                bundle.add_file(paths[width], source)
+                report['webp_files'] += 1
+            variants[bundle_file.path] = paths
+
+    if variants:
+        for bundle_file in list(bundle):
+            if not bundle_file.path.endswith(('.html', '.htm')):
+                continue
+            try:
+                html = bundle_file.read().decode('utf-8')
+            except UnicodeDecodeError:
+                continue
+            html, rewritten = rewrite_picture_tags(html, bundle_file.path, variants)
+            if rewritten:
+                bundle.add_bytes(bundle_file.path, html.encode('utf-8'))
+                report['rewritten_tags'] += rewritten
+
+    return report
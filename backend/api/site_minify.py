@@ -0,0 +1,292 @@
+"""
+Минификация HTML/CSS и удаление CSS правил, селекторы которых не совпадают ни с чем на странице.
+Проверка консервативная: правило удаляется, только если в HTML нет хотя бы одного класса, id или тега
+из селектора. Классы, которые добавляются скриптами во время работы страницы, задаются белым списком
+(settings.SITE_CSS_PURGE_WHITELIST), слова из <script> и .js файлов тоже считаются используемыми классами.
+"""
+import fnmatch
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from django.conf import settings
+from .site_bundle import SiteBundle
+from .site_images import ATTR_RE
+
+
+STRING_RE = r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\''
+CSS_COMMENT_RE = re.compile(rf'({STRING_RE})|/\*.*?\*/', re.S)
+CSS_STRING_SPLIT_RE = re.compile(rf'({STRING_RE})')
+
+HTML_RAW_RE = re.compile(r'<(pre|textarea|script|style)\b[^>]*>.*?</\1\s*>', re.I | re.S)
+HTML_COMMENT_RE = re.compile(r'<!--(?!\[if|<!|>).*?-->', re.S)
+STYLE_BLOCK_RE = re.compile(r'(<style\b[^>]*>)(.*?)(</style\s*>)', re.I | re.S)
+SCRIPT_BLOCK_RE = re.compile(r'<script\b[^>]*>(.*?)</script\s*>', re.I | re.S)
+TAG_RE = re.compile(r'<([a-zA-Z][a-zA-Z0-9-]*)')
+WORD_RE = re.compile(r'[A-Za-z_][\w-]*')
+
+# Правила внутри этих at-правил проверяются как обычные, остальные (@font-face, @keyframes, @page) сохраняются
+CONDITIONAL_AT_RULES = ('media', 'supports', 'document', 'layer', 'container')
+# Теги, которые есть в любом документе, даже если в html_content только фрагмент страницы
+ALWAYS_PRESENT_TAGS = {'html', 'head', 'body'}
+
+SELECTOR_FUNCTION_RE = re.compile(r'(?<!\\)::?[\w-]+\(')
+SELECTOR_CLASS_RE = re.compile(r'\.((?:\\.|[\w-])+)')
+SELECTOR_ID_RE = re.compile(r'#((?:\\.|[\w-])+)')
+SELECTOR_TAG_RE = re.compile(r'(?:^|[\s>+~(])([a-zA-Z][\w-]*)')
+
+
+@dataclass
+class UsedSelectors:
+    """Классы, id и теги, встречающиеся на страницах сайта"""
+    classes: Set[str] = field(default_factory=set)
+    ids: Set[str] = field(default_factory=set)
+    tags: Set[str] = field(default_factory=lambda: set(ALWAYS_PRESENT_TAGS))
+    whitelist: List[str] = field(default_factory=list)
+
+    def add_html(self, html: str) -> None:
+        for value in _attr_values(html, 'class'):
+            self.classes.update(value.split())
+        for value in _attr_values(html, 'id'):
+            self.ids.add(value.strip())
+        self.tags.update(tag.lower() for tag in TAG_RE.findall(html))
+        for script in SCRIPT_BLOCK_RE.findall(html):
+            self.add_script(script)
+
+    def add_script(self, script: str) -> None:
+        """Слова из скриптов: classList.add('open'), getElementById('menu') и т.п."""
+        words = set(WORD_RE.findall(script))
+        self.classes.update(words)
+        self.ids.update(words)
+
+    def has_class(self, name: str) -> bool:
+        return name in self.classes or any(fnmatch.fnmatchcase(name, pattern) for pattern in self.whitelist)
+
+    def may_match(self, selector: str) -> bool:
+        """False, только если селектор точно ничего не выбирает на странице"""
+        selector = _strip_selector_functions(selector)
+        selector = re.sub(r'\[[^\]]*\]', '', selector)  # Атрибуты не проверяются
+        selector = re.sub(r'(?<!\\)::?[\w-]+', '', selector)  # Псевдоклассы и псевдоэлементы (не \: в имени класса)
+
+        for name in SELECTOR_CLASS_RE.findall(selector):
+            if not self.has_class(_unescape(name)):
+                return False
+        for name in SELECTOR_ID_RE.findall(selector):
+            if _unescape(name) not in self.ids:
+                return False
+        for tag in SELECTOR_TAG_RE.findall(selector):
+            if tag.lower() not in self.tags:
+                return False
+        return True
+
+
+def _attr_values(html: str, name: str) -> Iterable[str]:
+    for match in re.finditer(ATTR_RE.format(name=name), html, re.I):
+        yield next(group for group in match.groups() if group is not None)
+
+
+def _unescape(name: str) -> str:
+    return re.sub(r'\\(.)', r'\1', name)
+
+
+def _strip_selector_functions(selector: str) -> str:
+    """Убирает :not(...), :is(...), :has(...) и т.п. вместе с аргументами (они не сужают проверку)"""
+    while True:
+        match = SELECTOR_FUNCTION_RE.search(selector)
+        if not match:
+            return selector
+        depth, i = 1, match.end()
+        while i < len(selector) and depth:
+            depth += {'(': 1, ')': -1}.get(selector[i], 0)
+            i += 1
+        selector = selector[:match.start()] + selector[i:]
+
+
+def strip_css_comments(css: str) -> str:
+    return CSS_COMMENT_RE.sub(lambda m: m.group(1) or '', css)
+
+
+def parse_css_blocks(css: str) -> List[Tuple[str, Optional[str]]]:
+    """
+    Делит CSS (без комментариев) на конструкции верхнего уровня:
+    (селектор или at-правило, содержимое блока) или (at-правило;, None)
+    """
+    items = []
+    depth = 0
+    start = 0
+    prelude = ''
+    block_start = 0
+    i = 0
+    while i < len(css):
+        char = css[i]
+        if char in '"\'':
+            match = re.compile(STRING_RE, re.S).match(css, i)
+            i = match.end() if match else len(css)
+            continue
+        if char == '{':
+            if depth == 0:
+                prelude = css[start:i].strip()
+                block_start = i + 1
+            depth += 1
+        elif char == '}':
+            if depth == 0:
+                start = i + 1  # Лишняя закрывающая скобка
+            else:
+                depth -= 1
+                if depth == 0:
+                    items.append((prelude, css[block_start:i]))
+                    start = i + 1
+        elif char == ';' and depth == 0:
+            statement = css[start:i].strip()
+            if statement:
+                items.append((statement + ';', None))
+            start = i + 1
+        i += 1
+    return items
+
+
+def split_selectors(prelude: str) -> List[str]:
+    """Делит список селекторов по запятым верхнего уровня"""
+    selectors, depth, start = [], 0, 0
+    for i, char in enumerate(prelude):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            selectors.append(prelude[start:i].strip())
+            start = i + 1
+    selectors.append(prelude[start:].strip())
+    return [s for s in selectors if s]
+
+
+def purge_css(css: str, used: UsedSelectors) -> Tuple[str, int]:
+    """Удаляет правила без совпадений на странице; возвращает CSS и количество удалённых правил"""
+    output = []
+    removed = 0
+    for prelude, block in parse_css_blocks(strip_css_comments(css)):
+        if block is None:
+            output.append(prelude)
+            continue
+        if prelude.startswith('@'):
+            name = prelude[1:].split(None, 1)[0].split('(', 1)[0].lower() if len(prelude) > 1 else ''
+            if name in CONDITIONAL_AT_RULES:
+                inner, inner_removed = purge_css(block, used)
+                removed += inner_removed
+                if inner.strip():
+                    output.append(f"{prelude}{{{inner}}}")
+                continue
+            output.append(f"{prelude}{{{block}}}")
+            continue
+
+        selectors = [s for s in split_selectors(prelude) if used.may_match(s)]
+        if selectors:
+            output.append(f"{','.join(selectors)}{{{block}}}")
+        else:
+            removed += 1
+    return '\n'.join(output), removed
+
+
+def minify_css(css: str) -> str:
+    """Удаляет комментарии и лишние пробелы, строки в кавычках не меняются"""
+    parts = CSS_STRING_SPLIT_RE.split(strip_css_comments(css))
+    for i in range(0, len(parts), 2):
+        text = re.sub(r'\s+', ' ', parts[i])
+        text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+        text = re.sub(r':\s+', ':', text)
+        parts[i] = text.replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+def minify_html(html: str, used: Optional[UsedSelectors] = None) -> Tuple[str, int]:
+    """
+    Удаляет комментарии и схлопывает пробелы вне <pre>, <textarea>, <script> и <style>.
+    CSS в <style> минифицируется (и очищается от неиспользуемых правил, если передан used).
+    Возвращает HTML и количество удалённых CSS правил.
+    """
+    removed = 0
+
+    def style(match: 're.Match') -> str:
+        nonlocal removed
+        css = match.group(2)
+        if used is not None:
+            css, count = purge_css(css, used)
+            removed += count
+        return f"{match.group(1)}{minify_css(css)}{match.group(3)}"
+
+    output = []
+    position = 0
+    for match in HTML_RAW_RE.finditer(html):
+        output.append(_collapse_html_text(html[position:match.start()]))
+        raw = match.group(0)
+        if match.group(1).lower() == 'style':
+            raw = STYLE_BLOCK_RE.sub(style, raw)
+        output.append(raw)
+        position = match.end()
+    output.append(_collapse_html_text(html[position:]))
+    return ''.join(output).strip(), removed
+
+
+def _collapse_html_text(text: str) -> str:
+    text = HTML_COMMENT_RE.sub('', text)
+    return re.sub(r'\s+', ' ', text)
+
+
+def default_whitelist() -> List[str]:
+    return list(settings.SITE_CSS_PURGE_WHITELIST)
+
+
+def optimize_html_document(html: str, whitelist: Optional[List[str]] = None) -> Tuple[str, Dict[str, int]]:
+    """Оптимизация одной HTML страницы со встроенными стилями (экспорт проекта)"""
+    used = UsedSelectors(whitelist=default_whitelist() if whitelist is None else whitelist)
+    used.add_html(html)
+    optimized, removed = minify_html(html, used)
+    return optimized, {
+        'bytes_before': len(html.encode('utf-8')),
+        'bytes_after': len(optimized.encode('utf-8')),
+        'rules_removed': removed,
+    }
+
+
+def minify_site(bundle: SiteBundle) -> Dict[str, Any]:
+    """
+    Стадия сборки: CSS файлы и <style> очищаются от правил, не совпадающих ни с одной страницей сайта,
+    HTML и CSS минифицируются. Файлы не в UTF-8 не меняются.
+    """
+    report = {'html_before': 0, 'html_after': 0, 'css_before': 0, 'css_after': 0, 'rules_removed': 0}
+    texts: Dict[str, str] = {}
+    for bundle_file in bundle:
+        if bundle_file.path.endswith(('.html', '.htm', '.css', '.js')):
+            try:
+                texts[bundle_file.path] = bundle_file.read().decode('utf-8')
+            except UnicodeDecodeError:
+                continue
+
+    html_paths = [path for path in texts if path.endswith(('.html', '.htm'))]
+    used = None
+    if html_paths:
+        used = UsedSelectors(whitelist=default_whitelist())
+        for path, text in texts.items():
+            if path in html_paths:
+                used.add_html(text)
+            elif path.endswith('.js'):
+                used.add_script(text)
+
+    for path, text in texts.items():
+        if path.endswith('.css'):
+            css = text
+            if used is not None:
+                css, removed = purge_css(css, used)
+                report['rules_removed'] += removed
+            result = minify_css(css)
+            kind = 'css'
+        elif path in html_paths:
+            result, removed = minify_html(text, used)
+            report['rules_removed'] += removed
+            kind = 'html'
+        else:
+            continue
+        report[f'{kind}_before'] += len(text.encode('utf-8'))
+        report[f'{kind}_after'] += len(result.encode('utf-8'))
+        if result != text:
+            bundle.add_bytes(path, result.encode('utf-8'))
+    return report
@@ -0,0 +1,492 @@
+"""
+Отдача файлов сайтов, задеплоенных на сервер конструктора: условные запросы (ETag по mtime и размеру,
+If-None-Match, If-Modified-Since), диапазоны (один Range, ответ 206), Cache-Control по типу файла и сжатые
+варианты .br/.gz по Accept-Encoding. Небольшие часто запрашиваемые файлы хранятся в LRU кеше воркера
+и проверяются по mtime.
+"""
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+from .site_build import PRECOMPRESS_EXTENSIONS, PRECOMPRESS_MAX_RATIO, brotli, gzip_bytes
+from .site_bundle import CHUNK_SIZE
+from .site_fingerprint import FINGERPRINTED_RE
+from .subdomain_utils import SENDFILE_HEADER, SENDFILE_NGINX, file_response, get_deploy_path
+from .view_counter import get_view_counter, is_page_view
+
+
+SUBDOMAIN_RE = re.compile(r'^[a-z0-9]([a-z0-9-]*[a-z0-9])?$')
+# Встроенная таблица mimetypes (без системных mime.types, чтобы типы не зависели от сервера) с современными форматами
+MIME_TYPES = mimetypes.MimeTypes()
+for _type, _extensions in {
+    'text/javascript': ('.js', '.mjs'),
+    'application/json': ('.json', '.map'),
+    'application/manifest+json': ('.webmanifest',),
+    'image/webp': ('.webp',),
+    'image/avif': ('.avif',),
+    'image/x-icon': ('.ico',),
+    'font/woff': ('.woff',),
+    'font/woff2': ('.woff2',),
+    'font/ttf': ('.ttf',),
+    'font/otf': ('.otf',),
+    'application/vnd.ms-fontobject': ('.eot',),
+    'video/mp4': ('.mp4', '.m4v'),
+    'video/webm': ('.webm',),
+    'application/gzip': ('.gz',),
+    'application/x-brotli': ('.br',),
+}.items():
+    for _extension in _extensions:
+        MIME_TYPES.add_type(_type, _extension)
+TEXT_TYPES = ('application/json', 'application/manifest+json', 'application/xml')  # Кроме text/*, отдаются с charset
+DEFAULT_CONTENT_TYPE = 'text/html'  # Файлы без расширения
+UNKNOWN_CONTENT_TYPE = 'application/octet-stream'
+
+# Сжатые варианты в порядке предпочтения сервера: Content-Encoding -> суффикс файла рядом с исходным
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+LAZY_COMPRESS_MAX_SIZE = 2 * 1024 * 1024  # Большие файлы не сжимаются во время запроса
+
+# Файлы с хешем в имени не меняются; без хеша текст проверяется при каждом запросе, медиа кешируется на сутки
+CACHE_CONTROL_IMMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_CONTROL_REVALIDATE = 'no-cache'
+CACHE_CONTROL_MEDIA = 'public, max-age=86400'
+MEDIA_TYPES = ('image/', 'font/', 'video/', 'audio/')
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+@dataclass
+class SiteFile:
+    """Файл сайта с заголовками ответа; content заполнен, если файл хранится в кеше"""
+    path: Path
+    size: int
+    mtime: float
+    mtime_ns: int
+    content_type: str
+    etag: str
+    last_modified: str
+    cache_control: str
+    content: Optional[bytes] = None
+    encoding: Optional[str] = None  # Content-Encoding сжатого варианта
+
+    @classmethod
+    def from_stat(cls, path: Path, stat: os.stat_result) -> 'SiteFile':
+        content_type = content_type_for(path)
+        return cls(
+            path=path,
+            size=stat.st_size,
+            mtime=stat.st_mtime,
+            mtime_ns=stat.st_mtime_ns,
+            content_type=content_type,
+            etag=file_etag(stat),
+            last_modified=http_date(stat.st_mtime),
+            cache_control=cache_control_for(path, content_type),
+        )
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        headers = {'ETag': self.etag, 'Last-Modified': self.last_modified, 'Cache-Control': self.cache_control}
+        if self.encoding:
+            headers['Content-Encoding'] = self.encoding
+        return headers
+
+
+class SiteFileCache:
+    """
+    LRU кеш файлов сайтов в памяти воркера с ограничением по байтам. Попадание проверяется одним stat
+    (не чаще revalidate_interval секунд): изменённый mtime или размер удаляет запись.
+    Отсутствующие файлы запоминаются на negative_ttl секунд.
+    """
+
+    MAX_MISSING_ENTRIES = 4096
+
+    def __init__(self, max_bytes: int, max_file_size: int, negative_ttl: float, revalidate_interval: float):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.negative_ttl = negative_ttl
+        self.revalidate_interval = revalidate_interval
+        self._files: 'OrderedDict[Tuple[str, str], Tuple[SiteFile, float]]' = OrderedDict()
+        self._missing: 'OrderedDict[Tuple[str, str], float]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple[str, str]) -> Optional[SiteFile]:
+        """Файл из кеша или None; Http404, если файл недавно не был найден"""
+        now = time.monotonic()
+        with self._lock:
+            expires = self._missing.get(key)
+            if expires is not None:
+                if expires > now:
+                    self.negative_hits += 1
+                    raise Http404("Файл не найден")
+                del self._missing[key]
+            entry = self._files.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            site_file, checked_at = entry
+            if now - checked_at < self.revalidate_interval:
+                self._files.move_to_end(key)
+                self.hits += 1
+                return site_file
+
+        try:
+            stat = os.stat(site_file.path)
+        except OSError:
+            stat = None
+
+        with self._lock:
+            if stat is not None and stat.st_mtime_ns == site_file.mtime_ns and stat.st_size == site_file.size:
+                if key in self._files:
+                    self._files[key] = (site_file, now)
+                    self._files.move_to_end(key)
+                self.hits += 1
+                return site_file
+            self._discard(key)
+            self.misses += 1
+            return None
+
+    def accepts(self, size: int) -> bool:
+        return size <= min(self.max_file_size, self.max_bytes)
+
+    def put(self, key: Tuple[str, str], site_file: SiteFile) -> None:
+        if site_file.content is None or not self.accepts(len(site_file.content)):
+            return
+        with self._lock:
+            self._discard(key)
+            self._files[key] = (site_file, time.monotonic())
+            self.bytes += len(site_file.content)
+            while self.bytes > self.max_bytes:
+                _, (evicted, _) = self._files.popitem(last=False)
+                self.bytes -= len(evicted.content)
+                self.evictions += 1
+
+    def put_missing(self, key: Tuple[str, str]) -> None:
+        if self.negative_ttl <= 0:
+            return
+        with self._lock:
+            self._missing[key] = time.monotonic() + self.negative_ttl
+            self._missing.move_to_end(key)
+            while len(self._missing) > self.MAX_MISSING_ENTRIES:
+                self._missing.popitem(last=False)
+
+    def _discard(self, key: Tuple[str, str]) -> None:
+        entry = self._files.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[0].content)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'files': len(self._files),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'missing': len(self._missing),
+                'hits': self.hits,
+                'misses': self.misses,
+                'negative_hits': self.negative_hits,
+                'evictions': self.evictions,
+            }
+
+
+_cache: Optional[SiteFileCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_file_cache() -> SiteFileCache:
+    """Возвращает кеш файлов сайтов текущего процесса (воркера)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SiteFileCache(
+                max_bytes=settings.DEPLOY_STATIC_CACHE_MAX_BYTES,
+                max_file_size=settings.DEPLOY_STATIC_CACHE_MAX_FILE_SIZE,
+                negative_ttl=settings.DEPLOY_STATIC_CACHE_NEGATIVE_TTL,
+                revalidate_interval=settings.DEPLOY_STATIC_CACHE_REVALIDATE_INTERVAL,
+            )
+        return _cache
+
+
+def resolve_site_file(subdomain: str, path: str) -> Tuple[Path, os.stat_result]:
+    """Путь и stat файла сайта; Http404 для чужих путей, директорий и отсутствующих файлов"""
+    if not SUBDOMAIN_RE.match(subdomain):
+        raise Http404("Недопустимый поддомен")
+    deploy_path = get_deploy_path(subdomain)
+    file_path = deploy_path / (path or 'index.html')
+    try:
+        file_path.resolve().relative_to(deploy_path.resolve())
+    except ValueError:
+        raise Http404("Недопустимый путь")
+    try:
+        stat = file_path.stat()
+    except OSError:
+        raise Http404("Файл не найден")
+    if not file_path.is_file():
+        raise Http404("Файл не найден")
+    return file_path, stat
+
+
+def content_type_for(path: Path) -> str:
+    suffix = path.suffix.lower()
+    if not suffix:
+        return DEFAULT_CONTENT_TYPE
+    content_type = MIME_TYPES.types_map[True].get(suffix) or MIME_TYPES.types_map[False].get(suffix)
+    if content_type is None:
+        return UNKNOWN_CONTENT_TYPE
+    if content_type.startswith('text/') or content_type in TEXT_TYPES:
+        return f'{content_type}; charset=utf-8'
+    return content_type
+
+
+def is_compressible(path: Path) -> bool:
+    return path.suffix.lower() in PRECOMPRESS_EXTENSIONS
+
+
+def accepted_encodings(request) -> List[str]:
+    """Кодировки из ENCODINGS, разрешённые Accept-Encoding (q > 0), в порядке предпочтения сервера"""
+    accepted: Dict[str, float] = {}
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = item.partition(';')
+        match = re.search(r'q=([0-9.]+)', params)
+        try:
+            accepted[name.strip().lower()] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            continue
+    return [encoding for encoding in ENCODINGS if accepted.get(encoding, accepted.get('*', 0)) > 0]
+
+
+def cache_control_for(path: Path, content_type: str) -> str:
+    if FINGERPRINTED_RE.search(path.name):
+        return CACHE_CONTROL_IMMUTABLE
+    if content_type.startswith(MEDIA_TYPES):
+        return CACHE_CONTROL_MEDIA
+    return CACHE_CONTROL_REVALIDATE
+
+
+def file_etag(stat: os.stat_result) -> str:
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def is_not_modified(request, etag: str, mtime: float) -> bool:
+    """If-None-Match (приоритетнее) или If-Modified-Since"""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+    modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return modified_since is not None and int(mtime) <= modified_since
+
+
+def parse_range(request, etag: str, mtime: float, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Один диапазон из заголовка Range: (начало, конец включительно). None - отдать файл целиком
+    (нет Range, несколько диапазонов, If-Range не совпал). RangeNotSatisfiable - диапазон вне файла.
+    """
+    header = request.META.get('HTTP_RANGE', '').replace(' ', '')
+    if not header:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != int(mtime):
+        return None
+    match = RANGE_RE.match(header)
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def _read_range(file_path: Path, start: int, length: int):
+    with open(file_path, 'rb') as stream:
+        stream.seek(start)
+        while length > 0:
+            chunk = stream.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _load_site_file(subdomain: str, path: str, cache: SiteFileCache) -> Tuple[SiteFile, bool]:
+    """Файл из кеша или с диска (небольшие файлы читаются и кешируются); второй элемент - попадание в кеш"""
+    key = (subdomain, path or 'index.html')
+    site_file = cache.get(key)
+    if site_file is not None:
+        return site_file, True
+
+    try:
+        file_path, stat = resolve_site_file(subdomain, path)
+    except Http404:
+        cache.put_missing(key)
+        raise
+    site_file = SiteFile.from_stat(file_path, stat)
+    if cache.accepts(stat.st_size):
+        with open(file_path, 'rb') as stream:
+            content = stream.read()
+        # Файл изменился между stat и чтением - не кешируем, следующий запрос прочитает его заново
+        if len(content) == stat.st_size:
+            site_file.content = content
+            cache.put(key, site_file)
+    return site_file, False
+
+
+def _compress(site_file: SiteFile, variant_path: Path, encoding: str) -> Optional[os.stat_result]:
+    """Создаёт сжатый вариант рядом с файлом (атомарно через временный файл); None - сжатие невыгодно или невозможно"""
+    if encoding == 'br' and brotli is None:
+        return None
+    if not settings.SITE_PRECOMPRESS_MIN_SIZE <= site_file.size <= LAZY_COMPRESS_MAX_SIZE:
+        return None
+    try:
+        data = site_file.content if site_file.content is not None else site_file.path.read_bytes()
+        compressed = brotli.compress(data, quality=11) if encoding == 'br' else gzip_bytes(data)
+        if len(compressed) > len(data) * PRECOMPRESS_MAX_RATIO:
+            return None
+        fd, temp_path = tempfile.mkstemp(dir=variant_path.parent, prefix='.compress-')
+        try:
+            with os.fdopen(fd, 'wb') as stream:
+                stream.write(compressed)
+            os.replace(temp_path, variant_path)
+        except OSError:
+            os.unlink(temp_path)
+            raise
+        return variant_path.stat()
+    except OSError:
+        return None
+
+
+def _load_variant(subdomain: str, path: str, site_file: SiteFile, encoding: str,
+                  cache: SiteFileCache) -> Optional[Tuple[SiteFile, bool]]:
+    """
+    Сжатый вариант файла: из кеша, готовый .br/.gz с диска (созданный при сборке или ранее) или сжатый сейчас.
+    Вариант старше исходного файла пересоздаётся. None - варианта нет (запоминается как отсутствующий файл).
+    """
+    key = (subdomain, (path or 'index.html') + ENCODINGS[encoding])
+    etag = f'{site_file.etag[:-1]}-{encoding}"'
+    try:
+        variant = cache.get(key)
+    except Http404:
+        return None
+    if variant is not None and variant.etag == etag:
+        return variant, True
+
+    variant_path = site_file.path.with_name(site_file.path.name + ENCODINGS[encoding])
+    try:
+        stat = variant_path.stat()
+    except OSError:
+        stat = None
+    if stat is None or stat.st_mtime_ns < site_file.mtime_ns:
+        stat = _compress(site_file, variant_path, encoding)
+        if stat is None:
+            cache.put_missing(key)
+            return None
+
+    variant = SiteFile(
+        path=variant_path,
+        size=stat.st_size,
+        mtime=site_file.mtime,
+        mtime_ns=stat.st_mtime_ns,
+        content_type=site_file.content_type,
+        etag=etag,
+        last_modified=site_file.last_modified,
+        cache_control=site_file.cache_control,
+        encoding=encoding,
+    )
+    if cache.accepts(stat.st_size):
+        content = variant_path.read_bytes()
+        if len(content) == stat.st_size:
+            variant.content = content
+            cache.put(key, variant)
+    return variant, False
+
+
+def serve_site_file(request, subdomain: str, path: str) -> HttpResponse:
+    """Ответ с файлом сайта; GET страницы (200 или 304) учитывается как просмотр проекта"""
+    response = _site_file_response(request, subdomain, path)
+    if (request.method == 'GET' and response.status_code in (200, 304)
+            and is_page_view(path, request.META.get('HTTP_USER_AGENT', ''))):
+        get_view_counter().hit(subdomain)
+    return response
+
+
+def _site_file_response(request, subdomain: str, path: str) -> HttpResponse:
+    """
+    Ответ с файлом сайта: 304 для неизменённых файлов, 206/416 для Range, иначе файл целиком.
+    Текстовые файлы отдаются сжатыми (.br или .gz), если клиент их принимает.
+    """
+    cache = get_file_cache()
+    site_file, cache_hit = _load_site_file(subdomain, path, cache)
+    offload = settings.DEPLOY_STATIC_SENDFILE in (SENDFILE_NGINX, SENDFILE_HEADER)
+    compressible = is_compressible(site_file.path)
+    if compressible:
+        for encoding in accepted_encodings(request):
+            variant = _load_variant(subdomain, path, site_file, encoding, cache)
+            # Прокси не передаёт Content-Encoding ответа при X-Accel-Redirect/X-Sendfile: вариант не из кеша
+            # не отдаётся, прокси получает исходный путь и сам выбирает .br/.gz рядом (gzip_static/brotli_static)
+            if variant is not None and (variant[0].content is not None or not offload):
+                site_file, cache_hit = variant
+                break
+
+    headers = {**site_file.headers, 'X-Cache': 'HIT' if cache_hit else 'MISS'}
+    if compressible:
+        headers['Vary'] = 'Accept-Encoding'
+
+    if is_not_modified(request, site_file.etag, site_file.mtime):
+        return HttpResponseNotModified(headers=headers)
+
+    # С X-Accel-Redirect/X-Sendfile диапазоны обрабатывает прокси (кроме файлов из кеша)
+    if site_file.content is not None or not offload:
+        try:
+            byte_range = parse_range(request, site_file.etag, site_file.mtime, site_file.size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416, headers=headers)
+            response['Content-Range'] = f'bytes */{site_file.size}'
+            return response
+        if byte_range is not None:
+            start, end = byte_range
+            length = end - start + 1
+            if site_file.content is not None:
+                body = site_file.content[start:end + 1]
+                response = HttpResponse(body, status=206, content_type=site_file.content_type, headers=headers)
+            else:
+                response = StreamingHttpResponse(
+                    _read_range(site_file.path, start, length),
+                    status=206, content_type=site_file.content_type, headers=headers
+                )
+            response['Content-Range'] = f'bytes {start}-{end}/{site_file.size}'
+            response['Content-Length'] = length
+            return response
+
+    if site_file.content is not None:
+        response = HttpResponse(site_file.content, content_type=site_file.content_type)
+    else:
+        response = file_response(site_file.path, site_file.content_type)
+    for name, value in headers.items():
+        response[name] = value
+    response['Accept-Ranges'] = 'bytes'
+    return response
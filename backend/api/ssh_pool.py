@@ -0,0 +1,263 @@
+"""
+Пул переиспользуемых SSH подключений к VPS серверам
+"""
+import hashlib
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+import paramiko
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+
+@dataclass(frozen=True)
+class SSHTarget:
+    """Параметры подключения к серверу"""
+    host: str
+    port: int
+    username: str
+    password: str = field(repr=False)
+
+    @classmethod
+    def from_server(cls, vps_server) -> 'SSHTarget':
+        return cls(
+            host=vps_server.host,
+            port=vps_server.port,
+            username=vps_server.username,
+            password=vps_server.password,
+        )
+
+    @property
+    def key(self) -> Tuple[str, int, str, str]:
+        """Ключ подключений: (host, port, username) + отпечаток пароля, чтобы чужой неверный пароль не получил готовое подключение"""
+        fingerprint = hashlib.sha256(self.password.encode('utf-8')).hexdigest()[:16]
+        return self.host, self.port, self.username, fingerprint
+
+    @property
+    def server_key(self) -> Tuple[str, int]:
+        """Ключ ограничения каналов: сервер один, с какими бы учётными данными к нему ни подключались"""
+        return self.host, self.port
+
+
+class _PooledConnection:
+    """Подключение в пуле и число выданных по нему аренд"""
+
+    def __init__(self, client: paramiko.SSHClient):
+        self.client = client
+        self.leases = 0
+        self.last_used = time.monotonic()
+        self.last_checked = self.last_used
+
+    @property
+    def transport(self) -> Optional[paramiko.Transport]:
+        return self.client.get_transport()
+
+    def is_alive(self) -> bool:
+        transport = self.transport
+        return bool(transport and transport.is_active() and transport.is_authenticated())
+
+    def close(self) -> None:
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
+class _ServerPool:
+    """Подключения к серверу с одними учётными данными и общее для сервера ограничение одновременных каналов"""
+
+    def __init__(self, slots: threading.BoundedSemaphore):
+        self.connections: List[_PooledConnection] = []
+        self.slots = slots
+
+
+class SSHConnectionPool:
+    """
+    Пул SSH подключений с ключом (host, port, username), одновременные каналы ограничены на сервер (host, port).
+    Подключения держатся открытыми с keepalive, проверяются перед выдачей,
+    одно подключение обслуживает несколько аренд (каналы SSH мультиплексируются),
+    простаивающие подключения закрываются.
+    """
+
+    def __init__(
+        self,
+        max_channels_per_server: int = 8,
+        sessions_per_connection: int = 4,
+        idle_timeout: float = 300,
+        keepalive_interval: int = 30,
+        health_check_after: float = 30,
+        connect_timeout: int = 10,
+        acquire_timeout: float = 300,
+    ):
+        self.max_channels_per_server = max_channels_per_server
+        self.sessions_per_connection = sessions_per_connection
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.health_check_after = health_check_after
+        self.connect_timeout = connect_timeout
+        self.acquire_timeout = acquire_timeout
+        self._lock = threading.Lock()
+        self._servers: Dict[Tuple, _ServerPool] = {}
+        self._slots: Dict[Tuple[str, int], threading.BoundedSemaphore] = {}
+
+    def _server(self, target: SSHTarget) -> _ServerPool:
+        with self._lock:
+            server = self._servers.get(target.key)
+            if server is None:
+                slots = self._slots.get(target.server_key)
+                if slots is None:
+                    slots = threading.BoundedSemaphore(self.max_channels_per_server)
+                    self._slots[target.server_key] = slots
+                server = _ServerPool(slots)
+                self._servers[target.key] = server
+            return server
+
+    def _is_healthy(self, conn: _PooledConnection) -> bool:
+        """
+        Проверка подключения перед выдачей; долго простаивавшие проверяются пакетом SSH_MSG_IGNORE.
+        Вызывается вне блокировки пула: отправка может ждать сеть
+        """
+        if not conn.is_alive():
+            return False
+        if time.monotonic() - conn.last_checked < self.health_check_after:
+            return True
+        try:
+            conn.transport.send_ignore()
+        except (paramiko.SSHException, EOFError, socket.error):
+            return False
+        conn.last_checked = time.monotonic()
+        return conn.is_alive()
+
+    def _connect(self, target: SSHTarget) -> _PooledConnection:
+        from .deploy_utils import create_ssh_client
+
+        client = create_ssh_client(
+            host=target.host,
+            port=target.port,
+            username=target.username,
+            password=target.password,
+            timeout=self.connect_timeout
+        )
+        client.get_transport().set_keepalive(self.keepalive_interval)
+        return _PooledConnection(client)
+
+    def _lease(self, target: SSHTarget, server: _ServerPool) -> _PooledConnection:
+        """
+        Выдаёт подключение со свободными сессиями или открывает новое. Под общей блокировкой пула только выбор
+        подключения: проверка простаивавшего подключения по сети и закрытие мёртвых выполняются вне её
+        """
+        while True:
+            with self._lock:
+                dead = [conn for conn in server.connections if conn.leases == 0 and not conn.is_alive()]
+                for conn in dead:
+                    server.connections.remove(conn)
+                candidate = next(
+                    (conn for conn in server.connections
+                     if conn.leases < self.sessions_per_connection and conn.is_alive()),
+                    None
+                )
+                if candidate is not None:
+                    # Аренда до проверки: evict_idle и другие потоки не закроют проверяемое подключение
+                    candidate.leases += 1
+                    in_use = candidate.leases > 1
+            for conn in dead:
+                conn.close()
+
+            if candidate is None:
+                break
+            # Подключение с другими арендами работает прямо сейчас, проверяются только простаивавшие
+            if in_use or self._is_healthy(candidate):
+                return candidate
+            self._release(server, candidate, broken=True)
+
+        conn = self._connect(target)
+        conn.leases = 1
+        with self._lock:
+            server.connections.append(conn)
+        return conn
+
+    def _release(self, server: _ServerPool, conn: _PooledConnection, broken: bool) -> None:
+        with self._lock:
+            conn.leases -= 1
+            conn.last_used = time.monotonic()
+            close = (broken or not conn.is_alive()) and conn.leases == 0
+            if close and conn in server.connections:
+                server.connections.remove(conn)
+        if close:
+            conn.close()
+
+    @contextmanager
+    def connection(self, target: SSHTarget) -> Iterator[paramiko.SSHClient]:
+        """Выдаёт подключение к серверу на время блока with и возвращает его в пул"""
+        self.evict_idle()
+        server = self._server(target)
+        if not server.slots.acquire(timeout=self.acquire_timeout):
+            raise ValidationError(f"Превышено время ожидания свободного SSH канала к {target.host}")
+
+        try:
+            conn = self._lease(target, server)
+            broken = False
+            try:
+                yield conn.client
+            except (paramiko.SSHException, EOFError, socket.error):
+                broken = True
+                raise
+            finally:
+                self._release(server, conn, broken)
+        finally:
+            server.slots.release()
+
+    def evict_idle(self) -> int:
+        """Закрывает подключения без аренд, простаивающие дольше idle_timeout"""
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            for server in self._servers.values():
+                for conn in list(server.connections):
+                    if conn.leases == 0 and (now - conn.last_used > self.idle_timeout or not conn.is_alive()):
+                        server.connections.remove(conn)
+                        evicted.append(conn)
+        for conn in evicted:
+            conn.close()
+        return len(evicted)
+
+    def close_all(self) -> None:
+        """Закрывает все подключения (при остановке воркера)"""
+        with self._lock:
+            connections = [conn for server in self._servers.values() for conn in server.connections]
+            self._servers.clear()
+            self._slots.clear()
+        for conn in connections:
+            conn.close()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Количество подключений и активных аренд по серверам"""
+        with self._lock:
+            return {
+                f"{key[2]}@{key[0]}:{key[1]}": {
+                    'connections': len(server.connections),
+                    'leases': sum(conn.leases for conn in server.connections),
+                }
+                for key, server in self._servers.items()
+            }
+
+
+_pool: Optional[SSHConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_ssh_pool() -> SSHConnectionPool:
+    """Возвращает общий для процесса пул SSH подключений"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SSHConnectionPool(
+                max_channels_per_server=settings.SSH_POOL_MAX_CHANNELS_PER_SERVER,
+                sessions_per_connection=settings.SSH_POOL_SESSIONS_PER_CONNECTION,
+                idle_timeout=settings.SSH_POOL_IDLE_TIMEOUT,
+                keepalive_interval=settings.SSH_POOL_KEEPALIVE_INTERVAL,
+            )
+        return _pool
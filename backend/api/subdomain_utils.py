@@ -7,8 +7,11 @@ import tempfile
 import re
 from pathlib import Path
 from typing import Tuple, Optional
+from urllib.parse import quote
 from django.conf import settings
+from django.http import FileResponse, HttpResponse
 from django.core.exceptions import ValidationError
+from .site_bundle import SiteBundle, copy_stream
 
 
 def validate_subdomain(subdomain: str) -> None:
@@ -28,8 +31,7 @@ def validate_subdomain(subdomain: str) -> None:
             "Не может начинаться или заканчиваться дефисом."
         )
     
-    forbidden = ['www', 'api', 'admin', 'static', 'media', 'deploy', 'app', 'mail', 'ftp', 'localhost']
-    if subdomain.lower() in forbidden:
+    if subdomain.lower() in settings.DEPLOY_RESERVED_SUBDOMAINS:
         raise ValidationError(f"Поддомен '{subdomain}' зарезервирован и не может быть использован")
 
 
@@ -52,18 +54,37 @@ def generate_subdomain(project_id: int, user_id: int, title: str) -> str:
 
 
 def get_deploy_path(subdomain: str) -> Path:
-    """Возвращает путь к директории для сохранения файлов проекта на сервере"""
-    deploy_root = Path(settings.DEPLOY_STATIC_ROOT)
-    deploy_root.mkdir(parents=True, exist_ok=True)
-    
-    project_path = deploy_root / subdomain
-    project_path.mkdir(parents=True, exist_ok=True)
-    
-    return project_path
+    """Возвращает путь к директории файлов проекта на сервере (без создания: вызывается на каждый запрос к сайту)"""
+    return Path(settings.DEPLOY_STATIC_ROOT) / subdomain
+
+
+SENDFILE_NGINX = 'nginx'
+SENDFILE_HEADER = 'sendfile'
+
+
+def file_response(file_path: Path, content_type: str) -> HttpResponse:
+    """
+    Ответ с файлом задеплоенного сайта (путь уже проверен). При DEPLOY_STATIC_SENDFILE файл отдаёт прокси
+    по заголовку X-Accel-Redirect или X-Sendfile без участия воркера, иначе - потоковый FileResponse.
+    """
+    mode = settings.DEPLOY_STATIC_SENDFILE
+    if mode == SENDFILE_NGINX:
+        relative = file_path.resolve().relative_to(Path(settings.DEPLOY_STATIC_ROOT).resolve())
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.DEPLOY_STATIC_ACCEL_PREFIX.rstrip('/') + '/' + quote(relative.as_posix())
+        return response
+    if mode == SENDFILE_HEADER:
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = str(file_path.resolve())
+        return response
+
+    response = FileResponse(open(file_path, 'rb'), content_type=content_type)
+    response['Content-Length'] = file_path.stat().st_size
+    return response
 
 
 def get_deploy_url(subdomain: str) -> str:
-    """Генерирует URL для доступа к задеплоенному сайту через API endpoint"""
+    """Генерирует URL задеплоенного сайта: поддомен при DEPLOY_SUBDOMAIN_HOSTING, иначе API endpoint"""
     base_domain = settings.DEPLOY_BASE_DOMAIN
     
     if 'localhost' in base_domain or '127.0.0.1' in base_domain:
@@ -77,6 +98,8 @@ def get_deploy_url(subdomain: str) -> str:
         protocol = 'https'
         base_url = f"{protocol}://{base_domain}"
     
+    if settings.DEPLOY_SUBDOMAIN_HOSTING:
+        return f"{protocol}://{subdomain}.{base_domain}/"
     return f"{base_url}/api/deployed/{subdomain}/"
 
 
@@ -84,7 +107,7 @@ def extract_and_save_files(
     zip_path: str,
     subdomain: str
 ) -> Tuple[bool, str]:
-    """Извлекает файлы из ZIP архива и сохраняет их в директорию проекта на сервере"""
+    """Извлекает файлы из ZIP архива и сохраняет их в директорию проекта на сервере (потоково, без extractall)"""
     try:
         deploy_path = get_deploy_path(subdomain)
         
@@ -93,8 +116,13 @@ def extract_and_save_files(
             shutil.rmtree(deploy_path)
         deploy_path.mkdir(parents=True, exist_ok=True)
         
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(deploy_path)
+        with SiteBundle.from_zip(zip_path) as bundle:
+            for directory in bundle.directories():
+                (deploy_path / directory).mkdir(exist_ok=True)
+            
+            for bundle_file in bundle:
+                with bundle_file.open() as source, open(deploy_path / bundle_file.path, 'wb') as destination:
+                    copy_stream(source, destination)
         
         index_path = deploy_path / 'index.html'
         if not index_path.exists():
@@ -111,6 +139,8 @@ def extract_and_save_files(
         
     except zipfile.BadZipFile:
         return False, "Некорректный формат ZIP архива"
+    except ValidationError as e:
+        return False, ' '.join(e.messages)
     except Exception as e:
         return False, f"Ошибка при сохранении файлов: {str(e)}"
 
@@ -0,0 +1,293 @@
+"""
+Тесты API
+"""
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from . import revisions
+from .build_cache import IN_USE_GRACE
+from .deploy_queue import _finish_job, claim_next_job, requeue_stale_jobs
+from .models import ContentChunk, DeployJob, Project, ProjectContent
+from .revisions import COMPACT_GRACE, compact_chunks, create_revision, load_revision
+from .site_builder import SiteBuilder
+from .site_images import ImageCache, rewrite_picture_tags
+
+
+class ProjectListTests(APITestCase):
+    """
+    Списки проектов (ProjectViewSet.list и user_projects) на пользователе с большим числом проектов:
+    число запросов на страницу не зависит от страницы, содержимое сайтов не загружается
+    """
+    PROJECTS = 1050  # Последняя страница неполная
+    PAGE_SIZE = 100
+    MAX_QUERIES = 1  # Страница с пользователями одним запросом: запросы на каждый проект страницы не допускаются
+    CONTENT_SIZE = 50000
+    URLS = ('/api/projects/', '/api/auth/my-projects/')
+    CONTENT_COLUMNS = ('html_content', 'css_content', 'json_content', 'header_settings', 'footer_settings')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='project-list')
+        Project.objects.bulk_create(
+            [Project(user=cls.user, title=f'Проект {i}', slug=f'project-{i}') for i in range(cls.PROJECTS)],
+            batch_size=500,
+        )
+        content = '<div>' + 'x' * cls.CONTENT_SIZE + '</div>'
+        ProjectContent.objects.bulk_create(
+            [
+                ProjectContent(project_id=project_id, html_content=content, css_content=content)
+                for project_id in Project.objects.filter(user=cls.user).values_list('id', flat=True)
+            ],
+            batch_size=500,
+        )
+        # Чужие проекты не попадают в список
+        other = User.objects.create(username='project-list-other')
+        Project.objects.create(user=other, title='Чужой проект', slug='other')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def _pages(self, url):
+        """Страницы списка по курсору: (ответ, SQL запросы страницы)"""
+        next_url = f'{url}?page_size={self.PAGE_SIZE}'
+        while next_url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(next_url)
+            self.assertEqual(response.status_code, 200)
+            yield response.json(), [query['sql'] for query in queries.captured_queries]
+            next_url = response.json()['next']
+
+    def test_query_count_is_constant_across_pages(self):
+        for url in self.URLS:
+            with self.subTest(url=url):
+                first_page, queries = next(self._pages(url))
+                self.assertLessEqual(len(queries), self.MAX_QUERIES)
+                # Каждая следующая страница, включая последнюю, - столько же запросов, сколько первая
+                next_url = first_page['next']
+                while next_url:
+                    with self.assertNumQueries(len(queries)):
+                        response = self.client.get(next_url)
+                    next_url = response.json()['next']
+
+    def test_pages_cover_all_projects_once(self):
+        expected = set(Project.objects.filter(user=self.user).values_list('id', flat=True))
+        for url in self.URLS:
+            with self.subTest(url=url):
+                ids = [item['id'] for page, _ in self._pages(url) for item in page['results']]
+                self.assertEqual(len(ids), len(expected))
+                self.assertEqual(set(ids), expected)
+
+    def test_site_content_is_deferred(self):
+        for url in self.URLS:
+            with self.subTest(url=url):
+                for page, queries in self._pages(url):
+                    for sql in queries:
+                        self.assertNotIn(ProjectContent._meta.db_table, sql)
+                        for column in self.CONTENT_COLUMNS:
+                            self.assertNotIn(column, sql)
+                    for item in page['results']:
+                        for column in self.CONTENT_COLUMNS:
+                            self.assertNotIn(column, item)
+
+    def test_memory_does_not_depend_on_site_content(self):
+        # HTML и CSS одной страницы - 10 МБ: список, который их читает, не уложится и в половину
+        budget = self.PAGE_SIZE * self.CONTENT_SIZE
+        for url in self.URLS:
+            with self.subTest(url=url):
+                self.client.get(url)  # Импорты и кеши первого запроса не относятся к списку
+                tracemalloc.start()
+                try:
+                    for _ in self._pages(url):
+                        pass
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+                self.assertLess(peak, budget)
+
+
+@override_settings(DEPLOY_JOB_MAX_ATTEMPTS=3)
+class DeployJobClaimTests(TestCase):
+    """Задача, возвращённая в очередь и забранная снова, принадлежит только новому запуску"""
+
+    def setUp(self):
+        user = User.objects.create(username='deploy-claim')
+        DeployJob.objects.create(user=user, params={'password': 'secret'}, archive_path='/nonexistent.zip')
+
+    def _go_silent(self):
+        DeployJob.objects.update(heartbeat_at=timezone.now() - timedelta(hours=1))
+
+    def test_lost_run_cannot_write_progress_or_finish(self):
+        lost = claim_next_job('worker-a')
+        self._go_silent()
+        self.assertEqual(requeue_stale_jobs(), 1)
+        current = claim_next_job('worker-a')  # Тот же процесс: отличается только номер попытки
+        self.assertEqual(current.pk, lost.pk)
+
+        with self.assertRaises(DeployJob.Lost):
+            lost.start_stage('upload')
+        with self.assertRaises(DeployJob.Lost):
+            _finish_job(lost, False, 'устаревший запуск')
+
+        current.start_stage('upload')
+        current.finish_stage('upload')
+        _finish_job(current, True, 'готово')
+        job = DeployJob.objects.get()
+        self.assertEqual(job.status, DeployJob.STATUS_SUCCESS)
+        self.assertEqual(job.message, 'готово')
+        self.assertNotIn('password', job.params)
+
+    def test_live_job_is_not_requeued(self):
+        claim_next_job('worker-a')
+        self.assertEqual(requeue_stale_jobs(), 0)
+        self.assertEqual(DeployJob.objects.get().status, DeployJob.STATUS_RUNNING)
+
+    @override_settings(DEPLOY_JOB_MAX_ATTEMPTS=1)
+    def test_silent_job_at_attempt_limit_is_failed(self):
+        lost = claim_next_job('worker-a')
+        self._go_silent()
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertEqual(DeployJob.objects.get().status, DeployJob.STATUS_FAILED)
+        with self.assertRaises(DeployJob.Lost):
+            lost.finish_stage('upload')
+
+
+class SiteBuildCacheTests(TestCase):
+    """Кеш сборок сайтов не растёт сверх бюджета: удаляются сборки, которые дольше всего не использовались"""
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.builder = SiteBuilder(temp.name)
+
+    def _build(self, i, age):
+        project = Project(title=f'Сайт {i}', html_content=f'<p>{i}</p>' + 'x' * 5000, css_content='p { color: red; }')
+        artifact = self.builder.build(project)
+        used = time.time() - age
+        os.utime(artifact.path, (used, used))
+        return artifact
+
+    def test_least_recently_used_builds_are_removed(self):
+        old = [self._build(i, IN_USE_GRACE + 1000 - i) for i in range(4)]
+        recent = self._build(4, 0)
+        self.builder.max_bytes = 3 * sum(f.stat().st_size for f in old[0].path.iterdir())
+
+        self.builder.build(Project(title='Сайт 0', html_content='<p>0</p>' + 'x' * 5000,
+                                   css_content='p { color: red; }'))  # Попадание в кеш обновляет mtime
+        removed, freed = self.builder.prune()
+
+        self.assertEqual(removed, 2)
+        self.assertGreater(freed, 0)
+        self.assertEqual([a.path.exists() for a in old], [True, False, False, True])
+        self.assertTrue(recent.path.exists())
+
+    def test_recently_used_builds_are_kept_over_budget(self):
+        artifacts = [self._build(i, 0) for i in range(3)]
+        self.builder.max_bytes = 1
+        self.assertEqual(self.builder.prune(), (0, 0))
+        self.assertTrue(all(a.path.exists() for a in artifacts))
+
+
+class ImageCacheTests(TestCase):
+    """Кеш оптимизированных изображений ограничен так же, как кеш сборок"""
+
+    def test_cache_hit_protects_result_from_pruning(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        cache = ImageCache(temp.name, max_bytes=1)
+        result = {'data': b'x' * 1000, 'width': 10, 'height': 10, 'webp': {10: b'y' * 500}}
+        old = time.time() - IN_USE_GRACE - 1
+        for key in ('a' * 64, 'b' * 64):
+            cache.put(key, result)
+            os.utime(cache._path(key), (old, old))
+
+        self.assertEqual(cache.get('a' * 64)['image'].read_bytes(), result['data'])
+        self.assertEqual(cache.prune()[0], 1)
+        stored = cache.get('a' * 64)
+        self.assertEqual(stored['webp'][10].read_bytes(), result['webp'][10])
+        self.assertIsNone(cache.get('b' * 64))
+
+
+class PictureTagTests(TestCase):
+    """<img> с WebP вариантами оборачиваются в <picture>, кроме уже находящихся внутри <picture>"""
+    VARIANTS = {'images/a.png': {480: 'images/a-480w.webp', 960: 'images/a.webp'}}
+
+    def test_only_images_outside_picture_are_wrapped(self):
+        html = (
+            '<img src="images/a.png">'
+            '<PICTURE><source srcset="x.webp"><img src="images/a.png"></picture >'
+            '<picture-frame><img src="/images/a.png" width="300"></picture-frame>'
+            '<img src="images/a.png" srcset="a.png 1x">'
+        )
+        result, rewritten = rewrite_picture_tags(html, 'index.html', self.VARIANTS)
+        self.assertEqual(rewritten, 2)
+        self.assertEqual(result.count('<picture><source type="image/webp"'), 2)
+        self.assertIn('sizes="300px"', result)
+        self.assertIn('<PICTURE><source srcset="x.webp"><img src="images/a.png"></picture >', result)
+
+
+class RevisionChunkTests(APITestCase):
+    """Очистка фрагментов и ревизии, снова ссылающиеся на фрагменты без ссылок"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='revisions')
+        self.project = Project.objects.create(user=self.user, title='История', slug='history')
+        self.content = ProjectContent.objects.get(project=self.project)
+        self.content.html_content = self._html('a')
+        self.content.save()
+        self.client.force_authenticate(self.user)
+
+    @staticmethod
+    def _html(letter):
+        return ''.join(f'<section id="{letter}{i}">{letter * 3000}</section>' for i in range(5))
+
+    def _save(self, letter):
+        self.content.html_content = self._html(letter)
+        self.content.save()
+        return create_revision(self.content)
+
+    def _age_chunks(self):
+        ContentChunk.objects.update(created_at=timezone.now() - COMPACT_GRACE * 2)
+
+    def test_revision_reusing_orphan_chunks_during_compaction(self):
+        first = create_revision(self.content)
+        self._save('b')
+        first.delete()  # Фрагменты "a" остались без ссылок
+        self._age_chunks()
+
+        # Новая ревизия с фрагментами "a" записывается после того, как очистка собрала ссылки ревизий
+        referenced_chunks, calls, restored = revisions._referenced_chunks, [], []
+
+        def racing(queryset):
+            hashes = referenced_chunks(queryset)
+            calls.append(queryset)
+            if len(calls) == 2:
+                restored.append(self._save('a'))
+            return hashes
+
+        with mock.patch.object(revisions, '_referenced_chunks', racing):
+            compact_chunks()
+
+        self.assertEqual(len(restored), 1)
+        self.assertEqual(load_revision(restored[0])['html_content'], self._html('a'))
+
+    def test_damaged_revision_is_reported_not_crashed(self):
+        revision = create_revision(self.content)
+        ContentChunk.objects.filter(hash=revision.manifest['html_content'][0]).delete()
+        base = f'/api/projects/{self.project.id}/revisions/{revision.id}'
+        for method, url in (('get', f'{base}/'), ('get', f'{base}/diff/'), ('post', f'{base}/restore/')):
+            with self.subTest(url=url):
+                response = getattr(self.client, method)(url)
+                self.assertEqual(response.status_code, 409)
+                self.assertIn('повреждена', response.json()['error'])
+        self.content.refresh_from_db()
+        self.assertEqual(self.content.html_content, self._html('a'))
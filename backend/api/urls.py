@@ -12,7 +12,9 @@ from .views import (
     user_projects,
     subscription_view,
     deploy_view,
+    deploy_job_status,
     serve_deployed_site,
+    deployed_cache_stats,
 )
 
 router = DefaultRouter()
@@ -30,7 +32,9 @@ urlpatterns = [
     path('auth/subscription/', subscription_view, name='subscription'),
     # Деплой
     path('deploy/', deploy_view, name='deploy'),
+    path('deploy/jobs/<int:job_id>/', deploy_job_status, name='deploy_job_status'),
     # Обслуживание задеплоенных сайтов
+    path('deployed-cache/stats/', deployed_cache_stats, name='deployed_cache_stats'),
     path('deployed/<str:subdomain>/', serve_deployed_site, name='serve_deployed_site'),
     path('deployed/<str:subdomain>/<path:path>', serve_deployed_site, name='serve_deployed_site_path'),
 ]
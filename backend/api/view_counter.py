@@ -0,0 +1,167 @@
+"""
+Подсчёт просмотров задеплоенных сайтов (Project.views_count) без записи в БД на каждый запрос:
+просмотры копятся в памяти воркера и раз в SITE_VIEWS_FLUSH_INTERVAL секунд записываются одним
+UPDATE ... SET views_count = views_count + N на группу проектов. При штатной остановке воркера
+накопленное записывается сразу, при падении теряется не больше одного интервала.
+"""
+import atexit
+import posixpath
+import re
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from .models import Project
+
+
+PAGE_EXTENSIONS = ('', '.html', '.htm')
+BOT_RE = re.compile(r'bot|crawl|spider|slurp|preview|monitor|curl|wget|python-requests', re.I)
+# Формат combined (по умолчанию в Nginx): адрес, время, запрос, статус, размер, referer, user agent
+ACCESS_LOG_RE = re.compile(r'^\S+ \S+ \S+ \[([^\]]+)\] "(\S+) (\S+)[^"]*" (\d{3}) \S+ "[^"]*" "([^"]*)"')
+ACCESS_LOG_TIME_FORMAT = '%d/%b/%Y:%H:%M:%S %z'
+
+
+def is_page_view(path: str, user_agent: str = '') -> bool:
+    """Запрос страницы (не стилей, скриптов и изображений) не от поискового робота или мониторинга"""
+    path = path.split('?', 1)[0]
+    if path and not path.endswith('/') and posixpath.splitext(path)[1].lower() not in PAGE_EXTENSIONS:
+        return False
+    return not (user_agent and BOT_RE.search(user_agent))
+
+
+def count_log_views(
+    lines: Iterable[str],
+    since: Optional[datetime] = None,
+    since_lines: int = 0
+) -> Tuple[int, Optional[datetime], int]:
+    """
+    Просмотры страниц (GET, статус 200 или 304) в строках access log после позиции (since, since_lines):
+    строки со временем раньше since и первые since_lines строк со временем since уже учтены.
+    Возвращает (просмотры, время последней строки, строк с этим временем) - новую позицию.
+    """
+    views = 0
+    last_time, last_lines = since, since_lines
+    seen_at_since = 0
+    for line in lines:
+        match = ACCESS_LOG_RE.match(line)
+        if not match:
+            continue
+        try:
+            time = datetime.strptime(match.group(1), ACCESS_LOG_TIME_FORMAT)
+        except ValueError:
+            continue
+        if since is not None and time <= since:
+            if time < since:
+                continue
+            seen_at_since += 1
+            if seen_at_since <= since_lines:
+                continue
+
+        if last_time is None or time > last_time:
+            last_time, last_lines = time, 1
+        elif time == last_time:
+            last_lines += 1
+        method, path, status, user_agent = match.group(2, 3, 4, 5)
+        if method == 'GET' and status in ('200', '304') and is_page_view(path, user_agent):
+            views += 1
+    return views, last_time, last_lines
+
+
+def add_views(views: Dict[int, int]) -> None:
+    """Прибавляет просмотры проектам по ID: один UPDATE с F() на каждое различное число просмотров"""
+    groups: Dict[int, list] = defaultdict(list)
+    for project_id, count in views.items():
+        if count > 0:
+            groups[count].append(project_id)
+    for count, project_ids in groups.items():
+        Project.objects.filter(id__in=project_ids).update(views_count=F('views_count') + count)
+
+
+def projects_by_subdomain(subdomains: Iterable[str]) -> Dict[str, int]:
+    """ID проекта для каждого поддомена (поддомен не уникален: берётся последний задеплоенный проект)"""
+    projects: Dict[str, int] = {}
+    rows = (
+        Project.objects
+        .filter(subdomain__in=list(subdomains))
+        .order_by('subdomain', F('deployed_at').desc(nulls_last=True), '-id')
+        .values_list('subdomain', 'id')
+    )
+    for subdomain, project_id in rows:
+        projects.setdefault(subdomain, project_id)
+    return projects
+
+
+class ViewCounter:
+    """Буфер просмотров по поддоменам в памяти процесса с фоновой записью в БД"""
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._views: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.flushed = 0  # Просмотров записано в БД этим процессом
+
+    def hit(self, subdomain: str) -> None:
+        with self._lock:
+            self._views[subdomain] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='view-counter', daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(self._views.values())
+
+    def flush(self) -> int:
+        """Записывает накопленные просмотры; при ошибке БД они возвращаются в буфер до следующей попытки"""
+        with self._lock:
+            views, self._views = self._views, defaultdict(int)
+        if not views:
+            return 0
+        try:
+            projects = projects_by_subdomain(views)
+            add_views({projects[subdomain]: count for subdomain, count in views.items() if subdomain in projects})
+        except Exception:
+            with self._lock:
+                for subdomain, count in views.items():
+                    self._views[subdomain] += count
+            raise
+        total = sum(views.values())
+        self.flushed += total
+        return total
+
+    def stop(self) -> None:
+        """Останавливает фоновую запись и записывает остаток (вызывается при завершении процесса)"""
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"⚠️ Не удалось записать просмотры сайтов: {e}")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Не удалось записать просмотры сайтов: {e}")
+            finally:
+                # Подключение к БД принадлежит потоку: не держим его открытым между записями
+                connection.close()
+
+
+_counter: Optional[ViewCounter] = None
+_counter_lock = threading.Lock()
+
+
+def get_view_counter() -> ViewCounter:
+    """Возвращает счётчик просмотров текущего процесса (воркера)"""
+    global _counter
+    with _counter_lock:
+        if _counter is None:
+            _counter = ViewCounter(settings.SITE_VIEWS_FLUSH_INTERVAL)
+        return _counter
@@ -4,17 +4,19 @@ API Views для проектов
 from rest_framework import viewsets, status, generics
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse, JsonResponse, FileResponse, Http404
+from django.urls import reverse
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, FileResponse, Http404
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.utils import timezone
 from django.views.decorators.http import require_http_methods
 from pathlib import Path
-from .models import Project, Subscription, CustomBlock
+from .models import Project, ProjectContent, ProjectRevision, Subscription, CustomBlock, DeployJob, DeployManifest
 from .serializers import (
     ProjectSerializer,
     ProjectListSerializer,
@@ -23,9 +25,26 @@ from .serializers import (
     UserSerializer,
     SubscriptionSerializer,
     DeploySerializer,
+    DeployJobSerializer,
+    DeployReleaseSerializer,
+    ProjectContentPatchSerializer,
+    ProjectRevisionSerializer,
+    RollbackSerializer,
     CustomBlockSerializer,
     CustomBlockListSerializer,
 )
+from .json_patch import PatchError, apply_json_patch, apply_text_splices
+from .pagination import ProjectCursorPagination
+from .revisions import (
+    RevisionDamaged,
+    autosave_revision,
+    create_revision,
+    current_content,
+    diff_content,
+    load_revision,
+)
+from .site_builder import get_site_builder
+from .site_minify import optimize_html_document
 
 
 class ProjectViewSet(viewsets.ModelViewSet):
@@ -34,6 +53,7 @@ class ProjectViewSet(viewsets.ModelViewSet):
     """
     queryset = Project.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = ProjectCursorPagination
     
     def get_serializer_class(self):
         """Выбор сериализатора в зависимости от действия"""
@@ -49,7 +69,9 @@ class ProjectViewSet(viewsets.ModelViewSet):
         
         if self.request.user.is_authenticated:
             if self.action == 'list':
-                queryset = queryset.filter(user=self.request.user)
+                queryset = queryset.filter(user=self.request.user).for_list()
+            elif self.action not in ('destroy', 'content', 'revisions', 'revision_restore'):
+                queryset = queryset.with_content()
         else:
             # Неавторизованные пользователи не могут видеть проекты
             queryset = queryset.none()
@@ -104,46 +126,49 @@ class ProjectViewSet(viewsets.ModelViewSet):
                     'slug': f'Проект с URL-адресом "{slug}" уже существует. Пожалуйста, выберите другой URL-адрес.'
                 })
             raise
+        create_revision(serializer.instance.site_content, 'save', self.request.user)
+    
+    def perform_update(self, serializer):
+        """Сохранение проекта: изменённое содержимое попадает в историю как автосохранение (редактор сохраняет часто)"""
+        project = serializer.save()
+        if set(serializer.validated_data) & set(ProjectContent.FIELDS):
+            autosave_revision(project.site_content, self.request.user)
     
     def get_permissions(self):
         """Права доступа в зависимости от действия"""
         if self.action in ['list', 'retrieve', 'preview', 'export']:
             # Просмотр требует авторизации
             return [IsAuthenticated()]
-        elif self.action in ['create', 'update', 'partial_update', 'destroy', 'duplicate']:
+        elif self.action in ['create', 'update', 'partial_update', 'destroy', 'duplicate', 'content']:
             # Изменение требует авторизации
             return [IsAuthenticated()]
         return super().get_permissions()
     
+    def perform_content_negotiation(self, request, force=False):
+        """В export параметр ?format= выбирает формат файла, а не рендерер DRF (иначе html и zip дают 404)"""
+        return super().perform_content_negotiation(request, force=force or self.action == 'export')
+    
     @action(detail=True, methods=['get'], url_path='preview')
     def preview(self, request, pk=None):
         """
         Получить HTML для предпросмотра проекта
         """
         project = self.get_object()
+        artifact = get_site_builder().build(project)
+        etag = f'"{artifact.key}"'
+        if request.headers.get('If-None-Match') == etag:
+            return HttpResponseNotModified(headers={'ETag': etag})
         
-        html = f"""<!DOCTYPE html>
-<html lang="ru">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{project.title}</title>
-    <style>
-        {project.css_content}
-    </style>
-</head>
-<body>
-    {project.html_content}
-</body>
-</html>"""
-        
-        return HttpResponse(html, content_type='text/html; charset=utf-8')
+        response = HttpResponse(artifact.document(), content_type='text/html; charset=utf-8')
+        response['ETag'] = etag
+        return response
     
     @action(detail=True, methods=['get'], url_path='export')
     def export(self, request, pk=None):
         """
-        Экспорт проекта в HTML или JSON файл
-        Параметры: ?format=html или ?format=json
+        Экспорт проекта в HTML, JSON или ZIP (index.html + styles.css, как при деплое)
+        Параметры: ?format=html, ?format=json или ?format=zip;
+        ?optimize=1 - минифицировать HTML и удалить неиспользуемые CSS правила (размеры в заголовках X-Size-*)
         """
         project = self.get_object()
         format_type = request.query_params.get('format', 'html')
@@ -164,26 +189,76 @@ class ProjectViewSet(viewsets.ModelViewSet):
             response = JsonResponse(data, json_dumps_params={'ensure_ascii': False, 'indent': 2})
             response['Content-Disposition'] = f'attachment; filename="{project.slug}.json"'
             return response
+        elif format_type == 'zip':
+            artifact = get_site_builder().build(project)
+            return FileResponse(
+                open(artifact.zip_path, 'rb'),
+                as_attachment=True,
+                filename=f"{project.slug}.zip",
+                content_type='application/zip'
+            )
         else:
-            html = f"""<!DOCTYPE html>
-<html lang="ru">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{project.title}</title>
-    <style>
-        {project.css_content}
-    </style>
-</head>
-<body>
-    {project.html_content}
-</body>
-</html>"""
+            html = get_site_builder().build(project).document()
             
+            stats = None
+            if request.query_params.get('optimize') in ('1', 'true'):
+                html, stats = optimize_html_document(html)
+
             response = HttpResponse(html, content_type='text/html; charset=utf-8')
             response['Content-Disposition'] = f'attachment; filename="{project.slug}.html"'
+            if stats:
+                response['X-Size-Before'] = stats['bytes_before']
+                response['X-Size-After'] = stats['bytes_after']
+                response['X-Css-Rules-Removed'] = stats['rules_removed']
             return response
     
+    @action(detail=True, methods=['patch'], url_path='content')
+    def content(self, request, pk=None):
+        """
+        Частичное сохранение содержимого (автосохранение редактора): JSON Patch (RFC 6902) для json_content
+        и фрагменты текста для html_content/css_content относительно base_revision.
+        409 с текущей ревизией, если содержимое уже изменено другим сохранением
+        """
+        project = self.get_object()
+        serializer = ProjectContentPatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {'error': 'Ошибка валидации', 'details': serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        data = serializer.validated_data
+        
+        with transaction.atomic():
+            content, _ = ProjectContent.objects.select_for_update().get_or_create(project=project)
+            if content.revision != data['base_revision']:
+                return Response(
+                    {'error': 'Содержимое уже изменено другим сохранением', 'revision': content.revision},
+                    status=status.HTTP_409_CONFLICT
+                )
+            
+            changed = []
+            try:
+                if data.get('json_patch'):
+                    content.json_content = apply_json_patch(content.json_content, data['json_patch'])
+                    changed.append('json_content')
+                if data.get('html'):
+                    content.html_content = apply_text_splices(content.html_content, data['html'])
+                    changed.append('html_content')
+                if data.get('css'):
+                    content.css_content = apply_text_splices(content.css_content, data['css'])
+                    changed.append('css_content')
+            except PatchError as e:
+                return Response(
+                    {'error': str(e), 'revision': content.revision},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            content.save(update_fields=changed)
+            autosave_revision(content, request.user)
+            Project.objects.filter(pk=project.pk).update(updated_at=timezone.now())
+        
+        return Response({'revision': content.revision})
+    
     @action(detail=True, methods=['post'], url_path='duplicate', permission_classes=[IsAuthenticated])
     def duplicate(self, request, pk=None):
         """
@@ -214,10 +289,174 @@ class ProjectViewSet(viewsets.ModelViewSet):
             header_settings=original_project.header_settings,
             footer_settings=original_project.footer_settings,
         )
+        # Ревизия копии ссылается на те же фрагменты, что и ревизии исходного проекта
+        create_revision(new_project.site_content, 'save', request.user)
         
         serializer = self.get_serializer(new_project)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
+    @action(detail=True, methods=['get', 'post'], url_path='revisions', permission_classes=[IsAuthenticated])
+    def revisions(self, request, pk=None):
+        """
+        История содержимого проекта, от новых ревизий к старым.
+        POST сохраняет ревизию текущего содержимого; ревизии с названием (label) не удаляются политикой хранения
+        """
+        project = self.get_object()
+        if request.method == 'POST':
+            serializer = ProjectRevisionSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            revision = create_revision(
+                project.site_content,
+                'manual',
+                request.user,
+                label=serializer.validated_data.get('label', '')
+            )
+            return Response(ProjectRevisionSerializer(revision).data, status=status.HTTP_201_CREATED)
+        
+        revisions = project.revisions.select_related('author')
+        return Response(ProjectRevisionSerializer(revisions, many=True).data)
+    
+    def _get_revision(self, project, revision_id):
+        return get_object_or_404(ProjectRevision, project=project, pk=revision_id)
+    
+    @action(detail=True, methods=['get'], url_path=r'revisions/(?P<revision_id>\d+)',
+            permission_classes=[IsAuthenticated])
+    def revision_detail(self, request, pk=None, revision_id=None):
+        """
+        Содержимое ревизии
+        """
+        project = self.get_object()
+        revision = self._get_revision(project, revision_id)
+        try:
+            data = load_revision(revision)
+        except RevisionDamaged as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({**ProjectRevisionSerializer(revision).data, **data})
+    
+    @action(detail=True, methods=['get'], url_path=r'revisions/(?P<revision_id>\d+)/diff',
+            permission_classes=[IsAuthenticated])
+    def revision_diff(self, request, pk=None, revision_id=None):
+        """
+        Изменения от ревизии до ревизии ?to=<id> (по умолчанию - до текущего содержимого): фрагменты текста
+        для html_content/css_content и JSON Patch для JSON полей, как в PATCH content/
+        """
+        project = self.get_object()
+        source = self._get_revision(project, revision_id)
+        target_id = request.query_params.get('to')
+        try:
+            if target_id is None:
+                target = current_content(project.site_content)
+            elif target_id.isdigit():
+                target = load_revision(self._get_revision(project, target_id))
+            else:
+                return Response({'error': 'Параметр to должен быть ID ревизии'}, status=status.HTTP_400_BAD_REQUEST)
+            changes = diff_content(load_revision(source), target)
+        except RevisionDamaged as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        
+        return Response({
+            'from': source.id,
+            'to': int(target_id) if target_id else None,
+            'changes': changes,
+        })
+    
+    @action(detail=True, methods=['post'], url_path=r'revisions/(?P<revision_id>\d+)/restore',
+            permission_classes=[IsAuthenticated])
+    def revision_restore(self, request, pk=None, revision_id=None):
+        """
+        Восстановить содержимое ревизии. Текущее содержимое остаётся в истории, восстановление - новая ревизия
+        """
+        project = self.get_object()
+        revision = self._get_revision(project, revision_id)
+        try:
+            data = load_revision(revision)
+        except RevisionDamaged as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        
+        with transaction.atomic():
+            content, _ = ProjectContent.objects.select_for_update().get_or_create(project=project)
+            create_revision(content, 'save', request.user)
+            for field, value in data.items():
+                setattr(content, field, value)
+            content.save(update_fields=list(data))
+            restored = create_revision(content, 'restore', request.user)
+            Project.objects.filter(pk=project.pk).update(updated_at=timezone.now())
+        
+        return Response({
+            'revision': content.revision,
+            'restored_from': revision.id,
+            'history': ProjectRevisionSerializer(restored).data,
+        })
+    
+    def _get_deploy_manifest(self, project):
+        """Последняя цель деплоя проекта на VPS (путь на сервере с релизами)"""
+        return DeployManifest.objects.filter(project=project).exclude(current_release='').first()
+    
+    @action(detail=True, methods=['get'], url_path='releases', permission_classes=[IsAuthenticated])
+    def releases(self, request, pk=None):
+        """
+        Релизы последнего VPS деплоя проекта, от новых к старым
+        """
+        project = self.get_object()
+        deploy_manifest = self._get_deploy_manifest(project)
+        if not deploy_manifest:
+            return Response({'target': None, 'current_release': None, 'releases': []})
+        
+        releases = deploy_manifest.releases.select_related('manifest')
+        return Response({
+            'target': deploy_manifest.target,
+            'current_release': deploy_manifest.current_release,
+            'releases': DeployReleaseSerializer(releases, many=True).data,
+        })
+    
+    @action(detail=True, methods=['post'], url_path='rollback', permission_classes=[IsAuthenticated])
+    def rollback(self, request, pk=None):
+        """
+        Откат сайта на сервере на один из сохранённых релизов без повторной загрузки файлов
+        Параметры: release_id (по умолчанию - предыдущий релиз), password (для своего VPS)
+        """
+        from .deploy_queue import rollback_to_release
+        
+        project = self.get_object()
+        serializer = RollbackSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        deploy_manifest = self._get_deploy_manifest(project)
+        if not deploy_manifest:
+            return Response(
+                {'success': False, 'message': 'Проект не деплоился на VPS'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        release_id = serializer.validated_data.get('release_id')
+        releases = deploy_manifest.releases.all()
+        if release_id:
+            release = releases.filter(release_id=release_id).first()
+        else:
+            release = releases.filter(release_id__lt=deploy_manifest.current_release).first()
+        if not release:
+            return Response(
+                {'success': False, 'message': 'Релиз для отката не найден'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        try:
+            success, message = rollback_to_release(
+                deploy_manifest,
+                release,
+                password=serializer.validated_data.get('password')
+            )
+        except ValidationError as e:
+            return Response(
+                {'success': False, 'message': ' '.join(e.messages)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(
+            {'success': success, 'message': message, 'current_release': deploy_manifest.current_release},
+            status=status.HTTP_200_OK if success else status.HTTP_502_BAD_GATEWAY
+        )
+    
 
 
 # Views для авторизации
@@ -254,10 +493,12 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def user_projects(request):
-    """Получить все проекты текущего пользователя"""
-    projects = Project.objects.filter(user=request.user)
-    serializer = ProjectListSerializer(projects, many=True)
-    return Response(serializer.data)
+    """Проекты текущего пользователя постранично (курсор в ?cursor=)"""
+    projects = Project.objects.filter(user=request.user).for_list()
+    paginator = ProjectCursorPagination()
+    page = paginator.paginate_queryset(projects, request)
+    serializer = ProjectListSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
 
 
 @api_view(['GET', 'POST'])
@@ -289,22 +530,22 @@ def subscription_view(request):
 @permission_classes([IsAuthenticated])
 def deploy_view(request):
     """
-    Деплой сайта на VPS (свой сервер или сервер конструктора)
+    Постановка деплоя сайта на VPS (свой сервер или сервер конструктора) в очередь
     
     Принимает:
     - deploy_type: 'vps' или 'builder_vps'
-    - site_zip: ZIP архив с index.html
+    - site_zip: ZIP архив с index.html (если не передан - сайт собирается на сервере из проекта project_id)
     - Для VPS (свой сервер): host, port, username, password, deploy_path, domain, email, nginx_config, enable_ssl
     - Для builder_vps: параметры берутся из настроек VPS сервера в админке
     - project_id: ID проекта (опционально)
     
-    Возвращает:
+    Возвращает (202 Accepted):
     - success: bool
-    - message: str
-    - url: str (если успешно)
+    - job_id: int
+    - status: str
+    - status_url: str (GET /api/deploy/jobs/{job_id}/ для отслеживания этапов)
     """
-    import os
-    import tempfile
+    from .deploy_queue import enqueue_deploy
     
     # DRF автоматически обрабатывает multipart/form-data
     # request.data уже содержит и обычные поля, и файлы
@@ -316,319 +557,51 @@ def deploy_view(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    validated_data = serializer.validated_data
-    deploy_type = validated_data.get('deploy_type', 'vps')
-    
-    temp_files = []
-    ssh_client = None
-    
     try:
-        zip_file = validated_data['site_zip']
-        temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix='.zip')
-        temp_files.append(temp_zip.name)
-        
-        for chunk in zip_file.chunks():
-            temp_zip.write(chunk)
-        temp_zip.close()
-        
-        project_id = validated_data.get('project_id')
-        project = None
-        if project_id:
-            try:
-                project = Project.objects.get(id=project_id, user=request.user)
-            except Project.DoesNotExist:
-                pass
-        
-        elif deploy_type == 'builder_vps':
-            # Деплой на VPS сервер конструктора: получаем настройки из админки, подключаемся, деплоим файлы, настраиваем SSL/Nginx
-            from .models import VPSServer
-            from .deploy_utils import (
-                create_ssh_client,
-                deploy_files,
-                deploy_nginx_config,
-                obtain_ssl_certificate
-            )
-            
-            vps_server = VPSServer.objects.filter(is_active=True).order_by('-is_default', 'id').first()
-            
-            if not vps_server:
-                return Response(
-                    {'success': False, 'message': 'Не найден активный VPS сервер в настройках. Настройте сервер в админ-панели.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            if project:
-                deploy_path = f"{vps_server.deploy_path}/{project.slug or f'project-{project.id}'}"
-            else:
-                deploy_path = f"{vps_server.deploy_path}/project-{request.user.id}-{int(timezone.now().timestamp())}"
-            
-            ssh_client = create_ssh_client(
-                host=vps_server.host,
-                port=vps_server.port,
-                username=vps_server.username,
-                password=vps_server.password,
-                timeout=10
-            )
-            
-            success, message = deploy_files(
-                ssh=ssh_client,
-                zip_path=temp_zip.name,
-                deploy_path=deploy_path,
-                username=vps_server.username,
-                timeout=30
-            )
-            
-            if not success:
-                ssh_client.close()
-                return Response(
-                    {'success': False, 'message': message},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-            
-            ssl_success = True
-            ssl_message = ""
-            enable_ssl = vps_server.ssl_enabled
-            if enable_ssl and vps_server.domain and vps_server.email:
-                ssl_success, ssl_message = obtain_ssl_certificate(
-                    ssh=ssh_client,
-                    domain=vps_server.domain,
-                    email=vps_server.email,
-                    timeout=120
-                )
-            
-            nginx_success = True
-            nginx_message = ""
-            if vps_server.nginx_config_enabled:
-                domain = vps_server.domain or vps_server.host
-                use_ssl = enable_ssl and ssl_success
-                nginx_success, nginx_message = deploy_nginx_config(
-                    ssh=ssh_client,
-                    domain=domain,
-                    deploy_path=deploy_path,
-                    username=vps_server.username,
-                    use_ssl=use_ssl,
-                    timeout=30
-                )
-            
-            protocol = 'https' if (enable_ssl and ssl_success) else 'http'
-            if vps_server.domain:
-                url = f"{protocol}://{vps_server.domain}"
-            else:
-                url = f"{protocol}://{vps_server.host}"
-            
-            ssh_client.close()
-            
-            if project:
-                project.deploy_type = 'builder_vps'
-                project.deployed_url = url
-                project.deployed_at = timezone.now()
-                project.save(update_fields=['deploy_type', 'deployed_url', 'deployed_at'])
-                print(f"✅ Проект {project_id} задеплоен на VPS сервер конструктора: {url}")
-            
-            final_message = f"✅ Сайт успешно задеплоен на VPS сервер конструктора ({vps_server.name})"
-            if nginx_success:
-                final_message += f"\n\n✅ Nginx настроен. Сайт доступен по адресу: {url}"
-            else:
-                final_message += f"\n\n⚠️ {nginx_message}"
-            
-            response_data = {
-                'success': True,
-                'message': final_message,
-                'url': url,
-                'deploy_type': 'builder_vps',
-                'vps_server': vps_server.name
-            }
-            
-            return Response(response_data, status=status.HTTP_200_OK)
-        
-        else:
-            # Деплой на свой VPS: подключаемся, загружаем файлы, настраиваем SSL/Nginx, сохраняем информацию о деплое
-            from .deploy_utils import (
-                create_ssh_client,
-                deploy_files,
-                deploy_nginx_config,
-                obtain_ssl_certificate
-            )
-            
-            ssh_client = create_ssh_client(
-                host=validated_data['host'],
-                port=validated_data.get('port', 22),
-                username=validated_data['username'],
-                password=validated_data['password'],
-                timeout=10
-            )
-            
-            success, message = deploy_files(
-                ssh=ssh_client,
-                zip_path=temp_zip.name,
-                deploy_path=validated_data['deploy_path'],
-                username=validated_data['username'],
-                timeout=30
-            )
-            
-            if not success:
-                return Response(
-                    {'success': False, 'message': message},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-            
-            ssl_success = True
-            ssl_message = ""
-            enable_ssl = validated_data.get('enable_ssl', False)
-            if enable_ssl:
-                domain_for_ssl = validated_data.get('domain')
-                email = validated_data.get('email')
-                if domain_for_ssl and email:
-                    ssl_success, ssl_message = obtain_ssl_certificate(
-                        ssh=ssh_client,
-                        domain=domain_for_ssl,
-                        email=email,
-                        timeout=120
-                    )
-            
-            nginx_success = True
-            nginx_message = ""
-            if validated_data.get('nginx_config', False):
-                domain = validated_data.get('domain') or validated_data['host']
-                use_ssl = enable_ssl and ssl_success
-                nginx_success, nginx_message = deploy_nginx_config(
-                    ssh=ssh_client,
-                    domain=domain,
-                    deploy_path=validated_data['deploy_path'],
-                    username=validated_data['username'],
-                    use_ssl=use_ssl,
-                    timeout=30
-                )
-            
-            domain = validated_data.get('domain')
-            protocol = 'https' if (enable_ssl and ssl_success) else 'http'
-            if domain:
-                url = f"{protocol}://{domain}"
-            else:
-                url = f"{protocol}://{validated_data['host']}"
-            
-            final_message = message
-            
-            if enable_ssl:
-                if ssl_success:
-                    final_message += f"\n\n✅ {ssl_message}"
-                else:
-                    final_message += f"\n\n⚠️ SSL сертификат не получен: {ssl_message}"
-            
-            if not validated_data.get('nginx_config', False):
-                final_message += f"\n\n⚠️ Внимание: Nginx не настроен. Файлы загружены в {validated_data['deploy_path']}, но сайт не будет доступен без веб-сервера.\n\nДля запуска сайта:\n1. Настройте Nginx или другой веб-сервер\n2. Или используйте простой HTTP-сервер: cd {validated_data['deploy_path']} && python3 -m http.server 8000"
-            elif not nginx_success:
-                final_message += f"\n\n⚠️ Nginx конфиг создан, но не применён: {nginx_message}\n\nПроверьте:\n1. Запущен ли Nginx: sudo systemctl status nginx\n2. Проверьте конфиг: sudo nginx -t\n3. Перезагрузите Nginx: sudo systemctl reload nginx\n4. Проверьте логи: sudo tail -f /var/log/nginx/error.log"
-            else:
-                final_message += f"\n\n✅ Nginx настроен и перезагружен. Сайт должен быть доступен по адресу: {url}\n\nЕсли сайт не открывается, проверьте:\n1. Открыт ли порт 80 (или 443 для HTTPS) в firewall\n2. Правильно ли указан домен/IP в Nginx конфиге\n3. Логи Nginx: sudo tail -f /var/log/nginx/error.log"
-            
-            if project_id:
-                try:
-                    project = Project.objects.get(id=project_id, user=request.user)
-                    project.deploy_type = 'vps'
-                    project.deployed_url = url
-                    project.deployed_at = timezone.now()
-                    project.save(update_fields=['deploy_type', 'deployed_url', 'deployed_at'])
-                    print(f"✅ Информация о деплое сохранена для проекта {project_id}: {url}")
-                except Project.DoesNotExist:
-                    print(f"⚠️ Проект {project_id} не найден для пользователя {request.user.username}")
-                except Exception as e:
-                    print(f"❌ Ошибка при сохранении информации о деплое: {str(e)}")
-            else:
-                print("⚠️ project_id не указан, информация о деплое не будет сохранена")
-            
-            response_data = {
-                'success': True,
-                'message': final_message,
-                'url': url,
-                'deploy_path': validated_data['deploy_path'],
-                'deploy_type': 'vps'
-            }
-            
-            if enable_ssl:
-                response_data['ssl'] = {
-                    'success': ssl_success,
-                    'message': ssl_message
-                }
-            
-            if validated_data.get('nginx_config', False):
-                response_data['nginx'] = {
-                    'success': nginx_success,
-                    'message': nginx_message
-                }
-            
-            return Response(response_data, status=status.HTTP_200_OK)
-        
+        job = enqueue_deploy(request.user, serializer.validated_data)
     except ValidationError as e:
         return Response(
-            {'success': False, 'message': str(e)},
+            {'success': False, 'message': ' '.join(e.messages)},
             status=status.HTTP_400_BAD_REQUEST
         )
     except Exception as e:
         return Response(
-            {'success': False, 'message': f'Ошибка деплоя: {str(e)}'},
+            {'success': False, 'message': f'Ошибка постановки деплоя в очередь: {str(e)}'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
-    finally:
-        if ssh_client:
-            try:
-                ssh_client.close()
-            except:
-                pass
-        
-        for temp_file in temp_files:
-            try:
-                if os.path.exists(temp_file):
-                    os.unlink(temp_file)
-            except:
-                pass
+    
+    return Response({
+        'success': True,
+        'message': 'Деплой поставлен в очередь',
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': request.build_absolute_uri(reverse('deploy_job_status', args=[job.id])),
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def deploy_job_status(request, job_id: int):
+    """Статус задачи деплоя с информацией по каждому этапу"""
+    job = get_object_or_404(DeployJob, id=job_id, user=request.user)
+    return Response(DeployJobSerializer(job).data)
 
 
-@require_http_methods(["GET"])
+@require_http_methods(["GET", "HEAD"])
 def serve_deployed_site(request, subdomain: str, path: str = ""):
-    """Обслуживает статические файлы задеплоенного сайта с проверкой безопасности пути и определением MIME типов"""
-    from django.conf import settings
-    from .subdomain_utils import get_deploy_path
+    """Обслуживает статические файлы задеплоенного сайта: проверка пути, ETag/304, Range/206, Cache-Control"""
+    from .site_serving import serve_site_file
     
-    try:
-        deploy_path = get_deploy_path(subdomain)
-        
-        if not path or path == "":
-            file_path = deploy_path / "index.html"
-        else:
-            file_path = deploy_path / path
-        
-        try:
-            file_path.resolve().relative_to(deploy_path.resolve())
-        except ValueError:
-            raise Http404("Недопустимый путь")
-        
-        if not file_path.exists() or not file_path.is_file():
-            raise Http404("Файл не найден")
-        
-        content_type = "text/html"
-        if file_path.suffix == ".css":
-            content_type = "text/css"
-        elif file_path.suffix in [".jpg", ".jpeg"]:
-            content_type = "image/jpeg"
-        elif file_path.suffix == ".png":
-            content_type = "image/png"
-        elif file_path.suffix == ".gif":
-            content_type = "image/gif"
-        elif file_path.suffix == ".svg":
-            content_type = "image/svg+xml"
-        elif file_path.suffix == ".ico":
-            content_type = "image/x-icon"
-        elif file_path.suffix == ".js":
-            content_type = "application/javascript"
-        
-        file_handle = open(file_path, "rb")
-        response = FileResponse(file_handle, content_type=content_type)
-        response['Content-Length'] = file_path.stat().st_size
-        return response
-        
-    except Exception as e:
-        raise Http404(f"Ошибка при загрузке файла: {str(e)}")
+    return serve_site_file(request, subdomain, path)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def deployed_cache_stats(request):
+    """Счётчики кеша файлов задеплоенных сайтов текущего воркера (у каждого процесса gunicorn свой кеш)"""
+    from .site_serving import get_file_cache
+
+    return Response(get_file_cache().stats())
 
 
 class CustomBlockViewSet(viewsets.ModelViewSet):
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.SubdomainSiteMiddleware',  # Сайты на поддоменах отдаются до остальных middleware
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -139,6 +140,56 @@ MEDIA_ROOT = BASE_DIR / 'media'
 DEPLOY_BASE_DOMAIN = os.getenv('DEPLOY_BASE_DOMAIN', 'localhost:8000')  # Базовый домен для поддоменов
 DEPLOY_STATIC_ROOT = BASE_DIR / 'deployed_sites'  # Директория для хранения задеплоенных сайтов
 DEPLOY_STATIC_URL = '/deployed/'  # URL префикс для доступа к задеплоенным сайтам
+# Сайты по адресу <поддомен>.DEPLOY_BASE_DOMAIN (нужна wildcard DNS запись); иначе - /api/deployed/<поддомен>/
+DEPLOY_SUBDOMAIN_HOSTING = os.getenv('DEPLOY_SUBDOMAIN_HOSTING', 'False') == 'True'
+DEPLOY_RESERVED_SUBDOMAINS = ('www', 'api', 'admin', 'static', 'media', 'deploy', 'app', 'mail', 'ftp', 'localhost')
+# Отдача файлов задеплоенных сайтов: '' - потоком из Python (runserver), 'nginx' - X-Accel-Redirect,
+# 'sendfile' - X-Sendfile (Apache mod_xsendfile, lighttpd). Путь проверяет Django, байты отдаёт прокси
+DEPLOY_STATIC_SENDFILE = os.getenv('DEPLOY_STATIC_SENDFILE', '')
+DEPLOY_STATIC_ACCEL_PREFIX = os.getenv('DEPLOY_STATIC_ACCEL_PREFIX', '/_deployed_sites/')  # internal location Nginx с alias на DEPLOY_STATIC_ROOT
+# LRU кеш небольших файлов сайтов в памяти каждого воркера
+DEPLOY_STATIC_CACHE_MAX_BYTES = int(os.getenv('DEPLOY_STATIC_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))  # 0 - без кеша
+DEPLOY_STATIC_CACHE_MAX_FILE_SIZE = int(os.getenv('DEPLOY_STATIC_CACHE_MAX_FILE_SIZE', str(512 * 1024)))
+DEPLOY_STATIC_CACHE_NEGATIVE_TTL = float(os.getenv('DEPLOY_STATIC_CACHE_NEGATIVE_TTL', '5'))  # Секунд хранить 404
+DEPLOY_STATIC_CACHE_REVALIDATE_INTERVAL = float(os.getenv('DEPLOY_STATIC_CACHE_REVALIDATE_INTERVAL', '1'))  # Секунд между проверками mtime
+# Просмотры сайтов копятся в памяти воркера и записываются в Project.views_count раз в интервал (секунд)
+SITE_VIEWS_FLUSH_INTERVAL = float(os.getenv('SITE_VIEWS_FLUSH_INTERVAL', '10'))
+# Сжатие содержимого проектов в БД (api.fields): zlib, zstd (нужен пакет zstandard на всех серверах) или none
+PROJECT_CONTENT_COMPRESSION = os.getenv('PROJECT_CONTENT_COMPRESSION', 'zlib')
+# История содержимого проектов (api.revisions): последние ревизии и срок хранения остальных (по часу/дню)
+PROJECT_REVISION_KEEP_LAST = int(os.getenv('PROJECT_REVISION_KEEP_LAST', '20'))
+PROJECT_REVISION_KEEP_DAYS = int(os.getenv('PROJECT_REVISION_KEEP_DAYS', '30'))
+PROJECT_REVISION_AUTOSAVE_INTERVAL = int(os.getenv('PROJECT_REVISION_AUTOSAVE_INTERVAL', '300'))  # Секунд между ревизиями автосохранений
+
+# Очередь деплоя (python manage.py run_deploy_worker)
+DEPLOY_JOBS_ROOT = BASE_DIR / 'deploy_jobs'  # Архивы сайтов, ожидающие обработки воркером
+DEPLOY_WORKER_CONCURRENCY = int(os.getenv('DEPLOY_WORKER_CONCURRENCY', '4'))
+DEPLOY_JOB_STALE_TIMEOUT = int(os.getenv('DEPLOY_JOB_STALE_TIMEOUT', '600'))  # Секунд без активности до повторного запуска
+DEPLOY_JOB_MAX_ATTEMPTS = int(os.getenv('DEPLOY_JOB_MAX_ATTEMPTS', '2'))
+DEPLOY_KEEP_RELEASES = int(os.getenv('DEPLOY_KEEP_RELEASES', '5'))  # Релизов на сервере для мгновенного отката
+
+# Сборка сайта перед загрузкой (api.site_build)
+SITE_BUILD_CACHE_ROOT = BASE_DIR / 'build_cache'  # Кеш результатов сборки по хешу входных данных
+SITE_BUILD_CACHE_MAX_BYTES = int(os.getenv('SITE_BUILD_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))  # Собранные сайты (0 - без ограничения)
+SITE_PRECOMPRESS_MIN_SIZE = int(os.getenv('SITE_PRECOMPRESS_MIN_SIZE', '1024'))  # Меньшие файлы не сжимаются заранее
+SITE_INLINE_IMAGE_MAX_SIZE = int(os.getenv('SITE_INLINE_IMAGE_MAX_SIZE', '2048'))  # Меньшие data URI изображения остаются в HTML/CSS
+SITE_IMAGE_MAX_WIDTH = int(os.getenv('SITE_IMAGE_MAX_WIDTH', '1920'))  # Более широкие изображения уменьшаются
+SITE_IMAGE_JPEG_QUALITY = int(os.getenv('SITE_IMAGE_JPEG_QUALITY', '82'))
+SITE_IMAGE_WEBP_QUALITY = int(os.getenv('SITE_IMAGE_WEBP_QUALITY', '80'))
+SITE_IMAGE_SRCSET_WIDTHS = (480, 960, 1440)  # Ширины WebP вариантов для srcset (меньше ширины изображения)
+SITE_IMAGE_WORKERS = int(os.getenv('SITE_IMAGE_WORKERS', '0'))  # Процессов для обработки изображений (0 - по числу CPU)
+SITE_IMAGE_CACHE_MAX_BYTES = int(os.getenv('SITE_IMAGE_CACHE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))  # Оптимизированные изображения (0 - без ограничения)
+# Классы, которые добавляются скриптами во время работы страницы и не удаляются из CSS (шаблоны fnmatch)
+SITE_CSS_PURGE_WHITELIST = [
+    'active', 'open', 'opened', 'show', 'shown', 'visible', 'hidden', 'disabled', 'selected', 'collapsed',
+    'fixed', 'sticky', 'scrolled', 'loaded', 'is-*', 'has-*', 'js-*', 'gjs-*',
+]
+
+# Пул SSH подключений к VPS (api.ssh_pool)
+SSH_POOL_MAX_CHANNELS_PER_SERVER = int(os.getenv('SSH_POOL_MAX_CHANNELS_PER_SERVER', '8'))  # Одновременных аренд на сервер
+SSH_POOL_SESSIONS_PER_CONNECTION = int(os.getenv('SSH_POOL_SESSIONS_PER_CONNECTION', '4'))  # Меньше MaxSessions sshd (10)
+SSH_POOL_IDLE_TIMEOUT = int(os.getenv('SSH_POOL_IDLE_TIMEOUT', '300'))  # Секунд простоя до закрытия подключения
+SSH_POOL_KEEPALIVE_INTERVAL = int(os.getenv('SSH_POOL_KEEPALIVE_INTERVAL', '30'))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
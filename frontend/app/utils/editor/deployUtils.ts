@@ -321,6 +321,28 @@ export interface DeployParams {
   projectId?: number | null;
 }
 
+export interface DeployJobStatus {
+  id: number;
+  status: 'queued' | 'running' | 'success' | 'failed';
+  stage: string;
+  stages: Array<{ name: string; title: string; status: string; message: string }>;
+  message: string;
+  result: { url?: string; [key: string]: unknown };
+}
+
+const DEPLOY_POLL_INTERVAL_MS = 2000;
+
+async function waitForDeployJob(jobId: number, apiClient: any): Promise<DeployJobStatus> {
+  // Деплой выполняется воркером в фоне, опрашиваем статус задачи до завершения
+  for (;;) {
+    const job = await apiClient.get(`/deploy/jobs/${jobId}/`) as DeployJobStatus;
+    if (job.status === 'success' || job.status === 'failed') {
+      return job;
+    }
+    await new Promise((resolve) => setTimeout(resolve, DEPLOY_POLL_INTERVAL_MS));
+  }
+}
+
 export async function deployToVPS(
   editor: any,
   params: DeployParams,
@@ -372,20 +394,19 @@ export async function deployToVPS(
       formData.append('project_id', params.projectId.toString());
     }
     
-    const response = await apiClient.post('/deploy/', formData) as {
+    const queued = await apiClient.post('/deploy/', formData) as {
       success: boolean;
       message: string;
-      url?: string;
-      nginx?: {
-        success: boolean;
-        message: string;
-      };
+      job_id: number;
+      status: DeployJobStatus['status'];
     };
     
+    const job = await waitForDeployJob(queued.job_id, apiClient);
+    
     return {
-      success: response.success,
-      message: response.message,
-      url: response.url,
+      success: job.status === 'success',
+      message: job.message,
+      url: job.result?.url,
     };
   } catch (error: any) {
     const message = (error as any).detail?.message || (error as any).message || 'Ошибка деплоя';